@@ -0,0 +1,87 @@
+import os
+import time
+import asyncio
+import logging
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+from storage import get_storage_backend
+from metrics import metrics
+
+load_dotenv()
+
+# Database calls in flight at once per AsyncDatabaseManager (= open connections when they are reused)
+ASYNC_DB_MAX_WORKERS = int(os.getenv("ASYNC_DB_MAX_WORKERS", "8"))
+
+
+class AsyncDatabaseManager:
+    """
+    Asyncio counterpart of DatabaseManager with the same methods, awaited.
+
+    pyodbc is blocking, so every call runs on a dedicated, bounded thread pool
+    instead of the event loop; each pool thread keeps its own open connection
+    (reuse_connections), which makes the pool a fixed-size connection pool.
+    An event loop interleaving many documents keeps running its LLM and OCR
+    awaits while database round trips are in flight. A call that fails drops
+    its thread's connection so the next call reconnects.
+
+    The pool is separate from asyncio's default executor: OCR and other
+    asyncio.to_thread work cannot starve database calls, and vice versa.
+    Time spent waiting for a free pool thread is recorded as
+    async_db_queue_seconds{method} (a sustained value means the pool is too small).
+
+    Usage:
+        db = AsyncDatabaseManager()
+        document = await db.fetch_and_lock_next_document(worker_id=worker_id)
+        await db.update_document_master_by_id(document['DocumentID'], extraction_status='Completed')
+        db.close()
+    """
+
+    def __init__(self, backend=None, max_workers=None):
+        """
+        Args:
+            backend (StorageBackend, optional): Synchronous backend to run. Defaults to
+                get_storage_backend() with one reused connection per pool thread
+            max_workers (int, optional): Pool size. Defaults to ASYNC_DB_MAX_WORKERS
+        """
+        self.backend = backend if backend is not None else get_storage_backend(reuse_connections=True)
+        self.max_workers = max_workers or ASYNC_DB_MAX_WORKERS
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="async-db")
+
+    def _call(self, method, submitted, *args, **kwargs):
+        # Runs on a pool thread
+        metrics.observe("async_db_queue_seconds", time.perf_counter() - submitted, method=method)
+        try:
+            return getattr(self.backend, method)(*args, **kwargs)
+        except Exception:
+            reset = getattr(self.backend, "reset_connection", None)
+            if reset:
+                reset()
+            raise
+
+    async def run(self, method, *args, **kwargs):
+        """Await backend.<method>(*args, **kwargs) on the database pool"""
+        loop = asyncio.get_running_loop()
+        call = functools.partial(self._call, method, time.perf_counter(), *args, **kwargs)
+        # run_in_executor does not carry context variables over; the request deadline must follow the call
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._executor, context.run, call)
+
+    def __getattr__(self, name):
+        # Every public backend method becomes an awaitable with the same name and arguments
+        backend = self.__dict__.get("backend")
+        if name.startswith("_") or not callable(getattr(backend, name, None)):
+            raise AttributeError(name)
+        return functools.partial(self.run, name)
+
+    def close(self):
+        """Finish queued calls, stop the pool and close its connections"""
+        self._executor.shutdown(wait=True)
+        close = getattr(self.backend, "close_connections", None)
+        if close:
+            try:
+                close()
+            except Exception as e:
+                logging.warning(f"Closing database connections failed: {str(e)}")
@@ -0,0 +1,88 @@
+"""
+Extraction latency against prompt size.
+
+Runs the same document and schema through call_extraction_agent with
+prompt templates of increasing length (the default template padded with
+distinct extraction rules, as long improvement histories produce), and
+reports prompt tokens and latency per size. The last column shows what
+compaction leaves of each template when the padding repeats earlier rules.
+
+Usage:
+    python benchmarks/prompt_size_latency.py
+    python benchmarks/prompt_size_latency.py --sizes 500,4000,16000 --repeats 5 --document invoice.txt
+
+Calls the configured OPENAI_DEPLOYMENT; every size costs --repeats real requests.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extraction_agent import call_extraction_agent
+from prompt_builder import DEFAULT_PROMPT_TEMPLATE, build_extraction_prompt
+from prompt_compaction import compact_prompt
+
+SAMPLE_DOCUMENT = [{"page_number": 1, "content": (
+    "INVOICE\nInvoice Number: INV-20431\nInvoice Date: March 3, 2024\n"
+    "Vendor: Acme Corporation, 12 Harbor Road, Springfield\nBill To: Globex Ltd\n"
+    "Description            Qty   Unit Price   Amount\nConsulting services    10    $120.00      $1,200.00\n"
+    "Travel expenses         1    $34.50       $34.50\nSubtotal: $1,234.50\nTax (8%): $98.76\nTotal Due: $1,333.26\n"
+)}]
+COLUMNS = ["Invoice Number", "Invoice Date", "Vendor", "Total Due"]
+INSTRUCTIONS = ["As printed", "YYYY-MM-DD", "Company name only", "Number without currency symbol"]
+FIELDS = ["invoice number", "invoice date", "vendor", "total due", "tax", "subtotal", "bill-to party", "line items"]
+ACTIONS = ["appears after its label", "may span two lines", "can be abbreviated", "may be handwritten",
+           "is sometimes on the second page", "must not be inferred", "can be printed in a table header"]
+
+
+def padded_template(size, repeat_after=None):
+    """DEFAULT_PROMPT_TEMPLATE followed by numbered rules up to `size` characters (rules cycle after repeat_after)"""
+    lines = [DEFAULT_PROMPT_TEMPLATE, "", "Rules:"]
+    index = 0
+    while len("\n".join(lines)) < size:
+        number = index % repeat_after if repeat_after else index
+        field = FIELDS[number % len(FIELDS)]
+        action = ACTIONS[(number // len(FIELDS)) % len(ACTIONS)]
+        lines.append(f"- When the {field} {action}, still return it (rule {number + 1}).")
+        index += 1
+    return "\n".join(lines)
+
+
+async def measure(template, document, repeats):
+    prompt = build_extraction_prompt(template, COLUMNS, INSTRUCTIONS, document).render()
+    latencies, prompt_tokens = [], []
+    for _ in range(repeats):
+        usage = {}
+        start = time.perf_counter()
+        await call_extraction_agent(prompt, COLUMNS, INSTRUCTIONS, use_case="benchmark", hedge=False, usage=usage)
+        latencies.append(time.perf_counter() - start)
+        prompt_tokens.append(usage.get("prompt_tokens", 0))
+    return sorted(latencies), sum(prompt_tokens) / len(prompt_tokens)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="250,1000,4000,8000,16000", help="Template sizes in characters")
+    parser.add_argument("--repeats", type=int, default=3, help="Calls per size")
+    parser.add_argument("--document", help="Text file to extract from (default: a built-in invoice)")
+    args = parser.parse_args()
+
+    document = SAMPLE_DOCUMENT
+    if args.document:
+        with open(args.document, encoding="utf-8") as f:
+            document = [{"page_number": 1, "content": f.read()}]
+
+    print(f"{'template chars':>14} {'prompt tokens':>14} {'p50 s':>8} {'max s':>8} {'compacted chars':>16}")
+    for size in [int(value) for value in args.sizes.split(",") if value.strip()]:
+        latencies, tokens = asyncio.run(measure(padded_template(size), document, args.repeats))
+        # Same size, but the rules repeat every 20 entries (what unchecked revisions accumulate)
+        compacted = len(compact_prompt(padded_template(size, repeat_after=20)))
+        print(f"{size:>14} {tokens:>14.0f} {latencies[len(latencies) // 2]:>8.2f} {latencies[-1]:>8.2f} {compacted:>16}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""
+Queue contention benchmark for the storage backends.
+
+Seeds a batch of documents, then lets many workers (threads or processes)
+claim them with fetch_and_lock_next_document and mark them Completed, the
+way queue workers do. Reports claims/sec, claim latency, lock conflicts and
+duplicate claims (must be 0: a document claimed twice means the claim is not
+atomic).
+
+Usage:
+    python benchmarks/storage_contention.py --backend sqlite --workers 16 --documents 2000
+    python benchmarks/storage_contention.py --backend sqlite --processes --workers 8
+    python benchmarks/storage_contention.py --backend sqlserver --workers 16
+
+The SQL Server run claims every Submitted document in the configured
+database: point it at a scratch database.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import metrics
+from storage import STORAGE_BACKEND, PRIORITY_INTERACTIVE, PRIORITY_NORMAL, PRIORITY_BULK, get_storage_backend
+
+
+def open_backend(backend, database_path=None):
+    if backend == "sqlite":
+        from sqlite_storage import SqliteDatabaseManager
+        return SqliteDatabaseManager(database_path=database_path)
+    return get_storage_backend(backend)
+
+
+def seed(db, documents, run_id):
+    priorities = [PRIORITY_INTERACTIVE, PRIORITY_NORMAL, PRIORITY_NORMAL, PRIORITY_BULK]
+    for index in range(documents):
+        db.insert_document_request(f"bench-{run_id}-{index}.pdf", "benchmark", "benchmark", random.choice(priorities))
+
+
+def run_worker(backend, database_path, worker_index, work_ms):
+    """Claim and complete documents until the queue is empty; returns (claimed ids, claim latencies, lock conflicts)"""
+    db = open_backend(backend, database_path)
+    worker_id = f"bench-{os.getpid()}-{worker_index}"
+    conflicts_before = metrics.total("storage_lock_conflicts")
+    claimed, latencies = [], []
+    while True:
+        start = time.perf_counter()
+        document = db.fetch_and_lock_next_document(assigned_to="benchmark", worker_id=worker_id)
+        latencies.append(time.perf_counter() - start)
+        if document is None:
+            break
+        claimed.append(document['DocumentID'])
+        if work_ms:
+            time.sleep(work_ms / 1000)
+        db.update_document_master_by_id(document['DocumentID'], extraction_status='Completed', extraction_output='{}')
+    return claimed, latencies, metrics.total("storage_lock_conflicts") - conflicts_before
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))] if ordered else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backend", choices=["sqlite", "sqlserver"], default=STORAGE_BACKEND)
+    parser.add_argument("--database", help="SQLite file (default: a fresh temporary file)")
+    parser.add_argument("--documents", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--processes", action="store_true", help="One process per worker instead of threads")
+    parser.add_argument("--work-ms", type=float, default=0, help="Simulated processing time per document")
+    args = parser.parse_args()
+
+    database_path = args.database
+    if args.backend == "sqlite" and not database_path:
+        database_path = os.path.join(tempfile.mkdtemp(prefix="storage-bench-"), "bench.db")
+
+    seed(open_backend(args.backend, database_path), args.documents, int(time.time()))
+
+    executor_class = ProcessPoolExecutor if args.processes else ThreadPoolExecutor
+    conflicts_before = metrics.total("storage_lock_conflicts")
+    start = time.perf_counter()
+    with executor_class(max_workers=args.workers) as executor:
+        results = list(executor.map(
+            run_worker, [args.backend] * args.workers, [database_path] * args.workers,
+            range(args.workers), [args.work_ms] * args.workers
+        ))
+    elapsed = time.perf_counter() - start
+
+    claimed = [document_id for ids, _, _ in results for document_id in ids]
+    latencies = [latency for _, values, _ in results for latency in values]
+    if args.processes:
+        conflicts = sum(c for _, _, c in results)
+    else:
+        # Threads share the process-wide counter
+        conflicts = metrics.total("storage_lock_conflicts") - conflicts_before
+    duplicates = sum(count - 1 for count in Counter(claimed).values() if count > 1)
+
+    print(f"backend:            {args.backend}" + (f" ({database_path})" if database_path else ""))
+    print(f"workers:            {args.workers} {'processes' if args.processes else 'threads'}")
+    print(f"documents claimed:  {len(claimed)} / {args.documents}")
+    print(f"elapsed:            {elapsed:.2f}s")
+    print(f"claims/sec:         {len(claimed) / elapsed if elapsed else 0:.1f}")
+    print(f"claim latency p50:  {percentile(latencies, 0.5) * 1000:.1f} ms")
+    print(f"claim latency p95:  {percentile(latencies, 0.95) * 1000:.1f} ms")
+    print(f"lock conflicts:     {int(conflicts)}")
+    print(f"duplicate claims:   {duplicates}")
+    return 1 if duplicates else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+import os
+import re
+import time
+import logging
+from dotenv import load_dotenv
+
+from metrics import metrics
+from prompt_builder import build_extraction_prompt
+from delta_extraction import relevant_pages, merge_delta
+from grounding import _EMPTY_VALUES, normalize_text, verify_grounding
+from structured_output import loads_extraction, parse_extraction
+
+load_dotenv()
+
+# Deployments tried in order, cheapest first (comma separated); unset = no cascade, OPENAI_DEPLOYMENT only
+CASCADE_DEPLOYMENTS = [
+    deployment.strip() for deployment in os.getenv("OPENAI_CASCADE_DEPLOYMENTS", "").split(",")
+    if deployment.strip()
+]
+# Cost per 1K tokens of each cascade deployment, same order (used for the cost report only)
+CASCADE_COSTS = [
+    float(cost) for cost in os.getenv("OPENAI_CASCADE_COSTS", "").split(",") if cost.strip()
+]
+CASCADE_TIERS = [
+    (deployment, CASCADE_COSTS[index] if index < len(CASCADE_COSTS) else 0.0)
+    for index, deployment in enumerate(CASCADE_DEPLOYMENTS)
+]
+
+# Column name hints for the expected type (the JSON Schema types every column as a string).
+# Instructions are free text ("as printed next to the total") and are not used for this.
+_DATE_HINT = re.compile(r"\b(date|dob|dd/mm|mm/dd|yyyy)\b", re.IGNORECASE)
+_NUMERIC_HINT = re.compile(
+    r"\b(amount|total|price|cost|count|number of|quantity|qty|percent|percentage|sum|balance|fee|tax)\b|%",
+    re.IGNORECASE
+)
+_ISO_TOKEN = re.compile(r"\b\d{8}\b")
+_DIGIT = re.compile(r"\d")
+
+
+def _type_error(value, column):
+    if isinstance(value, (dict, list, tuple)):
+        return True
+    if _DATE_HINT.search(column):
+        return not _ISO_TOKEN.search(normalize_text(value))
+    if _NUMERIC_HINT.search(column):
+        return not _DIGIT.search(str(value))
+    return False
+
+
+def validate_fields(extraction, columns, pages=None):
+    """
+    Field-level checks deciding which columns a cascade tier got wrong.
+
+    A field fails when it is missing from the output, empty ("N/A", "-", ...),
+    of the wrong type (a nested value, a date column without a parseable date,
+    an amount/total/count column without a digit; the expected type is read
+    from the column name only), or, with pages given, not found in the
+    document (see verify_grounding).
+
+    Args:
+        extraction (str | dict): Extraction output
+        columns (list): Columns to check
+        pages (list, optional): [{"page_number", "content"}] for the grounding check
+
+    Returns:
+        dict: {column: "missing" | "empty" | "type" | "ungrounded"} for failing columns only
+    """
+    if isinstance(extraction, str):
+        try:
+            extraction = loads_extraction(extraction)
+        except ValueError:
+            extraction = {}
+    if not isinstance(extraction, dict):
+        extraction = {}
+
+    failures = {}
+    for column in columns:
+        if column not in extraction:
+            failures[column] = "missing"
+            continue
+        value = extraction[column]
+        text = "" if value is None else str(value).strip()
+        if not text or text.lower() in _EMPTY_VALUES:
+            failures[column] = "empty"
+            continue
+        if _type_error(value, column):
+            failures[column] = "type"
+
+    remaining = [column for column in columns if column not in failures]
+    if pages and remaining:
+        report = verify_grounding(extraction, pages, remaining)
+        for column, entry in report.items():
+            if entry["status"] == "ungrounded":
+                failures[column] = "ungrounded"
+    return {column: failures[column] for column in columns if column in failures}
+
+
+async def run_cascade(template, columns, instructions, pages, extractor, use_case=None, only_columns=None, tiers=None):
+    """
+    Extract with the cheapest deployment first and re-extract only the fields it got wrong.
+
+    The first tier extracts every requested column from the full document.
+    validate_fields then picks the failing columns, and the next tier
+    re-extracts just those, from the pages likely to hold them (same scoped
+    prompt as a feedback delta re-extraction); its values are merged into the
+    output. This repeats until every field passes or the last tier has run.
+    A later tier that fails (error or deadline) keeps the earlier values; a
+    later tier's output replaces an earlier one that is not JSON at all.
+
+    Records per tier (deployment) and use case: cascade_calls, cascade_latency_seconds,
+    cascade_tokens, cascade_cost and cascade_fields{outcome=accepted|escalated|failed}.
+
+    Args:
+        template (str): Extraction instructions
+        columns (list): Full Excel schema columns
+        instructions (list): Row-2 instructions aligned with columns
+        pages (list): [{"page_number", "content"}]
+        extractor (callable): call_extraction_agent (needs deployment= and usage= keywords)
+        use_case (str, optional): Use case label for the metrics
+        only_columns (list, optional): Subset of columns to extract (e.g. after the fast path)
+        tiers (list, optional): [(deployment, cost per 1K tokens)]. Defaults to CASCADE_TIERS
+
+    Returns:
+        str: Extraction JSON
+    """
+    tiers = CASCADE_TIERS if tiers is None else tiers
+    instruction_by_column = dict(zip(columns, list(instructions or []) + [None] * len(columns)))
+    pending = list(columns if only_columns is None else only_columns)
+    extraction = None
+
+    for index, (deployment, cost) in enumerate(tiers):
+        last = index == len(tiers) - 1
+        pending_instructions = [instruction_by_column.get(column) for column in pending]
+        if index == 0:
+            prompt = build_extraction_prompt(template, columns, instructions, pages, only_columns=only_columns)
+        else:
+            prompt = build_extraction_prompt(
+                template, columns, instructions, relevant_pages(pages, pending, extraction), only_columns=pending
+            )
+
+        usage = {}
+        start = time.perf_counter()
+        try:
+            output = await extractor(prompt.render(), pending, pending_instructions,
+                                     use_case=use_case, deployment=deployment, usage=usage)
+        except Exception as e:
+            if index == 0:
+                raise
+            logging.warning(f"Cascade tier {deployment} failed, keeping earlier values for {len(pending)} fields: {str(e)}")
+            metrics.increment("cascade_fields", len(pending), tier=deployment, use_case=use_case, outcome="failed")
+            break
+        finally:
+            tokens = usage.get("prompt_tokens", 0) + usage.get("output_tokens", 0)
+            metrics.increment("cascade_calls", tier=deployment, use_case=use_case)
+            metrics.increment("cascade_latency_seconds", time.perf_counter() - start, tier=deployment, use_case=use_case)
+            metrics.increment("cascade_tokens", tokens, tier=deployment, use_case=use_case)
+            metrics.increment("cascade_cost", tokens / 1000 * cost, tier=deployment, use_case=use_case)
+
+        if index == 0 or parse_extraction(extraction) is None:
+            # Nothing usable to merge into (e.g. an apology instead of JSON): this tier's output replaces it
+            extraction = output
+        else:
+            extraction = merge_delta(extraction, output, pending)
+        failures = validate_fields(extraction, pending, pages)
+        metrics.increment("cascade_fields", len(pending) - len(failures),
+                          tier=deployment, use_case=use_case, outcome="accepted")
+        if failures:
+            metrics.increment("cascade_fields", len(failures), tier=deployment, use_case=use_case,
+                              outcome="failed" if last else "escalated")
+            logging.info(f"Cascade tier {deployment}: {len(failures)} of {len(pending)} fields failed validation {failures}")
+        pending = [column for column in pending if column in failures]
+        if not pending:
+            break
+    return extraction
+
+
+def get_cascade_stats(use_case=None):
+    """
+    Per-tier cascade results in this process (all use cases if use_case is None)
+
+    Returns:
+        list: One dict per tier in cascade order: deployment, calls, fields, accepted,
+              hit_rate (share of the fields it was given that passed validation),
+              avg_latency (seconds per call), tokens and cost
+    """
+    rows = []
+    for deployment, _ in CASCADE_TIERS:
+        labels = {"tier": deployment, "use_case": use_case}
+        calls = int(metrics.total("cascade_calls", **labels))
+        fields = int(metrics.total("cascade_fields", **labels))
+        accepted = int(metrics.total("cascade_fields", outcome="accepted", **labels))
+        rows.append({
+            "deployment": deployment,
+            "calls": calls,
+            "fields": fields,
+            "accepted": accepted,
+            "hit_rate": accepted / fields if fields else 0.0,
+            "avg_latency": metrics.total("cascade_latency_seconds", **labels) / calls if calls else 0.0,
+            "tokens": int(metrics.total("cascade_tokens", **labels)),
+            "cost": metrics.total("cascade_cost", **labels),
+        })
+    return rows
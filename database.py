@@ -1,14 +1,32 @@
 import pyodbc
 import os
+import threading
 from dotenv import load_dotenv
 from datetime import datetime
 import logging
+# Queue priorities stay importable from here (from database import PRIORITY_INTERACTIVE, ...)
+from storage import StorageBackend, get_storage_backend, PRIORITY_INTERACTIVE, PRIORITY_NORMAL, PRIORITY_BULK
+from feedback_index import get_default_feedback_index, record_fix
+from deadline import current_deadline
+from prompt_compaction import PromptBudgetExceeded, enforce_prompt_budget
 
 load_dotenv()
 
-class DatabaseManager:
-    def __init__(self):
+# Login timeout in seconds (pyodbc otherwise waits on an unreachable server indefinitely)
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "15"))
+
+class DatabaseManager(StorageBackend):
+    """SQL Server backend: pyodbc and the stored procedures in db_scripts/"""
+
+    def __init__(self, payload_store=None, reuse_connections=False):
+        super().__init__(payload_store)
         self.connection_string = self._build_connection_string()
+        # Keep one open connection per thread instead of connecting on every call
+        # (used by AsyncDatabaseManager, whose bounded executor makes this a fixed-size pool)
+        self.reuse_connections = reuse_connections
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
         
     def _build_connection_string(self):
         """Build SQL Server connection string from environment variables"""
@@ -42,12 +60,54 @@ class DatabaseManager:
         return conn_str
     
     def get_connection(self):
-        """Get database connection"""
+        """
+        Get database connection (the calling thread's open one when reuse_connections is set).
+        Under a request deadline (deadline.deadline_scope) the login and query timeouts
+        are capped by the time left, so a stuck server cannot outlive the request.
+        """
         try:
-            return pyodbc.connect(self.connection_string)
+            deadline = current_deadline()
+            if deadline is not None:
+                deadline.check("database")
+            # pyodbc treats 0 as "no timeout": round up to at least a second
+            connect_timeout = DB_CONNECT_TIMEOUT if deadline is None else max(1, int(min(DB_CONNECT_TIMEOUT, deadline.remaining())))
+            query_timeout = 0 if deadline is None else max(1, int(deadline.remaining()))
+
+            conn = getattr(self._local, "connection", None) if self.reuse_connections else None
+            if conn is None or conn.closed:
+                conn = pyodbc.connect(self.connection_string, timeout=connect_timeout)
+                if self.reuse_connections:
+                    self._local.connection = conn
+                    with self._connections_lock:
+                        self._connections.append(conn)
+            conn.timeout = query_timeout
+            return conn
         except Exception as e:
             logging.error(f"Database connection failed: {str(e)}")
             raise
+
+    def reset_connection(self):
+        """Drop the calling thread's reused connection (after an error it may be broken)"""
+        conn = getattr(self._local, "connection", None)
+        self._local.connection = None
+        if conn is not None:
+            with self._connections_lock:
+                if conn in self._connections:
+                    self._connections.remove(conn)
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def close_connections(self):
+        """Close every reused connection"""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
     
     def get_active_prompt(self, use_case=None):
         """
@@ -107,7 +167,7 @@ class DatabaseManager:
             logging.error(f"Error inserting prompt: {str(e)}")
             raise
     
-    def insert_document_request(self, file_name, user_id=None, source_type=None):
+    def insert_document_request(self, file_name, user_id=None, source_type=None, priority=None):
         """
         Insert a new document processing request
         
@@ -115,6 +175,7 @@ class DatabaseManager:
             file_name (str): Name of the file to process
             user_id (str, optional): User who submitted the request
             source_type (str, optional): Source type of the document
+            priority (int, optional): Queue priority, lower is claimed first. Defaults to PRIORITY_NORMAL
             
         Returns:
             int: DocumentID of the inserted record, or None if failed
@@ -125,8 +186,8 @@ class DatabaseManager:
                 
                 # Execute the stored procedure
                 cursor.execute(
-                    "EXEC usp_InsertDocumentRequest ?, ?, ?",
-                    (file_name, user_id, source_type)
+                    "EXEC usp_InsertDocumentRequest ?, ?, ?, ?",
+                    (file_name, user_id, source_type, priority if priority is not None else PRIORITY_NORMAL)
                 )
                 
                 # Move to the next result set if exists (some procedures return multiple result sets)
@@ -164,41 +225,118 @@ class DatabaseManager:
             print(f"Database error details: {str(e)}")  # Add debug output
             return None  # Return None instead of raising to prevent app crash
     
-    def fetch_and_lock_next_document(self, current_status='Submitted', next_status='Processing', assigned_to=None):
+    def fetch_and_lock_next_document(self, current_status='Submitted', next_status='Processing', assigned_to=None,
+                                     aging_minutes=None, worker_id=None, lease_seconds=None, document_id=None):
         """
-        Fetch and lock the next available document for processing
+        Fetch and lock the next available document for processing.
+        Documents are claimed by priority, with waiting documents promoted one
+        priority level every `aging_minutes` so low-priority work is never starved.
+        The claim is a lease held by `worker_id`; it must be renewed with
+        renew_document_lease before it expires or the reaper returns it to the queue.
         
         Args:
             current_status (str): Status to look for
             next_status (str): Status to set when picked up
             assigned_to (str, optional): User to assign the document to
+            aging_minutes (int, optional): Minutes of waiting per priority promotion.
+                Defaults to QUEUE_AGING_MINUTES env var, or 15
+            worker_id (str, optional): Identifier of the worker holding the claim
+            lease_seconds (int, optional): Lease duration. Defaults to QUEUE_LEASE_SECONDS env var, or 300
+            document_id (int, optional): Claim only this document (when it is in current_status)
             
         Returns:
-            dict: Document details or None if no documents available
+            dict: Document details or None if no documents available. Offloaded payloads
+                are attached lazily and not read (see resolve_payloads)
         """
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
+                if aging_minutes is None:
+                    aging_minutes = int(os.getenv("QUEUE_AGING_MINUTES", "15"))
+                if lease_seconds is None:
+                    lease_seconds = int(os.getenv("QUEUE_LEASE_SECONDS", "300"))
                 cursor.execute(
-                    "EXEC usp_FetchAndLockNextDocument ?, ?, ?",
-                    (current_status, next_status, assigned_to)
+                    "EXEC usp_FetchAndLockNextDocument ?, ?, ?, ?, ?, ?, ?",
+                    (current_status, next_status, assigned_to, aging_minutes, worker_id, lease_seconds, document_id)
                 )
                 
                 row = cursor.fetchone()
                 if row and row[0] is not None:  # Check if DocumentID is not None
                     # Convert row to dictionary (adjust based on your document_master table structure)
                     columns = [column[0] for column in cursor.description]
-                    return dict(zip(columns, row))
+                    return self._attach_payloads(dict(zip(columns, row)), resolve=False)
                 return None
                 
         except Exception as e:
             logging.error(f"Error fetching next document: {str(e)}")
             raise
     
+    def renew_document_lease(self, document_id, worker_id, lease_seconds=None):
+        """
+        Extend the lease on a claimed document (heartbeat)
+        
+        Args:
+            document_id (int): Document ID currently claimed
+            worker_id (str): Worker that holds the claim
+            lease_seconds (int, optional): New lease duration from now. Defaults to QUEUE_LEASE_SECONDS env var, or 300
+            
+        Returns:
+            bool: True if the lease was extended, False if the claim was lost
+        """
+        try:
+            if lease_seconds is None:
+                lease_seconds = int(os.getenv("QUEUE_LEASE_SECONDS", "300"))
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "EXEC usp_RenewDocumentLease ?, ?, ?",
+                    (document_id, worker_id, lease_seconds)
+                )
+                row = cursor.fetchone()
+                conn.commit()
+                return bool(row and row[0])
+                
+        except Exception as e:
+            logging.error(f"Error renewing document lease: {str(e)}")
+            raise
+    
+    def reap_expired_leases(self, max_retries=None):
+        """
+        Return documents whose lease expired to the queue, incrementing RetryCount,
+        and dead-letter them once RetryCount exceeds max_retries
+        
+        Args:
+            max_retries (int, optional): Retries before dead-lettering. Defaults to QUEUE_MAX_RETRIES env var, or 3
+            
+        Returns:
+            list: One dict per reaped document with DocumentID, ExtractionStatus, RetryCount and ExpiredWorkerID
+        """
+        try:
+            if max_retries is None:
+                max_retries = int(os.getenv("QUEUE_MAX_RETRIES", "3"))
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("EXEC usp_ReapExpiredLeases ?", (max_retries,))
+                
+                reaped = []
+                if cursor.description:
+                    columns = [column[0] for column in cursor.description]
+                    reaped = [dict(zip(columns, row)) for row in cursor.fetchall()]
+                conn.commit()
+                return reaped
+                
+        except Exception as e:
+            logging.error(f"Error reaping expired leases: {str(e)}")
+            raise
+    
     def update_document_master_by_id(self, document_id, extraction_status=None, extraction_output=None, 
-                                   prompt_id=None, retry_count=None, error_message=None, comments=None):
+                                   prompt_id=None, retry_count=None, error_message=None, comments=None,
+                                   ocr_text=None, worker_id=None):
         """
-        Update document master record by ID using your stored procedure
+        Update document master record by ID using your stored procedure.
+        When a payload store is configured, extraction output and OCR text are
+        written to it and the row keeps only the reference and size; comments and
+        error messages longer than PAYLOAD_INLINE_LIMIT are offloaded the same way.
         
         Args:
             document_id (int): Document ID to update
@@ -208,24 +346,127 @@ class DatabaseManager:
             retry_count (int, optional): Number of retries
             error_message (str, optional): Error message if any
             comments (str, optional): Additional comments
+            ocr_text (str, optional): OCR text of the document (only stored when a payload store is configured)
+            worker_id (str, optional): Apply the update only while this worker holds the claim
+                ('Processing' under its lease), so a worker that lost its lease cannot overwrite the new owner
             
         Returns:
-            bool: True if successful
+            bool: True if the row was updated; False for an unknown document or a lost claim
         """
         try:
+            update = self._prepare_update(extraction_output, ocr_text, error_message, comments)
+            
             with self.get_connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
-                    "EXEC usp_UpdateDocumentMasterByID ?, ?, ?, ?, ?, ?, ?",
-                    (document_id, extraction_status, extraction_output, prompt_id, retry_count, error_message, comments)
+                    "EXEC usp_UpdateDocumentMasterByID ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?",
+                    (document_id, extraction_status, update['extraction_output'], prompt_id, retry_count,
+                     update['error_message'], update['comments'],
+                     update['output_ref'], update['output_size'], update['ocr_ref'], update['ocr_size'],
+                     worker_id)
                 )
+                row = cursor.fetchone()
                 conn.commit()
-                return True
+                return bool(row and row[0])
                 
         except Exception as e:
             logging.error(f"Error updating document: {str(e)}")
             raise
     
+    def batch_update_document_master(self, updates):
+        """
+        Apply coalesced document updates in one call to usp_BatchUpdateDocumentMaster,
+        passing them as a DocumentMasterUpdateList table-valued parameter
+
+        Args:
+            updates (list): dicts with document_id, update_document_master_by_id keyword
+                arguments and improved_count (one entry per document)
+
+        Returns:
+            int: Documents updated
+        """
+        try:
+            if not updates:
+                return 0
+            rows = []
+            for entry in updates:
+                update = self._prepare_update(
+                    entry.get('extraction_output'), entry.get('ocr_text'),
+                    entry.get('error_message'), entry.get('comments')
+                )
+                # Column order of the DocumentMasterUpdateList type
+                rows.append((
+                    entry['document_id'], entry.get('extraction_status'), update['extraction_output'],
+                    entry.get('prompt_id'), entry.get('retry_count'), update['error_message'], update['comments'],
+                    update['output_ref'], update['output_size'], update['ocr_ref'], update['ocr_size'],
+                    entry.get('improved_count', 0), entry.get('worker_id')
+                ))
+
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("EXEC usp_BatchUpdateDocumentMaster ?", (rows,))
+                row = cursor.fetchone()
+                conn.commit()
+                return row[0] if row else 0
+
+        except Exception as e:
+            logging.error(f"Error batch updating documents: {str(e)}")
+            raise
+
+    def get_queue_statistics(self, window_minutes=60):
+        """
+        Get per-priority queue depth and wait-time statistics
+        
+        Args:
+            window_minutes (int): Look-back window for pickup wait statistics
+            
+        Returns:
+            list: One dict per priority with QueuedCount, ProcessingCount,
+                  OldestQueuedWaitSeconds, AvgQueuedWaitSeconds, PickedInWindow,
+                  AvgPickupWaitSeconds and MaxPickupWaitSeconds
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("EXEC usp_GetQueueStatistics ?", (window_minutes,))
+                
+                columns = [column[0] for column in cursor.description]
+                return [dict(zip(columns, row)) for row in cursor.fetchall()]
+                
+        except Exception as e:
+            logging.error(f"Error fetching queue statistics: {str(e)}")
+            raise
+
+    def get_prompt_performance(self, use_case=None, prompt_id=None):
+        """
+        Get throughput and quality totals per prompt. Reads prompt_performance_stats,
+        which usp_UpdateDocumentMasterByID and usp_ReapExpiredLeases maintain on every
+        status transition, so the cost does not grow with document_master.
+
+        Args:
+            use_case (str, optional): The use case to filter by
+            prompt_id (int, optional): A single prompt ('Default' for the built-in prompt)
+
+        Returns:
+            list: One dict per prompt with PromptID, UseCase, DocumentsCompleted, DocumentsErrored,
+                  DocumentsDeadLettered, AvgLatencySeconds, MaxLatencySeconds, RetryRate,
+                  TotalRetries, ImprovementIterations, ImprovementsPerDocument and LastUpdated
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "EXEC usp_GetPromptPerformance ?, ?",
+                    (use_case, str(prompt_id) if prompt_id is not None else None)
+                )
+
+                columns = [column[0] for column in cursor.description]
+                return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+        except Exception as e:
+            logging.error(f"Error fetching prompt performance: {str(e)}")
+            raise
+
     def get_document_by_filename(self, filename):
         """
         Get document record by filename (for tracking uploaded files)
@@ -241,7 +482,9 @@ class DatabaseManager:
                 cursor = conn.cursor()
                 cursor.execute("""
                     SELECT TOP 1 DocumentID, FileName, ExtractionStatus, CreatedTime, LastUpdated, 
-                           UserID, SourceType, RetryCount, PromptID, ExtractionOutput, ErrorMessage, Comments
+                           UserID, SourceType, RetryCount, PromptID, ExtractionOutput, ErrorMessage, Comments,
+                           Priority, WorkerID, LeaseExpiry, ExtractionOutputRef, ExtractionOutputSize,
+                           OcrTextRef, OcrTextSize
                     FROM document_master 
                     WHERE FileName = ?
                     ORDER BY CreatedTime DESC
@@ -250,13 +493,134 @@ class DatabaseManager:
                 row = cursor.fetchone()
                 if row:
                     columns = [column[0] for column in cursor.description]
-                    return dict(zip(columns, row))
+                    return self._attach_payloads(dict(zip(columns, row)))
                 return None
                 
         except Exception as e:
             logging.error(f"Error fetching document by filename: {str(e)}")
             raise
     
+    def get_document_by_id(self, document_id):
+        """
+        Get document record by ID
+        
+        Args:
+            document_id (int): Document ID
+            
+        Returns:
+            dict: Document details or None if not found
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT DocumentID, FileName, ExtractionStatus, CreatedTime, LastUpdated, 
+                           UserID, SourceType, RetryCount, PromptID, ExtractionOutput, ErrorMessage, Comments,
+                           Priority, WorkerID, LeaseExpiry, ExtractionOutputRef, ExtractionOutputSize,
+                           OcrTextRef, OcrTextSize
+                    FROM document_master 
+                    WHERE DocumentID = ?
+                """, (document_id,))
+                
+                row = cursor.fetchone()
+                if row:
+                    columns = [column[0] for column in cursor.description]
+                    return self._attach_payloads(dict(zip(columns, row)))
+                return None
+                
+        except Exception as e:
+            logging.error(f"Error fetching document by ID: {str(e)}")
+            raise
+    
+    def get_prompt_versions(self, use_case=None, limit=20):
+        """
+        Get the prompt history for a use case, newest first
+        
+        Args:
+            use_case (str, optional): The use case to filter by
+            limit (int): Maximum number of versions to return
+            
+        Returns:
+            list: dicts with PromptID, PromptTitle, PromptText, PromptLength (characters), UseCase,
+                  IsActive, EffectivenessScore, CreatedTime and FeedbackRequested
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("EXEC usp_GetPromptVersions ?, ?", (use_case, limit))
+                
+                columns = [column[0] for column in cursor.description]
+                return [dict(zip(columns, row)) for row in cursor.fetchall()]
+                
+        except Exception as e:
+            logging.error(f"Error fetching prompt versions: {str(e)}")
+            raise
+
+    def insert_document_version(self, document_id, extraction_output, parent_version=None, parent_output=None,
+                                prompt_id=None, feedback=None, created_by=None):
+        """
+        Record a new version of a document's extraction in document_version.
+        The output is stored as a field-level delta against the parent version
+        (full snapshots for the first version, non-JSON outputs and every
+        VERSION_SNAPSHOT_INTERVAL-th version).
+
+        Args:
+            document_id (int): Root DocumentID of the lineage
+            extraction_output (str): Extraction output of the new version
+            parent_version (dict, optional): The parent's VersionID and VersionNumber (as returned by this method)
+            parent_output (str, optional): Extraction output of the parent version
+            prompt_id (int, optional): Prompt the version was extracted with
+            feedback (str, optional): Reviewer feedback that produced the version
+            created_by (str, optional): User who requested the version
+
+        Returns:
+            dict: VersionID and VersionNumber of the new version
+        """
+        try:
+            is_snapshot, output_data = self._prepare_version(extraction_output, parent_version, parent_output)
+
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "EXEC usp_InsertDocumentVersion ?, ?, ?, ?, ?, ?, ?",
+                    (document_id, parent_version['VersionID'] if parent_version else None,
+                     str(prompt_id) if prompt_id is not None else None, is_snapshot, output_data,
+                     self._offload_if_large(feedback), created_by)
+                )
+                row = cursor.fetchone()
+                conn.commit()
+                return {'VersionID': row[0], 'VersionNumber': row[1]}
+
+        except Exception as e:
+            logging.error(f"Error inserting document version: {str(e)}")
+            raise
+
+    def get_document_lineage(self, document_id, up_to_version=None):
+        """
+        Get every version of a document in one query, oldest first
+
+        Args:
+            document_id (int): Root DocumentID
+            up_to_version (int, optional): Stop at this VersionNumber
+
+        Returns:
+            list: dicts with VersionID, DocumentID, VersionNumber, ParentVersionID, PromptID,
+                  IsSnapshot, OutputData (snapshot text or delta JSON), Feedback, CreatedBy and CreatedTime
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("EXEC usp_GetDocumentLineage ?, ?", (document_id, up_to_version))
+
+                columns = [column[0] for column in cursor.description]
+                lineage = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+            return self._attach_lineage_payloads(lineage)
+
+        except Exception as e:
+            logging.error(f"Error fetching document lineage: {str(e)}")
+            raise
+
     def test_connection(self):
         """Test database connection"""
         try:
@@ -325,7 +689,7 @@ class DatabaseManager:
 # Utility functions for common operations
 def get_latest_prompt(use_case="Document_Extraction"):
     """Get the latest active prompt for document extraction"""
-    db = DatabaseManager()
+    db = get_storage_backend()
     return db.get_active_prompt(use_case)
 
 def save_improved_prompt(prompt_text, feedback_summary, use_case="Document_Extraction", effectiveness_score=None, feedback_requested=None):
@@ -339,13 +703,13 @@ def save_improved_prompt(prompt_text, feedback_summary, use_case="Document_Extra
         feedback_requested (str, optional): Full feedback text that led to this improvement
         
     Returns:
-        bool: True if successful, False otherwise
+        bool: True if successful, False otherwise (including a prompt over PROMPT_MAX_CHARS after compaction)
     """
     if not prompt_text:
         logging.error("Cannot save empty prompt")
         return False
 
-    db = DatabaseManager()
+    db = get_storage_backend()
     prompt_title = None
     actual_prompt_text = None
     
@@ -375,6 +739,22 @@ def save_improved_prompt(prompt_text, feedback_summary, use_case="Document_Extra
         prompt_title = f"Improved Prompt - {timestamp} - {feedback_summary[:50]}..."
         actual_prompt_text = prompt_text
     
+    # Only a compacted prompt within the length budget may become active
+    try:
+        actual_prompt_text = enforce_prompt_budget(actual_prompt_text)
+    except PromptBudgetExceeded as e:
+        logging.error(f"Not saving improved prompt: {str(e)}")
+        return False
+    
+    # The prompt being replaced, so the feedback index can keep the diff this feedback produced
+    feedback_index = get_default_feedback_index()
+    previous_prompt = None
+    if feedback_index is not None and feedback_requested:
+        try:
+            previous_prompt = db.get_active_prompt(use_case)
+        except Exception as e:
+            logging.warning(f"Could not load the previous prompt for the feedback index: {str(e)}")
+    
     try:
         success = db.insert_prompt_and_set_active(
             prompt_title=prompt_title,
@@ -386,6 +766,15 @@ def save_improved_prompt(prompt_text, feedback_summary, use_case="Document_Extra
         
         if success:
             logging.info(f"Successfully saved improved prompt with title: {prompt_title}")
+            if feedback_index is not None and feedback_requested:
+                saved_prompt = db.get_active_prompt(use_case)
+                record_fix(
+                    feedback_requested,
+                    previous_prompt['PromptText'] if previous_prompt else None,
+                    actual_prompt_text,
+                    use_case=use_case,
+                    prompt_id=saved_prompt['PromptID'] if saved_prompt else None
+                )
         else:
             logging.warning("Database insert returned False")
             
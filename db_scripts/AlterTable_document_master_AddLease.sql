@@ -0,0 +1,23 @@
+-- Upgrade script for databases created before lease-based claims existed
+IF COL_LENGTH('document_master', 'WorkerID') IS NULL
+BEGIN
+    ALTER TABLE document_master ADD WorkerID NVARCHAR(100) NULL;
+END
+GO
+
+IF COL_LENGTH('document_master', 'LeaseExpiry') IS NULL
+BEGIN
+    ALTER TABLE document_master ADD LeaseExpiry DATETIME NULL;
+END
+GO
+
+IF NOT EXISTS (
+    SELECT 1 FROM sys.indexes
+    WHERE name = 'IX_document_master_Status_LeaseExpiry'
+      AND object_id = OBJECT_ID('document_master')
+)
+BEGIN
+    CREATE INDEX IX_document_master_Status_LeaseExpiry
+        ON document_master (ExtractionStatus, LeaseExpiry);
+END
+GO
@@ -0,0 +1,16 @@
+-- Upgrade script for databases created before payload offloading existed
+IF COL_LENGTH('document_master', 'ExtractionOutputRef') IS NULL
+BEGIN
+    ALTER TABLE document_master ADD
+        ExtractionOutputRef NVARCHAR(100) NULL,
+        ExtractionOutputSize INT NULL;
+END
+GO
+
+IF COL_LENGTH('document_master', 'OcrTextRef') IS NULL
+BEGIN
+    ALTER TABLE document_master ADD
+        OcrTextRef NVARCHAR(100) NULL,
+        OcrTextSize INT NULL;
+END
+GO
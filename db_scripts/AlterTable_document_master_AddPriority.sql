@@ -0,0 +1,22 @@
+-- Upgrade script for databases created before the Priority column existed
+IF COL_LENGTH('document_master', 'Priority') IS NULL
+BEGIN
+    ALTER TABLE document_master
+        ADD Priority INT NOT NULL
+        CONSTRAINT DF_document_master_Priority DEFAULT 5 WITH VALUES;
+END
+GO
+
+-- Seeks the claim to the rows in @CurrentStatus. The aging term of its ORDER BY
+-- (Priority - minutes waited / @AgingMinutes) is computed per row, so those rows
+-- are still sorted at claim time; the index does not provide that order.
+IF NOT EXISTS (
+    SELECT 1 FROM sys.indexes
+    WHERE name = 'IX_document_master_Status_Priority'
+      AND object_id = OBJECT_ID('document_master')
+)
+BEGIN
+    CREATE INDEX IX_document_master_Status_Priority
+        ON document_master (ExtractionStatus, Priority, CreatedTime);
+END
+GO
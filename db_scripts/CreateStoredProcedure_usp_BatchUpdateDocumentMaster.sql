@@ -0,0 +1,115 @@
+CREATE PROCEDURE usp_BatchUpdateDocumentMaster
+    @Updates DocumentMasterUpdateList READONLY
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    DECLARE @Transition TABLE (
+        OldStatus NVARCHAR(50),
+        NewStatus NVARCHAR(50),
+        PromptID NVARCHAR(100),
+        PickedTime DATETIME,
+        CompletedTime DATETIME,
+        RetryCount INT,
+        ImprovedCount INT
+    );
+
+    BEGIN TRANSACTION;
+
+    -- Same column rules as usp_UpdateDocumentMasterByID, applied to every row in one statement
+    UPDATE dm
+    SET
+        ExtractionStatus = ISNULL(u.ExtractionStatus, dm.ExtractionStatus),
+        ExtractionOutput = CASE WHEN u.ExtractionOutputRef IS NOT NULL THEN NULL
+                                ELSE ISNULL(u.ExtractionOutput, dm.ExtractionOutput) END,
+        ExtractionOutputRef = CASE WHEN u.ExtractionOutput IS NOT NULL AND u.ExtractionOutputRef IS NULL THEN NULL
+                                   ELSE ISNULL(u.ExtractionOutputRef, dm.ExtractionOutputRef) END,
+        ExtractionOutputSize = CASE WHEN u.ExtractionOutput IS NOT NULL AND u.ExtractionOutputRef IS NULL THEN NULL
+                                    ELSE ISNULL(u.ExtractionOutputSize, dm.ExtractionOutputSize) END,
+        OcrTextRef = ISNULL(u.OcrTextRef, dm.OcrTextRef),
+        OcrTextSize = ISNULL(u.OcrTextSize, dm.OcrTextSize),
+        PromptID = ISNULL(u.PromptID, dm.PromptID),
+        ErrorMessage = ISNULL(u.ErrorMessage, dm.ErrorMessage),
+        Comments = ISNULL(u.Comments, dm.Comments),
+        RetryCount = ISNULL(u.RetryCount, dm.RetryCount),
+        WorkerID = CASE WHEN u.ExtractionStatus IS NOT NULL AND u.ExtractionStatus <> 'Processing'
+                        THEN NULL ELSE dm.WorkerID END,
+        LeaseExpiry = CASE WHEN u.ExtractionStatus IS NOT NULL AND u.ExtractionStatus <> 'Processing'
+                           THEN NULL ELSE dm.LeaseExpiry END,
+        LastUpdated = GETDATE(),
+        CompletedTime = GETDATE()
+    OUTPUT
+        deleted.ExtractionStatus,
+        inserted.ExtractionStatus,
+        inserted.PromptID,
+        inserted.PickedTime,
+        inserted.CompletedTime,
+        inserted.RetryCount,
+        u.ImprovedCount
+    INTO @Transition
+    FROM
+        document_master dm
+        INNER JOIN @Updates u ON u.DocumentID = dm.DocumentID
+    WHERE
+        u.WorkerID IS NULL OR (dm.WorkerID = u.WorkerID AND dm.ExtractionStatus = 'Processing');
+
+    -- Transitions summed per prompt (MERGE needs one source row per target row)
+    -- HOLDLOCK: concurrent first transitions for a prompt must not both insert its row
+    MERGE prompt_performance_stats WITH (HOLDLOCK) AS target
+    USING (
+        SELECT
+            PromptID,
+            MAX(UseCase) AS UseCase,
+            SUM(Completed) AS Completed,
+            SUM(Errored) AS Errored,
+            SUM(Improved) AS Improved,
+            COUNT(LatencySeconds) AS LatencySamples,
+            ISNULL(SUM(LatencySeconds), 0) AS TotalLatencySeconds,
+            MAX(LatencySeconds) AS MaxLatencySeconds,
+            SUM(CASE WHEN Retries > 0 THEN 1 ELSE 0 END) AS RetriedDocuments,
+            SUM(Retries) AS Retries
+        FROM (
+            SELECT
+                ISNULL(t.PromptID, 'Default') AS PromptID,
+                pl.UseCase,
+                CASE WHEN t.NewStatus = 'Completed' AND ISNULL(t.OldStatus, '') <> 'Completed' THEN 1 ELSE 0 END AS Completed,
+                CASE WHEN t.NewStatus = 'Error' AND ISNULL(t.OldStatus, '') <> 'Error' THEN 1 ELSE 0 END AS Errored,
+                t.ImprovedCount AS Improved,
+                CASE WHEN t.NewStatus = 'Completed' AND ISNULL(t.OldStatus, '') <> 'Completed' AND t.PickedTime IS NOT NULL
+                     THEN DATEDIFF(MILLISECOND, t.PickedTime, t.CompletedTime) / 1000.0 END AS LatencySeconds,
+                CASE WHEN t.NewStatus IN ('Completed', 'Error') AND ISNULL(t.OldStatus, '') <> t.NewStatus
+                     THEN ISNULL(t.RetryCount, 0) ELSE 0 END AS Retries
+            FROM
+                @Transition t
+                LEFT JOIN model_prompt_library pl ON pl.PromptID = TRY_CAST(t.PromptID AS INT)
+            WHERE
+                ISNULL(t.OldStatus, '') <> t.NewStatus OR t.ImprovedCount > 0
+        ) AS transitions
+        GROUP BY PromptID
+    ) AS delta
+    ON target.PromptID = delta.PromptID
+    WHEN MATCHED AND delta.Completed + delta.Errored + delta.Improved > 0 THEN
+        UPDATE SET
+            UseCase = ISNULL(target.UseCase, delta.UseCase),
+            DocumentsCompleted = target.DocumentsCompleted + delta.Completed,
+            DocumentsErrored = target.DocumentsErrored + delta.Errored,
+            LatencySamples = target.LatencySamples + delta.LatencySamples,
+            TotalLatencySeconds = target.TotalLatencySeconds + delta.TotalLatencySeconds,
+            MaxLatencySeconds = CASE WHEN delta.MaxLatencySeconds > ISNULL(target.MaxLatencySeconds, -1)
+                                     THEN delta.MaxLatencySeconds ELSE target.MaxLatencySeconds END,
+            RetriedDocuments = target.RetriedDocuments + delta.RetriedDocuments,
+            TotalRetries = target.TotalRetries + delta.Retries,
+            ImprovementIterations = target.ImprovementIterations + delta.Improved,
+            LastUpdated = GETDATE()
+    WHEN NOT MATCHED AND delta.Completed + delta.Errored + delta.Improved > 0 THEN
+        INSERT (PromptID, UseCase, DocumentsCompleted, DocumentsErrored, LatencySamples, TotalLatencySeconds,
+                MaxLatencySeconds, RetriedDocuments, TotalRetries, ImprovementIterations, LastUpdated)
+        VALUES (delta.PromptID, delta.UseCase, delta.Completed, delta.Errored, delta.LatencySamples,
+                delta.TotalLatencySeconds, delta.MaxLatencySeconds, delta.RetriedDocuments, delta.Retries,
+                delta.Improved, GETDATE());
+
+    COMMIT TRANSACTION;
+
+    SELECT COUNT(*) AS UpdatedCount FROM @Transition;
+END
+GO
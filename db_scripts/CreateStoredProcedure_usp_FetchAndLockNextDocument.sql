@@ -1,13 +1,23 @@
 CREATE PROCEDURE usp_FetchAndLockNextDocument
     @CurrentStatus NVARCHAR(50) = 'Submitted',
     @NextStatus NVARCHAR(50) = 'Processing',
-    @AssignedTo NVARCHAR(100) = NULL
+    @AssignedTo NVARCHAR(100) = NULL,
+    @AgingMinutes INT = 15,
+    @WorkerID NVARCHAR(100) = NULL,
+    @LeaseSeconds INT = 300,
+    -- Claim this document only (e.g. one the HTTP service registered and is about to extract)
+    @OnlyDocumentID INT = NULL
 AS
 BEGIN
     SET NOCOUNT ON;
 
     DECLARE @DocumentID INT;
 
+    -- Every @AgingMinutes spent waiting promotes a document by one priority level,
+    -- so bulk work is delayed behind interactive work but never starved.
+    SET @AgingMinutes = ISNULL(NULLIF(@AgingMinutes, 0), 15);
+    SET @LeaseSeconds = ISNULL(NULLIF(@LeaseSeconds, 0), 300);
+
     BEGIN TRANSACTION;
 
     -- Fetch and lock the next available document
@@ -17,8 +27,10 @@ BEGIN
         document_master WITH (ROWLOCK, UPDLOCK, READPAST)
     WHERE
         ExtractionStatus = @CurrentStatus
+        AND (@OnlyDocumentID IS NULL OR DocumentID = @OnlyDocumentID)
     ORDER BY
-        CreatedTime; -- You may change the order based on priority
+        Priority - DATEDIFF(MINUTE, CreatedTime, GETDATE()) / @AgingMinutes,
+        CreatedTime;
 
     IF @DocumentID IS NOT NULL
     BEGIN
@@ -28,7 +40,9 @@ BEGIN
             ExtractionStatus = @NextStatus,
             LastUpdated = GETDATE(),
 			PickedTime = GETDATE(),
-            UserID = @AssignedTo
+            UserID = @AssignedTo,
+            WorkerID = @WorkerID,
+            LeaseExpiry = DATEADD(SECOND, @LeaseSeconds, GETDATE())
         WHERE
             DocumentID = @DocumentID;
 
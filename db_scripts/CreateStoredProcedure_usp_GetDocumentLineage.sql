@@ -0,0 +1,28 @@
+CREATE PROCEDURE usp_GetDocumentLineage
+    @DocumentID INT,
+    @UpToVersion INT = NULL
+AS
+BEGIN
+	SET NOCOUNT ON;
+    
+    -- Every version of the document in one read (served by UQ_document_version_Document_Version)
+    SELECT
+		VersionID,
+        DocumentID,
+        VersionNumber,
+        ParentVersionID,
+        PromptID,
+        IsSnapshot,
+        OutputData,
+        Feedback,
+        CreatedBy,
+        CreatedTime
+	FROM
+		document_version
+	WHERE
+		DocumentID = @DocumentID
+        AND (@UpToVersion IS NULL OR VersionNumber <= @UpToVersion)
+	ORDER BY
+		VersionNumber;
+END;
+GO
@@ -0,0 +1,31 @@
+CREATE PROCEDURE usp_GetPromptPerformance
+    @UseCase NVARCHAR(100) = NULL,
+    @PromptID NVARCHAR(100) = NULL
+AS
+BEGIN
+	SET NOCOUNT ON;
+    
+    -- Reads the incrementally maintained totals only (one row per prompt)
+    SELECT
+		PromptID,
+        UseCase,
+        DocumentsCompleted,
+        DocumentsErrored,
+        DocumentsDeadLettered,
+        TotalLatencySeconds / NULLIF(LatencySamples, 0) AS AvgLatencySeconds,
+        MaxLatencySeconds,
+        CAST(RetriedDocuments AS FLOAT)
+            / NULLIF(DocumentsCompleted + DocumentsErrored + DocumentsDeadLettered, 0) AS RetryRate,
+        TotalRetries,
+        ImprovementIterations,
+        CAST(ImprovementIterations AS FLOAT) / NULLIF(DocumentsCompleted, 0) AS ImprovementsPerDocument,
+        LastUpdated
+	FROM
+		prompt_performance_stats
+	WHERE
+		(@UseCase IS NULL OR UseCase = @UseCase)
+        AND (@PromptID IS NULL OR PromptID = @PromptID)
+	ORDER BY
+		LastUpdated DESC;
+END;
+GO
@@ -0,0 +1,26 @@
+CREATE PROCEDURE usp_GetPromptVersions
+    @UseCase NVARCHAR(100) = NULL,
+    @Top INT = 20
+AS
+BEGIN
+	SET NOCOUNT ON;
+    
+    SELECT TOP (ISNULL(@Top, 20))
+		PromptID,
+        PromptTitle,
+        PromptText,
+        LEN(PromptText) AS PromptLength,
+        UseCase,
+        IsActive,
+        EffectivenessScore,
+        CreatedTime,
+        FeedbackRequested
+	FROM
+		model_prompt_library
+	WHERE
+		(@UseCase IS NULL OR UseCase = @UseCase)
+	ORDER BY
+		CreatedTime DESC,
+        PromptID DESC;
+END;
+GO
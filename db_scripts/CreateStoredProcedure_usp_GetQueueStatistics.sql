@@ -0,0 +1,35 @@
+CREATE PROCEDURE usp_GetQueueStatistics
+    @WindowMinutes INT = 60
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    DECLARE @Now DATETIME = GETDATE();
+    DECLARE @WindowStart DATETIME = DATEADD(MINUTE, -ISNULL(@WindowMinutes, 60), @Now);
+
+    -- Per-priority queue depth (waiting rows) and wait times, plus pickup wait
+    -- for documents claimed within the recent window.
+    SELECT
+        Priority,
+        SUM(CASE WHEN ExtractionStatus = 'Submitted' THEN 1 ELSE 0 END) AS QueuedCount,
+        SUM(CASE WHEN ExtractionStatus = 'Processing' THEN 1 ELSE 0 END) AS ProcessingCount,
+        MAX(CASE WHEN ExtractionStatus = 'Submitted'
+                 THEN DATEDIFF(SECOND, CreatedTime, @Now) END) AS OldestQueuedWaitSeconds,
+        AVG(CASE WHEN ExtractionStatus = 'Submitted'
+                 THEN CAST(DATEDIFF(SECOND, CreatedTime, @Now) AS FLOAT) END) AS AvgQueuedWaitSeconds,
+        SUM(CASE WHEN PickedTime >= @WindowStart THEN 1 ELSE 0 END) AS PickedInWindow,
+        AVG(CASE WHEN PickedTime >= @WindowStart
+                 THEN CAST(DATEDIFF(SECOND, CreatedTime, PickedTime) AS FLOAT) END) AS AvgPickupWaitSeconds,
+        MAX(CASE WHEN PickedTime >= @WindowStart
+                 THEN DATEDIFF(SECOND, CreatedTime, PickedTime) END) AS MaxPickupWaitSeconds
+    FROM
+        document_master
+    WHERE
+        ExtractionStatus IN ('Submitted', 'Processing')
+        OR PickedTime >= @WindowStart
+    GROUP BY
+        Priority
+    ORDER BY
+        Priority;
+END;
+GO
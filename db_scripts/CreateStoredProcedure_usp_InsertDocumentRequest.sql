@@ -1,7 +1,8 @@
 CREATE PROCEDURE usp_InsertDocumentRequest
     @FileName NVARCHAR(255),
     @UserID NVARCHAR(100) = NULL,
-    @SourceType NVARCHAR(50) = NULL
+    @SourceType NVARCHAR(50) = NULL,
+    @Priority INT = 5
 AS
 BEGIN
     SET NOCOUNT ON;
@@ -13,7 +14,8 @@ BEGIN
         LastUpdated,
         UserID,
         SourceType,
-        RetryCount
+        RetryCount,
+        Priority
     )
     VALUES (
         @FileName,
@@ -22,7 +24,8 @@ BEGIN
         GETDATE(),
         @UserID,
         @SourceType,
-        0                  -- RetryCount is 0 for fresh requests
+        0,                 -- RetryCount is 0 for fresh requests
+        ISNULL(@Priority, 5)
     );
 END;
-GO
\ No newline at end of file
+GO
@@ -0,0 +1,49 @@
+CREATE PROCEDURE usp_InsertDocumentVersion
+    @DocumentID INT,
+    @ParentVersionID INT = NULL,
+    @PromptID NVARCHAR(100) = NULL,
+    @IsSnapshot BIT,
+    @OutputData NVARCHAR(MAX),
+    @Feedback NVARCHAR(MAX) = NULL,
+    @CreatedBy NVARCHAR(100) = NULL
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    BEGIN TRANSACTION;
+
+    -- Serialize version numbering per document (concurrent feedback rounds get distinct numbers)
+    DECLARE @VersionNumber INT = (
+        SELECT ISNULL(MAX(VersionNumber), 0) + 1
+        FROM document_version WITH (UPDLOCK, HOLDLOCK)
+        WHERE DocumentID = @DocumentID
+    );
+
+    INSERT INTO document_version (
+        DocumentID,
+        VersionNumber,
+        ParentVersionID,
+        PromptID,
+        IsSnapshot,
+        OutputData,
+        Feedback,
+        CreatedBy,
+        CreatedTime
+    )
+    VALUES (
+        @DocumentID,
+        @VersionNumber,
+        @ParentVersionID,
+        @PromptID,
+        @IsSnapshot,
+        @OutputData,
+        @Feedback,
+        @CreatedBy,
+        GETDATE()
+    );
+
+    SELECT CAST(SCOPE_IDENTITY() AS INT) AS VersionID, @VersionNumber AS VersionNumber;
+
+    COMMIT TRANSACTION;
+END;
+GO
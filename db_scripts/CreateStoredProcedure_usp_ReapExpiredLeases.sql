@@ -0,0 +1,77 @@
+CREATE PROCEDURE usp_ReapExpiredLeases
+    @MaxRetries INT = 3,
+    @ProcessingStatus NVARCHAR(50) = 'Processing',
+    @RetryStatus NVARCHAR(50) = 'Submitted',
+    @DeadLetterStatus NVARCHAR(50) = 'DeadLetter'
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    SET @MaxRetries = ISNULL(@MaxRetries, 3);
+
+    DECLARE @Reaped TABLE (
+        DocumentID INT,
+        ExtractionStatus NVARCHAR(50),
+        RetryCount INT,
+        ExpiredWorkerID NVARCHAR(100),
+        PromptID NVARCHAR(100)
+    );
+
+    -- Return expired claims to the queue, or dead-letter them once retries run out.
+    -- READPAST skips rows a live worker is updating right now.
+    UPDATE document_master WITH (ROWLOCK, READPAST)
+    SET
+        RetryCount = ISNULL(RetryCount, 0) + 1,
+        ExtractionStatus = CASE WHEN ISNULL(RetryCount, 0) + 1 > @MaxRetries
+                                THEN @DeadLetterStatus ELSE @RetryStatus END,
+        ErrorMessage = CASE WHEN ISNULL(RetryCount, 0) + 1 > @MaxRetries
+                            THEN CONCAT('Lease expired on worker ', WorkerID, ' after ', ISNULL(RetryCount, 0) + 1, ' attempts')
+                            ELSE ErrorMessage END,
+        WorkerID = NULL,
+        LeaseExpiry = NULL,
+        LastUpdated = GETDATE()
+    OUTPUT
+        inserted.DocumentID,
+        inserted.ExtractionStatus,
+        inserted.RetryCount,
+        deleted.WorkerID,
+        inserted.PromptID
+    INTO @Reaped
+    WHERE
+        ExtractionStatus = @ProcessingStatus
+        AND LeaseExpiry IS NOT NULL
+        AND LeaseExpiry < GETDATE();
+
+    -- Dead-lettered documents count against their prompt in the running totals
+    -- HOLDLOCK: concurrent first transitions for a prompt must not both insert its row
+    MERGE prompt_performance_stats WITH (HOLDLOCK) AS target
+    USING (
+        SELECT
+            ISNULL(r.PromptID, 'Default') AS PromptID,
+            MAX(pl.UseCase) AS UseCase,
+            COUNT(*) AS DeadLettered,
+            SUM(r.RetryCount) AS Retries
+        FROM
+            @Reaped r
+            LEFT JOIN model_prompt_library pl ON pl.PromptID = TRY_CAST(r.PromptID AS INT)
+        WHERE
+            r.ExtractionStatus = @DeadLetterStatus
+        GROUP BY
+            ISNULL(r.PromptID, 'Default')
+    ) AS delta
+    ON target.PromptID = delta.PromptID
+    WHEN MATCHED THEN
+        UPDATE SET
+            UseCase = ISNULL(target.UseCase, delta.UseCase),
+            DocumentsDeadLettered = target.DocumentsDeadLettered + delta.DeadLettered,
+            RetriedDocuments = target.RetriedDocuments + delta.DeadLettered,
+            TotalRetries = target.TotalRetries + delta.Retries,
+            LastUpdated = GETDATE()
+    WHEN NOT MATCHED THEN
+        INSERT (PromptID, UseCase, DocumentsDeadLettered, RetriedDocuments, TotalRetries, LastUpdated)
+        VALUES (delta.PromptID, delta.UseCase, delta.DeadLettered, delta.DeadLettered, delta.Retries, GETDATE());
+
+    SELECT DocumentID, ExtractionStatus, RetryCount, ExpiredWorkerID
+    FROM @Reaped;
+END;
+GO
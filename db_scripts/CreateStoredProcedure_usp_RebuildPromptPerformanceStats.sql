@@ -0,0 +1,42 @@
+-- One-off backfill of prompt_performance_stats from document_master history.
+-- Run once after creating the table (off-peak: it scans document_master); from then on
+-- the totals are maintained incrementally on every status transition.
+CREATE PROCEDURE usp_RebuildPromptPerformanceStats
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    BEGIN TRANSACTION;
+
+    DELETE FROM prompt_performance_stats;
+
+    INSERT INTO prompt_performance_stats (
+        PromptID, UseCase, DocumentsCompleted, DocumentsErrored, DocumentsDeadLettered,
+        LatencySamples, TotalLatencySeconds, MaxLatencySeconds,
+        RetriedDocuments, TotalRetries, ImprovementIterations, LastUpdated
+    )
+    SELECT
+        ISNULL(dm.PromptID, 'Default'),
+        MAX(pl.UseCase),
+        SUM(CASE WHEN dm.ExtractionStatus IN ('Completed', 'Improved') THEN 1 ELSE 0 END),
+        SUM(CASE WHEN dm.ExtractionStatus = 'Error' THEN 1 ELSE 0 END),
+        SUM(CASE WHEN dm.ExtractionStatus = 'DeadLetter' THEN 1 ELSE 0 END),
+        SUM(CASE WHEN dm.ExtractionStatus IN ('Completed', 'Improved') AND dm.PickedTime IS NOT NULL THEN 1 ELSE 0 END),
+        ISNULL(SUM(CASE WHEN dm.ExtractionStatus IN ('Completed', 'Improved') AND dm.PickedTime IS NOT NULL
+                        THEN DATEDIFF(MILLISECOND, dm.PickedTime, dm.CompletedTime) / 1000.0 END), 0),
+        MAX(CASE WHEN dm.ExtractionStatus IN ('Completed', 'Improved') AND dm.PickedTime IS NOT NULL
+                 THEN DATEDIFF(MILLISECOND, dm.PickedTime, dm.CompletedTime) / 1000.0 END),
+        SUM(CASE WHEN dm.ExtractionStatus IN ('Completed', 'Error', 'DeadLetter') AND dm.RetryCount > 0 THEN 1 ELSE 0 END),
+        SUM(CASE WHEN dm.ExtractionStatus IN ('Completed', 'Error', 'DeadLetter') THEN ISNULL(dm.RetryCount, 0) ELSE 0 END),
+        -- Improved rows carry the number of feedback rounds in RetryCount (approximate: retries and rounds share the column)
+        SUM(CASE WHEN dm.ExtractionStatus = 'Improved' THEN ISNULL(dm.RetryCount, 0) ELSE 0 END),
+        GETDATE()
+    FROM
+        document_master dm
+        LEFT JOIN model_prompt_library pl ON pl.PromptID = TRY_CAST(dm.PromptID AS INT)
+    GROUP BY
+        ISNULL(dm.PromptID, 'Default');
+
+    COMMIT TRANSACTION;
+END;
+GO
@@ -0,0 +1,23 @@
+CREATE PROCEDURE usp_RenewDocumentLease
+    @DocumentID INT,
+    @WorkerID NVARCHAR(100),
+    @LeaseSeconds INT = 300
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    SET @LeaseSeconds = ISNULL(NULLIF(@LeaseSeconds, 0), 300);
+
+    -- Only the worker that still holds the claim may extend it
+    UPDATE document_master
+    SET
+        LeaseExpiry = DATEADD(SECOND, @LeaseSeconds, GETDATE()),
+        LastUpdated = GETDATE()
+    WHERE
+        DocumentID = @DocumentID
+        AND WorkerID = @WorkerID
+        AND ExtractionStatus = 'Processing';
+
+    SELECT @@ROWCOUNT AS Renewed;
+END;
+GO
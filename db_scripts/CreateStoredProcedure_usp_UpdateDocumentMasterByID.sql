@@ -5,23 +5,107 @@ CREATE PROCEDURE usp_UpdateDocumentMasterByID
     @PromptID INT,
     @RetryCount INT,
 	@ErrorMessage NVARCHAR(MAX),
-	@Comments NVARCHAR(MAX)
+	@Comments NVARCHAR(MAX),
+    @ExtractionOutputRef NVARCHAR(100) = NULL,
+    @ExtractionOutputSize INT = NULL,
+    @OcrTextRef NVARCHAR(100) = NULL,
+    @OcrTextSize INT = NULL,
+    -- When given, only the worker holding the claim may update the row (while it is 'Processing')
+    @WorkerID NVARCHAR(100) = NULL
 AS
 BEGIN
     SET NOCOUNT ON;
 
+    DECLARE @Transition TABLE (
+        OldStatus NVARCHAR(50),
+        NewStatus NVARCHAR(50),
+        PromptID NVARCHAR(100),
+        PickedTime DATETIME,
+        CompletedTime DATETIME,
+        RetryCount INT
+    );
+
     UPDATE document_master
     SET 
         ExtractionStatus = ISNULL(@ExtractionStatus, ExtractionStatus),
-		ExtractionOutput = ISNULL(@ExtractionOutput, ExtractionOutput),
+		-- An offloaded output replaces any inline copy
+		ExtractionOutput = CASE WHEN @ExtractionOutputRef IS NOT NULL THEN NULL
+		                        ELSE ISNULL(@ExtractionOutput, ExtractionOutput) END,
+		ExtractionOutputRef = CASE WHEN @ExtractionOutput IS NOT NULL AND @ExtractionOutputRef IS NULL THEN NULL
+		                           ELSE ISNULL(@ExtractionOutputRef, ExtractionOutputRef) END,
+		ExtractionOutputSize = CASE WHEN @ExtractionOutput IS NOT NULL AND @ExtractionOutputRef IS NULL THEN NULL
+		                            ELSE ISNULL(@ExtractionOutputSize, ExtractionOutputSize) END,
+		OcrTextRef = ISNULL(@OcrTextRef, OcrTextRef),
+		OcrTextSize = ISNULL(@OcrTextSize, OcrTextSize),
         PromptID = ISNULL(@PromptID, PromptID),
         ErrorMessage = ISNULL(@ErrorMessage, ErrorMessage),
         Comments = ISNULL(@Comments, Comments),
 		RetryCount = ISNULL(@RetryCount, RetryCount),
+        -- Leaving 'Processing' releases the claim
+        WorkerID = CASE WHEN @ExtractionStatus IS NOT NULL AND @ExtractionStatus <> 'Processing'
+                        THEN NULL ELSE WorkerID END,
+        LeaseExpiry = CASE WHEN @ExtractionStatus IS NOT NULL AND @ExtractionStatus <> 'Processing'
+                           THEN NULL ELSE LeaseExpiry END,
         LastUpdated = GETDATE(),
 		CompletedTime = GETDATE()
+    OUTPUT
+        deleted.ExtractionStatus,
+        inserted.ExtractionStatus,
+        inserted.PromptID,
+        inserted.PickedTime,
+        inserted.CompletedTime,
+        inserted.RetryCount
+    INTO @Transition
     WHERE
-        DocumentID = @DocumentID;
+        DocumentID = @DocumentID
+        AND (@WorkerID IS NULL OR (WorkerID = @WorkerID AND ExtractionStatus = 'Processing'));
+
+    DECLARE @UpdatedCount INT = @@ROWCOUNT;
+
+    -- Fold the status transition into the per-prompt running totals (one row touched, no scans).
+    -- Every 'Improved' update is one feedback round; Completed/Error count once per document.
+    -- HOLDLOCK: concurrent first transitions for a prompt must not both insert its row
+    MERGE prompt_performance_stats WITH (HOLDLOCK) AS target
+    USING (
+        SELECT
+            ISNULL(t.PromptID, 'Default') AS PromptID,
+            pl.UseCase,
+            CASE WHEN t.NewStatus = 'Completed' AND ISNULL(t.OldStatus, '') <> 'Completed' THEN 1 ELSE 0 END AS Completed,
+            CASE WHEN t.NewStatus = 'Error' AND ISNULL(t.OldStatus, '') <> 'Error' THEN 1 ELSE 0 END AS Errored,
+            CASE WHEN @ExtractionStatus = 'Improved' THEN 1 ELSE 0 END AS Improved,
+            CASE WHEN t.NewStatus = 'Completed' AND ISNULL(t.OldStatus, '') <> 'Completed' AND t.PickedTime IS NOT NULL
+                 THEN DATEDIFF(MILLISECOND, t.PickedTime, t.CompletedTime) / 1000.0 END AS LatencySeconds,
+            CASE WHEN t.NewStatus IN ('Completed', 'Error') AND ISNULL(t.OldStatus, '') <> t.NewStatus
+                 THEN ISNULL(t.RetryCount, 0) ELSE 0 END AS Retries
+        FROM
+            @Transition t
+            LEFT JOIN model_prompt_library pl ON pl.PromptID = TRY_CAST(t.PromptID AS INT)
+        WHERE
+            ISNULL(t.OldStatus, '') <> t.NewStatus OR @ExtractionStatus = 'Improved'
+    ) AS delta
+    ON target.PromptID = delta.PromptID
+    WHEN MATCHED AND delta.Completed + delta.Errored + delta.Improved > 0 THEN
+        UPDATE SET
+            UseCase = ISNULL(target.UseCase, delta.UseCase),
+            DocumentsCompleted = target.DocumentsCompleted + delta.Completed,
+            DocumentsErrored = target.DocumentsErrored + delta.Errored,
+            LatencySamples = target.LatencySamples + CASE WHEN delta.LatencySeconds IS NULL THEN 0 ELSE 1 END,
+            TotalLatencySeconds = target.TotalLatencySeconds + ISNULL(delta.LatencySeconds, 0),
+            MaxLatencySeconds = CASE WHEN delta.LatencySeconds > ISNULL(target.MaxLatencySeconds, -1)
+                                     THEN delta.LatencySeconds ELSE target.MaxLatencySeconds END,
+            RetriedDocuments = target.RetriedDocuments + CASE WHEN delta.Retries > 0 THEN 1 ELSE 0 END,
+            TotalRetries = target.TotalRetries + delta.Retries,
+            ImprovementIterations = target.ImprovementIterations + delta.Improved,
+            LastUpdated = GETDATE()
+    WHEN NOT MATCHED AND delta.Completed + delta.Errored + delta.Improved > 0 THEN
+        INSERT (PromptID, UseCase, DocumentsCompleted, DocumentsErrored, LatencySamples, TotalLatencySeconds,
+                MaxLatencySeconds, RetriedDocuments, TotalRetries, ImprovementIterations, LastUpdated)
+        VALUES (delta.PromptID, delta.UseCase, delta.Completed, delta.Errored,
+                CASE WHEN delta.LatencySeconds IS NULL THEN 0 ELSE 1 END, ISNULL(delta.LatencySeconds, 0),
+                delta.LatencySeconds, CASE WHEN delta.Retries > 0 THEN 1 ELSE 0 END, delta.Retries,
+                delta.Improved, GETDATE());
 
+    -- 0 when the document does not exist or the claim was lost to another worker
+    SELECT @UpdatedCount AS UpdatedCount;
 END
 GO
\ No newline at end of file
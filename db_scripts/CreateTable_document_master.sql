@@ -13,6 +13,24 @@ CREATE TABLE document_master (
     SourceType NVARCHAR(50) NULL,			-- e.g., 'PDF', 'DOCX'
     Comments NVARCHAR(MAX) NULL,
     RetryCount INT DEFAULT 0,
-    ErrorMessage NVARCHAR(MAX) NULL
+    ErrorMessage NVARCHAR(MAX) NULL,
+    Priority INT NOT NULL DEFAULT 5,		-- 1 = interactive/urgent ... 9 = bulk backfill; lower is claimed first
+    WorkerID NVARCHAR(100) NULL,			-- Worker currently holding the claim
+    LeaseExpiry DATETIME NULL,				-- Claim expires unless renewed by heartbeat
+    ExtractionOutputRef NVARCHAR(100) NULL,	-- Payload store reference ('sha256:<hex>') when ExtractionOutput is offloaded
+    ExtractionOutputSize INT NULL,			-- Uncompressed size of the offloaded output in bytes
+    OcrTextRef NVARCHAR(100) NULL,			-- Payload store reference for the OCR text of the document
+    OcrTextSize INT NULL
 );
+GO
+
+-- Supports the priority + aging claim in usp_FetchAndLockNextDocument: it seeks to the
+-- rows in the claimed status; the aging term is computed per row, so those are sorted at claim time
+CREATE INDEX IX_document_master_Status_Priority
+    ON document_master (ExtractionStatus, Priority, CreatedTime);
+GO
+
+-- Supports the stale-lock reaper in usp_ReapExpiredLeases
+CREATE INDEX IX_document_master_Status_LeaseExpiry
+    ON document_master (ExtractionStatus, LeaseExpiry);
 GO
\ No newline at end of file
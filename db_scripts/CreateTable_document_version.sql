@@ -0,0 +1,14 @@
+CREATE TABLE document_version (
+    VersionID INT IDENTITY(1,1) PRIMARY KEY,
+    DocumentID INT NOT NULL REFERENCES document_master (DocumentID),	-- Root document the lineage belongs to
+    VersionNumber INT NOT NULL,				-- 1 = initial extraction, then one per feedback iteration
+    ParentVersionID INT NULL REFERENCES document_version (VersionID),
+    PromptID NVARCHAR(100) NULL,			-- Prompt the version was extracted with
+    IsSnapshot BIT NOT NULL DEFAULT 0,		-- 1: OutputData is the full extraction; 0: field-level delta against the parent
+    OutputData NVARCHAR(MAX) NULL,			-- Snapshot text or delta JSON ({"set": {...}, "removed": [...]}); may be a payload reference
+    Feedback NVARCHAR(MAX) NULL,			-- Reviewer feedback that produced this version
+    CreatedBy NVARCHAR(100) NULL,
+    CreatedTime DATETIME NOT NULL DEFAULT GETDATE(),
+    CONSTRAINT UQ_document_version_Document_Version UNIQUE (DocumentID, VersionNumber)
+);
+GO
@@ -0,0 +1,21 @@
+-- Running totals per prompt, maintained incrementally by usp_UpdateDocumentMasterByID and
+-- usp_ReapExpiredLeases on status transitions, so reads never scan document_master
+CREATE TABLE prompt_performance_stats (
+    PromptID NVARCHAR(100) NOT NULL PRIMARY KEY,	-- 'Default' for documents extracted without a library prompt
+    UseCase NVARCHAR(100) NULL,
+    DocumentsCompleted INT NOT NULL DEFAULT 0,
+    DocumentsErrored INT NOT NULL DEFAULT 0,
+    DocumentsDeadLettered INT NOT NULL DEFAULT 0,
+    LatencySamples INT NOT NULL DEFAULT 0,			-- Completions with a PickedTime
+    TotalLatencySeconds FLOAT NOT NULL DEFAULT 0,	-- Sum of PickedTime -> CompletedTime
+    MaxLatencySeconds FLOAT NULL,
+    RetriedDocuments INT NOT NULL DEFAULT 0,		-- Finished documents with RetryCount > 0
+    TotalRetries INT NOT NULL DEFAULT 0,
+    ImprovementIterations INT NOT NULL DEFAULT 0,	-- Transitions to 'Improved' (one per feedback round)
+    LastUpdated DATETIME NOT NULL DEFAULT GETDATE()
+);
+GO
+
+CREATE INDEX IX_prompt_performance_stats_UseCase
+    ON prompt_performance_stats (UseCase);
+GO
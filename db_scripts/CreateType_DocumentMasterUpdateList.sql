@@ -0,0 +1,19 @@
+-- Table-valued parameter for usp_BatchUpdateDocumentMaster: one coalesced update per document.
+-- NULL leaves a column unchanged, as in usp_UpdateDocumentMasterByID.
+-- A type in use cannot be altered: drop usp_BatchUpdateDocumentMaster and this type, then re-create both.
+CREATE TYPE DocumentMasterUpdateList AS TABLE (
+    DocumentID INT NOT NULL PRIMARY KEY,
+    ExtractionStatus NVARCHAR(50) NULL,
+    ExtractionOutput NVARCHAR(MAX) NULL,
+    PromptID INT NULL,
+    RetryCount INT NULL,
+    ErrorMessage NVARCHAR(MAX) NULL,
+    Comments NVARCHAR(MAX) NULL,
+    ExtractionOutputRef NVARCHAR(100) NULL,
+    ExtractionOutputSize INT NULL,
+    OcrTextRef NVARCHAR(100) NULL,
+    OcrTextSize INT NULL,
+    ImprovedCount INT NOT NULL DEFAULT 0,		-- 'Improved' updates folded into this row (feedback rounds)
+    WorkerID NVARCHAR(100) NULL				-- When set, applied only while this worker holds the claim
+);
+GO
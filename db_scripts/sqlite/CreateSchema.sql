@@ -0,0 +1,79 @@
+-- SQLite equivalent of the SQL Server tables (used by sqlite_storage.py; applied on first connect).
+-- Times are local 'YYYY-MM-DD HH:MM:SS' text, like GETDATE().
+CREATE TABLE IF NOT EXISTS document_master (
+    DocumentID INTEGER PRIMARY KEY AUTOINCREMENT,
+    FileName TEXT,
+    ExtractionStatus TEXT,
+    ExtractionOutput TEXT,
+    CreatedTime TEXT DEFAULT (datetime('now', 'localtime')),
+    PickedTime TEXT NULL,
+    CompletedTime TEXT NULL,
+    PromptID TEXT NULL,
+    LastUpdated TEXT DEFAULT (datetime('now', 'localtime')),
+    UserID TEXT NULL,
+    SourceType TEXT NULL,
+    Comments TEXT NULL,
+    RetryCount INTEGER DEFAULT 0,
+    ErrorMessage TEXT NULL,
+    Priority INTEGER NOT NULL DEFAULT 5,
+    WorkerID TEXT NULL,
+    LeaseExpiry TEXT NULL,
+    ExtractionOutputRef TEXT NULL,
+    ExtractionOutputSize INTEGER NULL,
+    OcrTextRef TEXT NULL,
+    OcrTextSize INTEGER NULL
+);
+
+-- Claims seek to the Submitted rows; the aging term is computed per row, so those are sorted at claim time
+CREATE INDEX IF NOT EXISTS IX_document_master_Status_Priority
+    ON document_master (ExtractionStatus, Priority, CreatedTime);
+
+CREATE INDEX IF NOT EXISTS IX_document_master_Status_LeaseExpiry
+    ON document_master (ExtractionStatus, LeaseExpiry);
+
+CREATE TABLE IF NOT EXISTS model_prompt_library (
+    PromptID INTEGER PRIMARY KEY AUTOINCREMENT,
+    PromptTitle TEXT NOT NULL,
+    PromptText TEXT NOT NULL,
+    UseCase TEXT NULL,
+    IsActive INTEGER DEFAULT 0,
+    CreatedBy TEXT NULL,
+    CreatedTime TEXT DEFAULT (datetime('now', 'localtime')),
+    LastModifiedBy TEXT NULL,
+    LastModifiedTime TEXT DEFAULT (datetime('now', 'localtime')),
+    EffectivenessScore REAL NULL,
+    Comments TEXT NULL,
+    FeedbackRequested TEXT NULL
+);
+
+CREATE TABLE IF NOT EXISTS document_version (
+    VersionID INTEGER PRIMARY KEY AUTOINCREMENT,
+    DocumentID INTEGER NOT NULL REFERENCES document_master (DocumentID),
+    VersionNumber INTEGER NOT NULL,
+    ParentVersionID INTEGER NULL REFERENCES document_version (VersionID),
+    PromptID TEXT NULL,
+    IsSnapshot INTEGER NOT NULL DEFAULT 0,
+    OutputData TEXT NULL,
+    Feedback TEXT NULL,
+    CreatedBy TEXT NULL,
+    CreatedTime TEXT NOT NULL DEFAULT (datetime('now', 'localtime')),
+    UNIQUE (DocumentID, VersionNumber)
+);
+
+CREATE TABLE IF NOT EXISTS prompt_performance_stats (
+    PromptID TEXT NOT NULL PRIMARY KEY,
+    UseCase TEXT NULL,
+    DocumentsCompleted INTEGER NOT NULL DEFAULT 0,
+    DocumentsErrored INTEGER NOT NULL DEFAULT 0,
+    DocumentsDeadLettered INTEGER NOT NULL DEFAULT 0,
+    LatencySamples INTEGER NOT NULL DEFAULT 0,
+    TotalLatencySeconds REAL NOT NULL DEFAULT 0,
+    MaxLatencySeconds REAL NULL,
+    RetriedDocuments INTEGER NOT NULL DEFAULT 0,
+    TotalRetries INTEGER NOT NULL DEFAULT 0,
+    ImprovementIterations INTEGER NOT NULL DEFAULT 0,
+    LastUpdated TEXT NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE INDEX IF NOT EXISTS IX_prompt_performance_stats_UseCase
+    ON prompt_performance_stats (UseCase);
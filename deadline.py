@@ -0,0 +1,131 @@
+import os
+import time
+import asyncio
+import contextvars
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# End-to-end budget for one document (OCR + extraction + persistence)
+DEADLINE_DOCUMENT_SECONDS = float(os.getenv("DEADLINE_DOCUMENT_SECONDS", "600"))
+# Share of the remaining budget each stage may use; the rest is kept for the stages after it
+DEADLINE_STAGE_SHARES = {
+    "ocr": float(os.getenv("DEADLINE_OCR_SHARE", "0.5")),
+    "extraction": float(os.getenv("DEADLINE_EXTRACTION_SHARE", "0.8")),
+    "improvement": float(os.getenv("DEADLINE_IMPROVEMENT_SHARE", "0.8")),
+}
+# Status recorded in document_master when a document runs out of time
+TIMED_OUT_STATUS = "TimedOut"
+
+_current = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """A stage ran out of its share of the request's time budget"""
+
+    def __init__(self, stage, budget=None):
+        self.stage = stage
+        self.budget = budget
+        detail = f" after {budget:.1f}s" if budget is not None else ""
+        super().__init__(f"Deadline exceeded during {stage}{detail}")
+
+
+class Deadline:
+    """
+    Point in time by which a request must finish.
+
+    Stages ask for a share of what is left (budget) rather than a fixed
+    timeout, so a slow OCR leaves less time for the LLM instead of pushing the
+    whole request past its deadline.
+
+    Usage:
+        with deadline_scope(Deadline(120)):
+            pages = ocr(...)                                       # reads current_deadline()
+            text = await with_deadline(run_agent(...), "extraction")
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        """Seconds left (0 once expired)"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def budget(self, stage=None, share=None):
+        """
+        Seconds a stage may use
+
+        Args:
+            stage (str, optional): Stage name, for its DEADLINE_STAGE_SHARES share
+            share (float, optional): Explicit share of the remaining time. Defaults to the stage's, or 1.0
+        """
+        if share is None:
+            share = DEADLINE_STAGE_SHARES.get(stage, 1.0)
+        return self.remaining() * share
+
+    def check(self, stage):
+        """Raise DeadlineExceeded if no time is left"""
+        if self.expired():
+            raise DeadlineExceeded(stage, self.seconds)
+
+
+def current_deadline():
+    """The deadline of the running request, or None"""
+    return _current.get()
+
+
+@contextmanager
+def deadline_scope(deadline=None):
+    """
+    Make a deadline current for the block (and the tasks/threads it starts via asyncio)
+
+    Args:
+        deadline (Deadline | float, optional): Deadline or seconds. Defaults to DEADLINE_DOCUMENT_SECONDS
+    """
+    if deadline is None:
+        deadline = DEADLINE_DOCUMENT_SECONDS
+    if not isinstance(deadline, Deadline):
+        deadline = Deadline(deadline)
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def stage_timeout(stage, default=None):
+    """Timeout in seconds for a blocking stage under the current deadline (default when there is none)"""
+    deadline = current_deadline()
+    if deadline is None:
+        return default
+    deadline.check(stage)
+    budget = deadline.budget(stage)
+    return budget if default is None else min(budget, default)
+
+
+async def with_deadline(awaitable, stage):
+    """
+    Await under the stage's share of the current deadline; the work is cancelled when it runs out
+
+    Raises:
+        DeadlineExceeded
+    """
+    deadline = current_deadline()
+    if deadline is None:
+        return await awaitable
+    if deadline.expired():
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise DeadlineExceeded(stage, 0.0)
+    budget = deadline.budget(stage)
+    try:
+        return await asyncio.wait_for(awaitable, timeout=budget)
+    except DeadlineExceeded:
+        raise
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(stage, budget) from None
@@ -0,0 +1,137 @@
+import re
+import json
+import logging
+
+from fast_path import normalize_label
+from structured_output import normalize_value, parse_extraction, quoted_phrases
+
+# "Column: value" / "Column = value" / "Column -> value" lines in reviewer feedback
+_CORRECTION_LINE = re.compile(r"^\s*[-*•]?\s*([^:=\n]{1,80}?)\s*(?::|=|->|→)\s*(.+?)\s*$", re.MULTILINE)
+
+
+def _parse(extraction):
+    return parse_extraction(extraction) or {}
+
+
+def columns_mentioned(feedback, columns):
+    """Columns whose name appears in the feedback as a whole phrase (case/punctuation-insensitive)"""
+    norm_feedback = f" {normalize_label(feedback)} "
+    return [c for c in columns if c and normalize_label(c) and f" {normalize_label(c)} " in norm_feedback]
+
+
+def feedback_corrections(feedback, columns):
+    """
+    Explicit corrections in the feedback, as {column: corrected value}.
+
+    Understands a pasted JSON object (e.g. an edited copy of the extraction) and
+    "Column: value" style lines.
+    """
+    by_label = {normalize_label(c): c for c in columns if c}
+    corrections = {}
+
+    start, end = (feedback or "").find("{"), (feedback or "").rfind("}")
+    if 0 <= start < end:
+        try:
+            pasted = json.loads(feedback[start:end + 1])
+            if isinstance(pasted, dict):
+                for key, value in pasted.items():
+                    column = by_label.get(normalize_label(key))
+                    if column:
+                        corrections[column] = value
+        except json.JSONDecodeError:
+            pass
+
+    for label, value in _CORRECTION_LINE.findall(feedback or ""):
+        column = by_label.get(normalize_label(label))
+        if column and column not in corrections:
+            corrections[column] = value.strip().strip('"\'')
+
+    return corrections
+
+
+def affected_columns(feedback, columns, original_extraction):
+    """
+    Work out which columns a piece of feedback affects.
+
+    A column is affected when the feedback names it, gives a correction for it
+    that differs from the original value, or quotes its original value.
+
+    Args:
+        feedback (str): Reviewer feedback
+        columns (list): Excel column names
+        original_extraction (str or dict): Extraction the feedback was given on
+
+    Returns:
+        list: Affected columns in schema order (empty if the feedback cannot be scoped)
+    """
+    original = _parse(original_extraction)
+    affected = set(columns_mentioned(feedback, columns))
+
+    for column, value in feedback_corrections(feedback, columns).items():
+        if normalize_value(value) != normalize_value(original.get(column)):
+            affected.add(column)
+
+    quoted = {normalize_value(q) for q in quoted_phrases(feedback)}
+    for column in columns:
+        value = normalize_value(original.get(column))
+        if value and value in quoted:
+            affected.add(column)
+
+    return [c for c in columns if c in affected]
+
+
+def relevant_pages(pages, columns, original_extraction):
+    """
+    Pages likely to hold the affected columns: those containing a column's name or
+    its original value as whole words. Falls back to every page when nothing matches.
+
+    Args:
+        pages (list): dicts with page_number and content
+        columns (list): Affected columns
+        original_extraction (str or dict): Extraction the feedback was given on
+
+    Returns:
+        list: Subset of pages, in page order
+    """
+    original = _parse(original_extraction)
+    needles = []
+    for column in columns:
+        needles.append(normalize_label(column))
+        value = normalize_label(original.get(column))
+        if len(value) >= 3:
+            needles.append(value)
+    # Padded with spaces so "ein" matches the word, not "being"
+    needles = [f" {n} " for n in needles if n]
+
+    selected = []
+    for page in pages:
+        content = f" {normalize_label(page['content'])} "
+        if any(needle in content for needle in needles):
+            selected.append(page)
+    return selected or list(pages)
+
+
+def merge_delta(original_extraction, delta_extraction, affected):
+    """
+    Merge re-extracted values for the affected columns into the original output.
+
+    Every other column keeps its original value exactly. Both outputs are parsed
+    tolerantly (code fences, surrounding text); if either still cannot be
+    parsed the original extraction is returned unchanged.
+
+    Returns:
+        str: Merged JSON
+    """
+    original = parse_extraction(original_extraction)
+    if original is None:
+        logging.warning("Original extraction is not parseable JSON; keeping it unchanged")
+        return original_extraction
+    delta = parse_extraction(delta_extraction)
+    if delta is None:
+        logging.warning("Delta re-extraction returned no usable JSON; keeping the original values")
+        return original_extraction if isinstance(original_extraction, str) else json.dumps(original, ensure_ascii=False)
+    merged = dict(original)
+    for column in affected:
+        if column in delta:
+            merged[column] = delta[column]
+    return json.dumps(merged, ensure_ascii=False)
@@ -1,43 +1,95 @@
 
 from pydantic import BaseModel, Field
 from azure.core.credentials import AzureKeyCredential
-from azure.ai.documentintelligence.models import AnalyzeDocumentRequest, DocumentContentFormat, AnalyzeResult
+from azure.ai.documentintelligence.models import AnalyzeDocumentRequest, DocumentContentFormat, AnalyzeResult, DocumentAnalysisFeature
 from azure.ai.documentintelligence import DocumentIntelligenceClient
 import os
+from functools import lru_cache
+from types import SimpleNamespace
 from openai import AzureOpenAI
 import pandas as pd
 import re
 import io
 import json
 
+from prompt_builder import iter_page_blocks
+from deadline import DeadlineExceeded, stage_timeout
+
 endpoint = os.getenv("DOCUMENT_INTELLIGENCE_ENDPOINT")
 fr_key = os.getenv("DOCUMENT_INTELLIGENCE_KEY")
 
-def doc_intelligence(file_input):
-    # Handle both file paths (strings) and file content (bytes)
+@lru_cache(maxsize=1)
+def get_document_analysis_client():
+    """Process-wide Document Intelligence client (reuses its HTTP connection pool across documents)"""
+    return DocumentIntelligenceClient(
+            endpoint=endpoint, credential=AzureKeyCredential(fr_key)
+        )
+
+def analyze_document(file_input, pages=None):
+    """
+    Run prebuilt-layout (with key-value pairs) and return the full AnalyzeResult
+
+    file_input: a file path, the file content (bytes) or an open binary file
+    pages: optional page selection such as "1-3,7"; only those pages are analyzed
+    """
+    # A file path is streamed from disk rather than read into memory first
     if isinstance(file_input, str):
-        # If it's a file path
         with open(file_input, "rb") as file:
-            f = file.read()
-    else:
-        # If it's already file content (bytes)
-        f = file_input
+            return analyze_document(file, pages=pages)
     
-    document_analysis_client = DocumentIntelligenceClient(
-            endpoint=endpoint, credential=AzureKeyCredential(fr_key)
-        )
+    document_analysis_client = get_document_analysis_client()
 
-    poller = document_analysis_client.begin_analyze_document("prebuilt-layout", f, content_type="application/octet-stream", output_content_format=DocumentContentFormat.MARKDOWN)
-    result = poller.result()
+    poller = document_analysis_client.begin_analyze_document(
+        "prebuilt-layout", file_input, content_type="application/octet-stream",
+        output_content_format=DocumentContentFormat.MARKDOWN,
+        features=[DocumentAnalysisFeature.KEY_VALUE_PAIRS],
+        pages=pages
+    )
+    # Bounded by the current deadline's OCR share; unbounded outside a deadline_scope
+    timeout = stage_timeout("ocr")
+    poller.wait(timeout=timeout)
+    if not poller.done():
+        # Document Intelligence has no cancel operation: the poller is dropped without
+        # reading a partial result and its background polling ends with the analysis
+        raise DeadlineExceeded("ocr", timeout)
+    return poller.result()
 
-    content_per_page = []
-    page_number = 1
-    content = ""
+def iter_result_pages(result):
+    """Yield the content of an AnalyzeResult one page at a time as {"page_number", "content"}"""
     for page in result.pages: 
         cont = result.content[page.spans[0]['offset']: page.spans[0]['offset'] + page.spans[0]['length']]
-        # content += cont + "\n\n"
-        content += f"Page {page_number}:\n{cont}\n\n"
-        content_per_page.append({"page_number": page_number, "content": cont})
-        page_number+=1
-    # print(content)
-    return content
\ No newline at end of file
+        # page_number is the page's position in the PDF, also when only some pages were analyzed
+        yield {"page_number": page.page_number, "content": cont}
+
+def result_pages(result):
+    """Per-page content of an AnalyzeResult as [{"page_number", "content"}]"""
+    return list(iter_result_pages(result))
+
+def slim_result(result):
+    """
+    Keep only what the fast path reads (key-value pairs and tables) once page text
+    has been taken from a result; words, lines, spans and the full content string
+    of a long document are released.
+    """
+    if result is None:
+        return None
+    return SimpleNamespace(
+        key_value_pairs=getattr(result, "key_value_pairs", None),
+        tables=getattr(result, "tables", None)
+    )
+
+def pages_to_content(pages):
+    """Join per-page content into the "Page N:" text used in extraction prompts"""
+    return "".join(iter_page_blocks(pages))
+
+def result_to_content(result):
+    """Flatten an AnalyzeResult into the per-page markdown text used in extraction prompts"""
+    return pages_to_content(iter_result_pages(result))
+
+def doc_intelligence(file_input, return_result=False):
+    # return_result=True also returns the structured AnalyzeResult (tables, key-value pairs, confidences)
+    result = analyze_document(file_input)
+    content = result_to_content(result)
+    if return_result:
+        return content, result
+    return content
@@ -0,0 +1,57 @@
+import io
+import json
+from openpyxl import load_workbook
+
+
+def read_excel_schema(excel_file):
+    """
+    Read the extraction schema from an Excel template: row 1 holds the column
+    names, row 2 (optional) the per-column extraction instructions.
+
+    Args:
+        excel_file: Path, file-like object or raw .xlsx bytes
+
+    Returns:
+        tuple: (columns, instructions) with instructions aligned to columns
+    """
+    if isinstance(excel_file, (bytes, bytearray)):
+        excel_file = io.BytesIO(excel_file)
+    wb = load_workbook(excel_file)
+    ws = wb.active
+    columns = [cell.value for cell in ws[1]]
+    
+    # Check if second row exists and has data
+    instructions = []
+    if ws.max_row >= 2:
+        # Check if second row has any non-empty cells
+        second_row_values = [cell.value for cell in ws[2]]
+        if any(value is not None and str(value).strip() for value in second_row_values):
+            instructions = second_row_values
+        else:
+            # If second row is empty, use empty strings as placeholders
+            instructions = ["" for _ in columns]
+    else:
+        # If no second row exists, use empty strings as placeholders
+        instructions = ["" for _ in columns]
+    
+    return columns, instructions
+
+
+def schema_from_json(schema_json):
+    """
+    Schema given as JSON instead of a workbook (used by the HTTP service).
+
+    Accepts either {"column": "instruction", ...} or ["column", ...].
+
+    Returns:
+        tuple: (columns, instructions)
+
+    Raises:
+        ValueError: If the JSON is not an object or a list of column names
+    """
+    schema = json.loads(schema_json) if isinstance(schema_json, str) else schema_json
+    if isinstance(schema, dict):
+        return list(schema.keys()), ["" if v is None else str(v) for v in schema.values()]
+    if isinstance(schema, list) and all(isinstance(c, str) for c in schema):
+        return list(schema), ["" for _ in schema]
+    raise ValueError("Schema must be an object of column: instruction or a list of column names")
@@ -4,31 +4,165 @@ from google.adk.models.lite_llm import LiteLlm
 from dotenv import load_dotenv
 from google.adk.runners import Runner
 import asyncio
+import json
+import logging
+import litellm
 from google.adk.sessions import InMemorySessionService
 from google.genai import types
+from metrics import metrics
+from structured_output import build_response_format, parse_json_output
+from deadline import DeadlineExceeded, with_deadline
+from hedging import HedgePolicy, run_hedged
 
 load_dotenv()
 
-# Configure for Azure OpenAI
-extract_agent = LlmAgent(
-    name="pdf_to_excel_extractor",
-    model=LiteLlm(
-        model=os.getenv("OPENAI_DEPLOYMENT"),
-        api_base=os.getenv("OPENAI_ENDPOINT"),
-        api_key=os.getenv("OPENAI_API_KEY"),
-        api_version=os.getenv("OPENAI_API_VERSION")
-    ),
-    description="Extracts specified columns from PDF using Excel instructions.",
-    instruction=f"""
+# Request a JSON Schema response format built from the Excel columns (EXTRACTION_STRUCTURED_OUTPUT=false to disable)
+STRUCTURED_OUTPUT_ENABLED = os.getenv("EXTRACTION_STRUCTURED_OUTPUT", "true").lower() == "true"
+# Extra attempts when the output still cannot be parsed as JSON
+PARSE_RETRIES = int(os.getenv("EXTRACTION_PARSE_RETRIES", "1"))
+# Send a duplicate request when a call runs into the latency tail (see hedging.py for the thresholds)
+HEDGING_ENABLED = os.getenv("EXTRACTION_HEDGING", "false").lower() == "true"
+
+EXTRACTION_INSTRUCTION = f"""
         "You are an expert data extractor for business documents. "
         "Extract only the columns defined in the provided schema, and strictly follow the row instructions. "
         "Output results in JSON format with each column as a key and its extracted value from the PDF text as value."
     """
+
+def build_extraction_model(response_format=None, deployment=None):
+    """LiteLLM model for an Azure OpenAI deployment (default OPENAI_DEPLOYMENT), optionally with a structured response format"""
+    extra_args = {"response_format": response_format} if response_format else {}
+    return LiteLlm(
+        model=deployment or os.getenv("OPENAI_DEPLOYMENT"),
+        api_base=os.getenv("OPENAI_ENDPOINT"),
+        api_key=os.getenv("OPENAI_API_KEY"),
+        api_version=os.getenv("OPENAI_API_VERSION"),
+        **extra_args
+    )
+
+# Configure for Azure OpenAI
+extract_agent = LlmAgent(
+    name="pdf_to_excel_extractor",
+    model=build_extraction_model(),
+    description="Extracts specified columns from PDF using Excel instructions.",
+    instruction=EXTRACTION_INSTRUCTION
 )
 
-async def call_extraction_agent(prompt, columns, instructions):
-    # Use the prompt that's passed in directly instead of rebuilding it
-    
+# Free-text agents for other deployments (model cascade tiers)
+_deployment_agents = {}
+
+def get_extraction_agent(deployment=None):
+    """Free-text extraction agent for a deployment (extract_agent for the default one)"""
+    if not deployment or deployment == os.getenv("OPENAI_DEPLOYMENT"):
+        return extract_agent
+    agent = _deployment_agents.get(deployment)
+    if agent is None:
+        agent = LlmAgent(
+            name="pdf_to_excel_extractor",
+            model=build_extraction_model(deployment=deployment),
+            description="Extracts specified columns from PDF using Excel instructions.",
+            instruction=EXTRACTION_INSTRUCTION
+        )
+        _deployment_agents[deployment] = agent
+    return agent
+
+# One agent per distinct schema (and deployment), so repeated documents of a use case reuse it
+_structured_agents = {}
+
+# Deployments that rejected the JSON Schema response format; they get free-text requests from then on
+_structured_unsupported = set()
+
+def is_response_format_error(error):
+    """True when a request failed because the deployment does not support the structured response format"""
+    if isinstance(error, litellm.UnsupportedParamsError):
+        return True
+    if isinstance(error, litellm.BadRequestError):
+        message = str(error).lower()
+        return any(marker in message for marker in ("response_format", "json_schema", "structured output"))
+    return False
+
+def get_structured_agent(columns, instructions, deployment=None):
+    """Extraction agent whose responses are constrained to the JSON Schema of the given columns"""
+    response_format = build_response_format(columns, instructions)
+    schema_key = (deployment, json.dumps(response_format, sort_keys=True))
+    agent = _structured_agents.get(schema_key)
+    if agent is None:
+        agent = LlmAgent(
+            name="pdf_to_excel_extractor",
+            model=build_extraction_model(response_format, deployment),
+            description="Extracts specified columns from PDF using Excel instructions.",
+            instruction=EXTRACTION_INSTRUCTION
+        )
+        _structured_agents[schema_key] = agent
+    return agent
+
+# Latency window and hedge budget per deployment, shared by every extraction call of the process
+_hedge_policies = {}
+
+def get_hedge_policy(deployment=None):
+    return _hedge_policies.setdefault(deployment or "", HedgePolicy())
+
+def record_token_usage(usage_metadata, use_case=None, usage=None):
+    """Record prompt, cached and output token counts reported by the model for one call (also added to `usage`)"""
+    if usage_metadata is None:
+        return
+    prompt_tokens = getattr(usage_metadata, "prompt_token_count", None) or 0
+    cached_tokens = getattr(usage_metadata, "cached_content_token_count", None) or 0
+    output_tokens = getattr(usage_metadata, "candidates_token_count", None) or 0
+    if usage is not None:
+        usage["prompt_tokens"] = usage.get("prompt_tokens", 0) + prompt_tokens
+        usage["output_tokens"] = usage.get("output_tokens", 0) + output_tokens
+    metrics.increment("extraction_calls", use_case=use_case)
+    metrics.increment("extraction_prompt_tokens", prompt_tokens, use_case=use_case)
+    metrics.increment("extraction_cached_tokens", cached_tokens, use_case=use_case)
+    metrics.increment("extraction_output_tokens", output_tokens, use_case=use_case)
+
+def get_prompt_cache_stats(use_case=None):
+    """
+    Prefix-cache savings for extraction calls in this process (all use cases if use_case is None)
+
+    Returns:
+        dict: calls, prompt_tokens, cached_tokens and cached_ratio (share of prompt tokens served from cache)
+    """
+    prompt_tokens = metrics.total("extraction_prompt_tokens", use_case=use_case)
+    cached_tokens = metrics.total("extraction_cached_tokens", use_case=use_case)
+    return {
+        "calls": int(metrics.total("extraction_calls", use_case=use_case)),
+        "prompt_tokens": int(prompt_tokens),
+        "cached_tokens": int(cached_tokens),
+        "cached_ratio": round(cached_tokens / prompt_tokens, 3) if prompt_tokens else 0.0,
+    }
+
+def get_parse_stats(use_case=None):
+    """
+    JSON parse outcomes for extraction calls in this process
+
+    Returns:
+        dict: calls, repaired (needed the tolerant parser), retries and failures (no JSON after all attempts)
+    """
+    return {
+        "calls": int(metrics.total("extraction_parse_calls", use_case=use_case)),
+        "repaired": int(metrics.total("extraction_parse_repaired", use_case=use_case)),
+        "retries": int(metrics.total("extraction_parse_retries", use_case=use_case)),
+        "failures": int(metrics.total("extraction_parse_failures", use_case=use_case)),
+    }
+
+def get_hedge_stats(use_case=None):
+    """
+    Hedged requests in this process (EXTRACTION_HEDGING)
+
+    Returns:
+        dict: issued, won (the duplicate answered first), extra_tokens (spent on the losing requests)
+              and delay_seconds (current hedge threshold, None until enough latencies were seen)
+    """
+    return {
+        "issued": int(metrics.total("extraction_hedges_issued", use_case=use_case)),
+        "won": int(metrics.total("extraction_hedges_won", use_case=use_case)),
+        "extra_tokens": int(metrics.total("extraction_hedge_extra_tokens", use_case=use_case)),
+        "delay_seconds": get_hedge_policy().delay(),
+    }
+
+async def _run_agent(agent, prompt, use_case=None, usage=None):
     temp_service = InMemorySessionService()
     example_session = await temp_service.create_session(
         app_name="agents",
@@ -37,20 +171,114 @@ async def call_extraction_agent(prompt, columns, instructions):
     )
     content = types.Content(role='user', parts=[types.Part(text=prompt)])
     
-    runner = Runner(app_name="agents", agent=extract_agent, session_service=temp_service)
+    runner = Runner(app_name="agents", agent=agent, session_service=temp_service)
     response = runner.run_async(user_id=example_session.user_id, session_id=example_session.id, new_message=content)
 
-    result_data = ""
+    full_text = ""
     gen = response
     async for res in gen:
         # print(res)
+        record_token_usage(getattr(res, "usage_metadata", None), use_case, usage)
         parts = []
         if hasattr(res, "content") and hasattr(res.content, "parts"):
             for part in res.content.parts:
-                if hasattr(part, "text"):
+                if hasattr(part, "text") and part.text:
                     parts.append(part.text)
 
-        full_text = "\n".join(parts)
-        result_data += getattr(res, "text", str(res))
-    print("Agent Response:", full_text)
+        if parts:
+            full_text = "\n".join(parts)
+    return full_text
+
+async def _run_agent_hedged(agent, prompt, use_case=None, usage=None, deployment=None):
+    """_run_agent, duplicated once the call runs past the hedge threshold; the first answer wins"""
+    usages = []
+
+    def attempt():
+        attempt_usage = {}
+        usages.append(attempt_usage)
+        return _run_agent(agent, prompt, use_case, attempt_usage)
+
+    try:
+        full_text, winner = await run_hedged(attempt, get_hedge_policy(deployment), use_case)
+    finally:
+        if usage is not None:
+            for attempt_usage in usages:
+                for key, value in attempt_usage.items():
+                    usage[key] = usage.get(key, 0) + value
+    if len(usages) > 1:
+        # The loser was usually cancelled before reporting usage, but its prompt was still processed
+        loser = usages[1 - winner]
+        extra = (loser.get("prompt_tokens") or usages[winner].get("prompt_tokens", 0)) + loser.get("output_tokens", 0)
+        metrics.increment("extraction_hedge_extra_tokens", extra, use_case=use_case)
+    return full_text
+
+async def call_extraction_agent(prompt, columns, instructions, use_case=None, structured=None, hedge=None,
+                                deployment=None, usage=None):
+    """
+    Run the extraction agent and return its output as a JSON string.
+
+    With structured output (default, see EXTRACTION_STRUCTURED_OUTPUT) the request
+    carries a JSON Schema built from `columns`; a deployment that rejects the
+    response format gets free-text requests from then on (other errors are
+    raised). The response is parsed tolerantly
+    (code fences, commentary, trailing commas); if no JSON object can be
+    recovered the call is retried up to EXTRACTION_PARSE_RETRIES times, and the
+    raw text of the last attempt is returned.
+
+    With hedging (hedge=True, default EXTRACTION_HEDGING) a call still running
+    past a percentile of recent latencies is sent a second time and the first
+    answer wins, within the EXTRACTION_HEDGE_MAX_RATE budget.
+
+    deployment selects another Azure OpenAI deployment than OPENAI_DEPLOYMENT
+    (model cascade tiers); token counts of every attempt are added to `usage`.
+    """
+    # Use the prompt that's passed in directly instead of rebuilding it
+    if hasattr(prompt, "render"):
+        prompt = prompt.render()
+    if structured is None:
+        structured = STRUCTURED_OUTPUT_ENABLED
+    hedged = HEDGING_ENABLED if hedge is None else hedge
+
+    def run_agent(agent):
+        if hedged:
+            return _run_agent_hedged(agent, prompt, use_case, usage, deployment)
+        return _run_agent(agent, prompt, use_case, usage)
+    
+    free_text_agent = get_extraction_agent(deployment)
+    agent = free_text_agent
+    deployment_key = deployment or os.getenv("OPENAI_DEPLOYMENT")
+    if structured and columns and deployment_key not in _structured_unsupported:
+        agent = get_structured_agent(columns, instructions, deployment)
+    
+    full_text = ""
+    for attempt in range(PARSE_RETRIES + 1):
+        if attempt:
+            metrics.increment("extraction_parse_retries", use_case=use_case)
+        try:
+            full_text = await with_deadline(run_agent(agent), "extraction")
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            if agent is free_text_agent or not is_response_format_error(e):
+                raise
+            # Deployment rejected the response format: free text for this and every later call
+            logging.warning(f"Deployment {deployment_key} rejected the response format, using free text: {str(e)}")
+            metrics.increment("extraction_structured_fallbacks", use_case=use_case)
+            _structured_unsupported.add(deployment_key)
+            agent = free_text_agent
+            full_text = await with_deadline(run_agent(agent), "extraction")
+        
+        metrics.increment("extraction_parse_calls", use_case=use_case)
+        try:
+            data, repaired = parse_json_output(full_text)
+        except ValueError:
+            logging.warning(f"Extraction output is not valid JSON (attempt {attempt + 1})")
+            continue
+        if repaired:
+            metrics.increment("extraction_parse_repaired", use_case=use_case)
+        logging.debug(f"Agent Response: {full_text}")
+        return json.dumps(data, ensure_ascii=False)
+    
+    metrics.increment("extraction_parse_failures", use_case=use_case)
+    logging.debug(f"Agent Response: {full_text}")
     return full_text
@@ -0,0 +1,248 @@
+import os
+import re
+import json
+import logging
+from difflib import SequenceMatcher
+from dotenv import load_dotenv
+
+from structured_output import loads_extraction, quoted_phrases
+
+load_dotenv()
+
+# Minimum combined label-match x OCR confidence for a column to skip the LLM
+FAST_PATH_MIN_CONFIDENCE = float(os.getenv("FAST_PATH_MIN_CONFIDENCE", "0.85"))
+
+# Table cells have no per-pair confidence, so they are trusted slightly less than key-value pairs
+TABLE_CELL_CONFIDENCE = 0.9
+# "Label: value" lines of a PDF text layer are exact text, but the label/value split is a guess
+TEXT_LINE_CONFIDENCE = 0.9
+
+# Instructions asking for a transformation need the LLM, whatever the label says
+_COMPLEX_INSTRUCTION = re.compile(
+    r"\b(calculate|compute|sum|add up|total of|multiply|divide|convert|format|combine|concatenat\w*|"
+    r"derive|translate|summari[sz]e|unless|only when|otherwise|round|percentage|difference)\b",
+    re.IGNORECASE
+)
+_LABELLED_LINE = re.compile(r"^\s*([^\W\d_][^:\n]{0,60}?)\s*:\s*(\S[^\n]{0,200}?)\s*$", re.MULTILINE)
+
+
+def normalize_label(text):
+    """Lowercase, drop punctuation and collapse whitespace so labels compare on their words"""
+    text = re.sub(r"[^0-9a-z]+", " ", str(text or "").lower())
+    return " ".join(text.split())
+
+
+def label_similarity(column, label):
+    """
+    Score how well a document label names an Excel column (0-1).
+
+    Exact matches score 1.0; labels that contain every column word (e.g. column
+    "EIN" vs label "Employer identification number (EIN)") score 0.9 when the
+    label is not much longer; otherwise the character-level similarity is used.
+    """
+    col = normalize_label(column)
+    lab = normalize_label(label)
+    if not col or not lab:
+        return 0.0
+    if col == lab:
+        return 1.0
+
+    col_tokens = col.split()
+    lab_tokens = lab.split()
+    if set(col_tokens) <= set(lab_tokens) and len(lab_tokens) <= len(col_tokens) + 4:
+        return 0.9
+
+    return SequenceMatcher(None, col, lab).ratio()
+
+
+def _page_of(element):
+    regions = getattr(element, "bounding_regions", None) or []
+    return regions[0].page_number if regions else None
+
+
+def text_line_candidates(pages):
+    """
+    Collect (label, value) candidates from "Label: value" lines of page text.
+
+    Used for text-layer pages, which Document Intelligence never sees and so
+    have no key-value pairs of their own.
+
+    Args:
+        pages (list): [{"page_number", "content"}]
+
+    Returns:
+        list: dicts with label, value, confidence, source and page
+    """
+    candidates = []
+    for page in pages:
+        for label, value in _LABELLED_LINE.findall(page.get("content") or ""):
+            candidates.append({
+                "label": label,
+                "value": value,
+                "confidence": TEXT_LINE_CONFIDENCE,
+                "source": "text_layer",
+                "page": page.get("page_number"),
+            })
+    return candidates
+
+
+def collect_candidates(result):
+    """
+    Collect (label, value) candidates from an AnalyzeResult.
+
+    Sources are the key-value pairs and, for tables, two-column label/value rows
+    and header cells that sit above a single data row, plus any text_candidates
+    attached by hybrid ingest (see text_line_candidates).
+
+    Returns:
+        list: dicts with label, value, confidence, source and page
+    """
+    candidates = list(getattr(result, "text_candidates", None) or [])
+
+    for pair in getattr(result, "key_value_pairs", None) or []:
+        key = getattr(pair, "key", None)
+        value = getattr(pair, "value", None)
+        if not key or not value or not (value.content or "").strip():
+            continue
+        candidates.append({
+            "label": key.content,
+            "value": value.content.strip(),
+            "confidence": pair.confidence if pair.confidence is not None else 1.0,
+            "source": "key_value_pair",
+            "page": _page_of(key),
+        })
+
+    for table_index, table in enumerate(getattr(result, "tables", None) or []):
+        grid = {}
+        for cell in table.cells:
+            grid[(cell.row_index, cell.column_index)] = cell
+        page = _page_of(table)
+
+        for (row, col), cell in grid.items():
+            content = (cell.content or "").strip()
+            if not content:
+                continue
+
+            # Label in one cell, value in the next cell of the same row
+            right = grid.get((row, col + 1))
+            if col == 0 and table.column_count == 2 and right and (right.content or "").strip():
+                candidates.append({
+                    "label": content,
+                    "value": right.content.strip(),
+                    "confidence": TABLE_CELL_CONFIDENCE,
+                    "source": f"table_{table_index}_row",
+                    "page": page,
+                })
+
+            # Column header with exactly one data row beneath it
+            below = grid.get((row + 1, col))
+            if (getattr(cell, "kind", None) == "columnHeader" and table.row_count == row + 2
+                    and below and (below.content or "").strip()):
+                candidates.append({
+                    "label": content,
+                    "value": below.content.strip(),
+                    "confidence": TABLE_CELL_CONFIDENCE,
+                    "source": f"table_{table_index}_header",
+                    "page": page,
+                })
+
+    return candidates
+
+
+def match_columns(result, columns, instructions=None, min_confidence=None):
+    """
+    Fill Excel columns directly from Document Intelligence key-value pairs and tables.
+
+    A column is filled only when its best candidate clears `min_confidence` and no
+    candidate with a different value scores almost as well; columns whose
+    instruction asks for a transformation are always left to the LLM.
+
+    Args:
+        result (AnalyzeResult): Structured Document Intelligence result
+        columns (list): Excel column names
+        instructions (list, optional): Row-2 instructions aligned with columns
+        min_confidence (float, optional): Threshold. Defaults to FAST_PATH_MIN_CONFIDENCE
+
+    Returns:
+        dict: column -> {"value", "confidence", "source", "page"} for matched columns
+    """
+    if result is None:
+        return {}
+    min_confidence = FAST_PATH_MIN_CONFIDENCE if min_confidence is None else min_confidence
+    instructions = instructions or [""] * len(columns)
+    candidates = collect_candidates(result)
+    if not candidates:
+        return {}
+
+    matches = {}
+    for column, instruction in zip(columns, instructions):
+        if not column:
+            continue
+        instruction = str(instruction or "")
+        if _COMPLEX_INSTRUCTION.search(instruction):
+            continue
+
+        # The instruction may name the label to read, e.g. Take the value of 'Employer ID'
+        aliases = [column] + [phrase for phrase in quoted_phrases(instruction) if len(phrase) >= 2]
+
+        scored = []
+        for candidate in candidates:
+            label_score = max(label_similarity(alias, candidate["label"]) for alias in aliases)
+            scored.append((label_score * candidate["confidence"], candidate))
+        scored.sort(key=lambda item: item[0], reverse=True)
+
+        best_score, best = scored[0]
+        if best_score < min_confidence:
+            continue
+        # Ambiguous: another label matches nearly as well but disagrees on the value
+        if any(score >= best_score - 0.05 and other["value"] != best["value"] for score, other in scored[1:]):
+            logging.info(f"Fast path skipped ambiguous column '{column}'")
+            continue
+
+        matches[column] = {
+            "value": best["value"],
+            "confidence": round(best_score, 3),
+            "source": best["source"],
+            "page": best["page"],
+        }
+
+    return matches
+
+
+def remaining_columns(columns, instructions, matches):
+    """Columns (and their instructions) that still need the LLM"""
+    pairs = [(c, i) for c, i in zip(columns, instructions) if c not in matches]
+    return [c for c, _ in pairs], [i for _, i in pairs]
+
+
+def merge_fast_path(llm_output, matches, columns):
+    """
+    Merge fast-path values into the LLM's JSON output, in schema column order.
+
+    Args:
+        llm_output (str or None): JSON text from call_extraction_agent, None if the LLM was skipped
+        matches (dict): Output of match_columns
+        columns (list): Excel column names
+
+    Returns:
+        str: Merged JSON. If the LLM output cannot be parsed even tolerantly, the
+             fast-path values are still returned (the LLM was never asked for them)
+    """
+    if not matches:
+        return llm_output
+
+    llm_data = {}
+    if llm_output:
+        try:
+            llm_data = loads_extraction(llm_output)
+        except (ValueError, TypeError):
+            logging.warning("LLM output is not valid JSON; returning the fast-path values only")
+            llm_data = {}
+
+    merged = {}
+    for column in columns:
+        if column in matches:
+            merged[column] = matches[column]["value"]
+        elif column in llm_data:
+            merged[column] = llm_data[column]
+    return json.dumps(merged, ensure_ascii=False)
@@ -0,0 +1,256 @@
+import os
+import re
+import json
+import zlib
+import difflib
+import logging
+import threading
+from datetime import datetime
+from functools import lru_cache
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Directory of the persisted index; unset disables it
+FEEDBACK_INDEX_DIR = os.getenv("FEEDBACK_INDEX_DIR")
+# Hashed embedding width (changing it requires rebuilding the index)
+FEEDBACK_INDEX_DIM = int(os.getenv("FEEDBACK_INDEX_DIM", "1024"))
+# Past fixes added to the improvement agent's context
+FEEDBACK_INDEX_TOP_K = int(os.getenv("FEEDBACK_INDEX_TOP_K", "3"))
+# Minimum cosine similarity for a past fix to be considered related
+FEEDBACK_INDEX_MIN_SCORE = float(os.getenv("FEEDBACK_INDEX_MIN_SCORE", "0.35"))
+# Similarity above which new feedback is reported as already addressed
+FEEDBACK_ADDRESSED_THRESHOLD = float(os.getenv("FEEDBACK_ADDRESSED_THRESHOLD", "0.8"))
+# Longest prompt diff kept per entry
+PROMPT_DIFF_MAX_CHARS = 800
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def embed(text, dim=None):
+    """
+    Hashed bag-of-features embedding: words, word bigrams and character
+    trigrams (robust to typos and inflections), signed-hashed into `dim`
+    buckets and L2-normalized, so cosine similarity is a dot product.
+    crc32 keeps vectors stable across processes (unlike hash()).
+
+    Returns:
+        np.ndarray: float32 vector of length dim
+    """
+    dim = dim or FEEDBACK_INDEX_DIM
+    vector = np.zeros(dim, dtype=np.float32)
+    words = _TOKEN.findall((text or "").lower())
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f" {word} "
+        features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    if not features:
+        return vector
+    hashes = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in features), dtype=np.uint32, count=len(features))
+    signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+    np.add.at(vector, hashes % dim, signs)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def prompt_diff(old_prompt, new_prompt, max_chars=None):
+    """Lines the new prompt added or changed (the fix itself), truncated to max_chars"""
+    max_chars = max_chars or PROMPT_DIFF_MAX_CHARS
+    old_lines = (old_prompt or "").splitlines()
+    new_lines = (new_prompt or "").splitlines()
+    added = [
+        line[1:].strip() for line in difflib.unified_diff(old_lines, new_lines, lineterm="", n=0)
+        if line.startswith("+") and not line.startswith("+++") and line[1:].strip()
+    ]
+    text = "\n".join(added)
+    return text if len(text) <= max_chars else text[:max_chars].rstrip() + "..."
+
+
+class FeedbackIndex:
+    """
+    In-memory vector index over past reviewer feedback and the prompt changes
+    it produced.
+
+    Vectors live in one float32 matrix that grows by doubling, so add() is
+    amortized O(1) and search() is a single matrix-vector product. When a
+    directory is given, every add is appended to disk (raw float32 rows plus
+    a JSON line of metadata) and the index is reloaded from there on start.
+
+    Usage:
+        index = FeedbackIndex("/var/app/feedback_index")
+        index.add("Total is missing the currency", diff, use_case="Form 926", prompt_id=12)
+        index.search("currency symbol dropped from totals", use_case="Form 926")
+    """
+
+    def __init__(self, root_dir=None, dim=None):
+        self.root_dir = root_dir
+        self.dim = dim or FEEDBACK_INDEX_DIM
+        self.entries = []
+        self._prompt_ids = set()
+        self._vectors = np.zeros((16, self.dim), dtype=np.float32)
+        self._lock = threading.Lock()
+        if root_dir:
+            os.makedirs(root_dir, exist_ok=True)
+            self._load()
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def _vectors_path(self):
+        return os.path.join(self.root_dir, "vectors.f32")
+
+    @property
+    def _entries_path(self):
+        return os.path.join(self.root_dir, "entries.jsonl")
+
+    def _load(self):
+        if not os.path.exists(self._entries_path):
+            return
+        with open(self._entries_path, "r", encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        vectors = np.fromfile(self._vectors_path, dtype=np.float32) if os.path.exists(self._vectors_path) else np.zeros(0, np.float32)
+        rows = min(len(entries), vectors.size // self.dim)
+        if rows < len(entries) or vectors.size != rows * self.dim:
+            # Interrupted append or a different FEEDBACK_INDEX_DIM: re-embed from the metadata
+            logging.warning(f"Feedback index at {self.root_dir} is inconsistent; re-embedding {len(entries)} entries")
+            vectors = np.stack([embed(e["feedback"], self.dim) for e in entries]) if entries else np.zeros((0, self.dim), np.float32)
+            vectors.astype(np.float32).tofile(self._vectors_path)
+        self._reserve(len(entries))
+        self._vectors[:len(entries)] = vectors.reshape(-1, self.dim)[:len(entries)]
+        self.entries = entries
+        self._prompt_ids = {e["prompt_id"] for e in entries if e["prompt_id"] is not None}
+
+    def _reserve(self, rows):
+        if rows <= len(self._vectors):
+            return
+        grown = np.zeros((max(rows, 2 * len(self._vectors)), self.dim), dtype=np.float32)
+        grown[:len(self.entries)] = self._vectors[:len(self.entries)]
+        self._vectors = grown
+
+    def add(self, feedback, diff=None, use_case=None, prompt_id=None):
+        """
+        Index one piece of feedback and the prompt change that addressed it
+
+        Returns:
+            dict: The stored entry
+        """
+        entry = {
+            "feedback": feedback,
+            "diff": diff or "",
+            "use_case": use_case,
+            "prompt_id": str(prompt_id) if prompt_id is not None else None,
+            "created": datetime.now().isoformat(timespec="seconds"),
+        }
+        vector = embed(feedback, self.dim)
+        with self._lock:
+            self._reserve(len(self.entries) + 1)
+            self._vectors[len(self.entries)] = vector
+            self.entries.append(entry)
+            if entry["prompt_id"] is not None:
+                self._prompt_ids.add(entry["prompt_id"])
+            if self.root_dir:
+                with open(self._vectors_path, "ab") as f:
+                    f.write(vector.tobytes())
+                with open(self._entries_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        return entry
+
+    def has_prompt(self, prompt_id):
+        return str(prompt_id) in self._prompt_ids
+
+    def search(self, text, k=None, use_case=None, min_score=None):
+        """
+        Most similar past feedback
+
+        Args:
+            text (str): Feedback to look up
+            k (int, optional): Results to return. Defaults to FEEDBACK_INDEX_TOP_K
+            use_case (str, optional): Only entries of this use case
+            min_score (float, optional): Similarity cut-off. Defaults to FEEDBACK_INDEX_MIN_SCORE
+
+        Returns:
+            list: (score, entry) pairs, best first
+        """
+        k = k or FEEDBACK_INDEX_TOP_K
+        min_score = FEEDBACK_INDEX_MIN_SCORE if min_score is None else min_score
+        with self._lock:
+            count = len(self.entries)
+            if not count:
+                return []
+            scores = self._vectors[:count] @ embed(text, self.dim)
+            entries = self.entries[:count]
+        if use_case is not None:
+            scores = np.where([e["use_case"] == use_case for e in entries], scores, -1.0)
+        top = np.argpartition(-scores, min(k, count) - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), entries[i]) for i in top if scores[i] >= min_score]
+
+    def find_addressed(self, feedback, use_case=None, threshold=None):
+        """The past fix this feedback most likely repeats, or None"""
+        threshold = FEEDBACK_ADDRESSED_THRESHOLD if threshold is None else threshold
+        matches = self.search(feedback, k=1, use_case=use_case, min_score=threshold)
+        return matches[0] if matches else None
+
+    def sync_from_prompt_versions(self, versions):
+        """
+        Index feedback recorded in model_prompt_library that is not indexed yet
+
+        Args:
+            versions (list): Rows from DatabaseManager.get_prompt_versions (newest first)
+
+        Returns:
+            int: Entries added
+        """
+        added = 0
+        ordered = sorted(versions, key=lambda v: (v['CreatedTime'], v['PromptID']))
+        previous_text = {}
+        for version in ordered:
+            use_case = version.get('UseCase')
+            if version.get('FeedbackRequested') and not self.has_prompt(version['PromptID']):
+                self.add(
+                    version['FeedbackRequested'],
+                    prompt_diff(previous_text.get(use_case), version['PromptText']),
+                    use_case=use_case,
+                    prompt_id=version['PromptID']
+                )
+                added += 1
+            previous_text[use_case] = version['PromptText']
+        return added
+
+
+@lru_cache(maxsize=1)
+def get_default_feedback_index():
+    """The index configured by FEEDBACK_INDEX_DIR (shared per process), or None if disabled"""
+    if not FEEDBACK_INDEX_DIR:
+        return None
+    try:
+        return FeedbackIndex(FEEDBACK_INDEX_DIR)
+    except Exception as e:
+        logging.error(f"Feedback index initialization failed, past fixes disabled: {str(e)}")
+        return None
+
+
+def similar_past_fixes(feedback, use_case=None, k=None):
+    """Past (score, entry) fixes related to `feedback` from the default index ([] when disabled)"""
+    index = get_default_feedback_index()
+    if index is None:
+        return []
+    try:
+        return index.search(feedback, k=k, use_case=use_case)
+    except Exception as e:
+        logging.warning(f"Feedback index lookup failed: {str(e)}")
+        return []
+
+
+def record_fix(feedback, old_prompt, new_prompt, use_case=None, prompt_id=None):
+    """Add saved feedback and its prompt change to the default index (no-op when disabled)"""
+    index = get_default_feedback_index()
+    if index is None or not feedback:
+        return None
+    try:
+        return index.add(feedback, prompt_diff(old_prompt, new_prompt), use_case=use_case, prompt_id=prompt_id)
+    except Exception as e:
+        logging.warning(f"Could not index feedback: {str(e)}")
+        return None
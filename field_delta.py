@@ -0,0 +1,46 @@
+from structured_output import parse_extraction
+
+
+def parse_fields(extraction):
+    """
+    Extraction output as a dict, or None if it holds no JSON object.
+
+    Parsed tolerantly (code fences, commentary, trailing commas; see
+    structured_output.parse_extraction), so model output that is not strict
+    JSON is still stored as a delta; a delta rebuilds as plain JSON.
+    """
+    if extraction is None or extraction == "":
+        return None
+    return parse_extraction(extraction)
+
+
+def diff_fields(old, new):
+    """
+    Field-level delta that turns `old` into `new`
+
+    Args:
+        old (dict): Base extraction
+        new (dict): Target extraction
+
+    Returns:
+        dict: {"set": {field: new value}, "removed": [fields]} (both empty when equal)
+    """
+    old = old or {}
+    new = new or {}
+    return {
+        "set": {k: v for k, v in new.items() if k not in old or old[k] != v},
+        "removed": [k for k in old if k not in new],
+    }
+
+
+def apply_field_delta(base, delta):
+    """Apply a diff_fields delta to a copy of `base`, preserving field order"""
+    result = dict(base or {})
+    for key in delta.get("removed", []):
+        result.pop(key, None)
+    result.update(delta.get("set", {}))
+    return result
+
+
+def is_empty_delta(delta):
+    return not delta.get("set") and not delta.get("removed")
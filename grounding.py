@@ -0,0 +1,177 @@
+import os
+import re
+import calendar
+import numpy as np
+from dotenv import load_dotenv
+
+from metrics import metrics
+from structured_output import loads_extraction
+
+load_dotenv()
+
+# Share of a value's character trigrams that must appear on one page for it to count as grounded
+GROUNDING_MIN_SCORE = float(os.getenv("GROUNDING_MIN_SCORE", "0.85"))
+# Values this short (after normalization) need a whole-token match; trigrams say little about them
+GROUNDING_SHORT_VALUE_CHARS = 4
+
+_EMPTY_VALUES = {"n/a", "na", "none", "null", "not found", "not available", "-"}
+_MONTHS = {name.lower(): number for number, name in enumerate(calendar.month_name) if name}
+_MONTHS.update({name.lower(): number for number, name in enumerate(calendar.month_abbr) if name})
+_MONTH_NAMES = "|".join(sorted(_MONTHS, key=len, reverse=True))
+
+_ISO_DATE = re.compile(r"\b(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})\b")
+_NUMERIC_DATE = re.compile(r"\b(\d{1,2})[-/.](\d{1,2})[-/.](\d{4}|\d{2})\b")
+_MONTH_FIRST_DATE = re.compile(rf"\b({_MONTH_NAMES})\.?\s+(\d{{1,2}})(?:st|nd|rd|th)?,?\s+(\d{{4}})\b", re.IGNORECASE)
+_DAY_FIRST_DATE = re.compile(rf"\b(\d{{1,2}})(?:st|nd|rd|th)?\s+({_MONTH_NAMES})\.?,?\s+(\d{{4}})\b", re.IGNORECASE)
+_NUMBER = re.compile(r"(?<![\w.])\(?-?[$€£¥]?\s?(\d{1,3}(?:,\d{3})+|\d+)(\.\d+)?\)?%?(?![\w])")
+_NON_TOKEN = re.compile(r"[^0-9a-z.]+")
+_STRAY_DOT = re.compile(r"(?<!\d)\.|\.(?!\d)")
+
+
+def _iso(year, month, day):
+    year, month, day = int(year), int(month), int(day)
+    if year < 100:
+        year += 2000 if year < 70 else 1900
+    if not (1 <= month <= 12 and 1 <= day <= 31):
+        return None
+    return f"{year:04d}{month:02d}{day:02d}"
+
+
+def _numeric_date(match):
+    first, second, year = match.groups()
+    # Month first (US forms) unless the first part cannot be a month
+    month, day = (first, second) if int(first) <= 12 else (second, first)
+    return _iso(year, month, day) or match.group(0)
+
+
+def normalize_text(text):
+    """
+    Canonical form shared by extracted values and page text: dates become
+    yyyymmdd, numbers drop currency symbols, thousands separators and
+    trailing zeros ("$1,234.50" -> "1234.5"), everything else is lowercased
+    words separated by single spaces.
+    """
+    text = str(text or "")
+    text = _ISO_DATE.sub(lambda m: _iso(*m.groups()) or m.group(0), text)
+    text = _MONTH_FIRST_DATE.sub(lambda m: _iso(m.group(3), _MONTHS[m.group(1).lower()], m.group(2)), text)
+    text = _DAY_FIRST_DATE.sub(lambda m: _iso(m.group(3), _MONTHS[m.group(2).lower()], m.group(1)), text)
+    text = _NUMERIC_DATE.sub(_numeric_date, text)
+
+    def number(match):
+        integer = match.group(1).replace(",", "")
+        fraction = (match.group(2) or "").rstrip("0").rstrip(".")
+        return f" {integer.lstrip('0') or '0'}{fraction} "
+
+    text = _NUMBER.sub(number, text.lower())
+    text = _STRAY_DOT.sub(" ", _NON_TOKEN.sub(" ", text))
+    return " ".join(text.split())
+
+
+def _value_text(value):
+    """Scalar leaves of a value joined into one string (lists and nested objects included)"""
+    if isinstance(value, dict):
+        return " ".join(_value_text(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return " ".join(_value_text(v) for v in value)
+    return "" if value is None else str(value)
+
+
+def _trigrams(text):
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def verify_grounding(extraction, pages, columns=None, min_score=None):
+    """
+    Check that every extracted value actually appears in the document.
+
+    Values and pages are normalized the same way (see normalize_text), then
+    scored by trigram containment: the share of a value's character trigrams
+    found on a page. All fields are scored against all pages in one
+    fields x pages matrix product. A verbatim match on a page scores 1.0;
+    very short values only count when they appear as a whole token.
+
+    Args:
+        extraction (str | dict): Extraction output (JSON text or parsed)
+        pages (list): [{"page_number", "content"}] as produced by ingest
+        columns (list, optional): Columns to check. Defaults to every key of the extraction
+        min_score (float, optional): Grounded threshold. Defaults to GROUNDING_MIN_SCORE
+
+    Returns:
+        dict: {column: {"value", "score", "page", "status"}} in column order, status being
+              "grounded", "ungrounded" or "empty" (nothing to verify); score and page
+              are None for empty values
+    """
+    min_score = GROUNDING_MIN_SCORE if min_score is None else min_score
+    if isinstance(extraction, str):
+        try:
+            extraction = loads_extraction(extraction)
+        except ValueError:
+            return {}
+    if not isinstance(extraction, dict):
+        return {}
+    columns = list(extraction) if columns is None else [c for c in columns if c in extraction]
+
+    report = {}
+    values = {}
+    for column in columns:
+        raw = _value_text(extraction[column]).strip()
+        normalized = normalize_text(raw)
+        if not normalized or raw.lower() in _EMPTY_VALUES:
+            report[column] = {"value": extraction[column], "score": None, "page": None, "status": "empty"}
+        else:
+            values[column] = normalized
+            report[column] = None
+
+    if values:
+        page_texts = [normalize_text(page.get("content", "")) for page in pages]
+        page_numbers = [page.get("page_number", index + 1) for index, page in enumerate(pages)]
+        field_names = list(values)
+
+        # Vocabulary of the values' trigrams only; pages are projected onto it
+        vocabulary = {}
+        field_grams = []
+        for column in field_names:
+            grams = _trigrams(values[column])
+            field_grams.append([vocabulary.setdefault(gram, len(vocabulary)) for gram in grams])
+        field_matrix = np.zeros((len(field_names), len(vocabulary)), dtype=np.float32)
+        for row, indices in enumerate(field_grams):
+            field_matrix[row, indices] = 1.0
+        page_matrix = np.zeros((len(page_texts), len(vocabulary)), dtype=np.float32)
+        for row, text in enumerate(page_texts):
+            present = [vocabulary[gram] for gram in _trigrams(text) if gram in vocabulary]
+            page_matrix[row, present] = 1.0
+
+        if len(page_texts):
+            scores = (field_matrix @ page_matrix.T) / np.maximum(field_matrix.sum(axis=1, keepdims=True), 1.0)
+        else:
+            scores = np.zeros((len(field_names), 0), dtype=np.float32)
+
+        padded_pages = [f" {text} " for text in page_texts]
+        for row, column in enumerate(field_names):
+            value = values[column]
+            exact = np.array([f" {value} " in page if len(value) <= GROUNDING_SHORT_VALUE_CHARS else value in page
+                              for page in padded_pages], dtype=bool)
+            if len(value) <= GROUNDING_SHORT_VALUE_CHARS:
+                scores[row] = exact.astype(np.float32)
+            else:
+                scores[row] = np.where(exact, 1.0, scores[row])
+            best = int(np.argmax(scores[row])) if scores.shape[1] else None
+            score = round(float(scores[row, best]), 3) if best is not None else 0.0
+            report[column] = {
+                "value": extraction[column],
+                "score": score,
+                "page": page_numbers[best] if best is not None and score > 0 else None,
+                "status": "grounded" if score >= min_score else "ungrounded",
+            }
+
+    for status in ("grounded", "ungrounded", "empty"):
+        count = sum(1 for entry in report.values() if entry["status"] == status)
+        if count:
+            metrics.increment("grounding_fields", count, status=status)
+    return report
+
+
+def ungrounded_columns(report):
+    """Columns whose value was not found in the document (candidates for targeted re-extraction)"""
+    return [column for column, entry in report.items() if entry["status"] == "ungrounded"]
@@ -0,0 +1,121 @@
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from dotenv import load_dotenv
+
+from metrics import metrics
+
+load_dotenv()
+
+# Send a duplicate request once the first has run longer than this percentile of recent latencies
+HEDGE_PERCENTILE = float(os.getenv("EXTRACTION_HEDGE_PERCENTILE", "0.95"))
+# Most hedges per recent call (0.1 = at most one extra request per ten calls)
+HEDGE_MAX_RATE = float(os.getenv("EXTRACTION_HEDGE_MAX_RATE", "0.1"))
+# Latencies needed before hedging starts (the percentile is meaningless before that)
+HEDGE_MIN_SAMPLES = int(os.getenv("EXTRACTION_HEDGE_MIN_SAMPLES", "20"))
+# Recent calls the latency percentile and the hedge rate are computed over
+HEDGE_WINDOW = int(os.getenv("EXTRACTION_HEDGE_WINDOW", "200"))
+
+
+class HedgePolicy:
+    """
+    When to hedge: the delay (a percentile of a sliding window of observed
+    latencies) and a budget that keeps hedges under max_rate of recent calls,
+    so a slow provider is not hit with twice the load.
+    """
+
+    def __init__(self, percentile=None, max_rate=None, min_samples=None, window=None):
+        self.percentile = HEDGE_PERCENTILE if percentile is None else percentile
+        self.max_rate = HEDGE_MAX_RATE if max_rate is None else max_rate
+        self.min_samples = HEDGE_MIN_SAMPLES if min_samples is None else min_samples
+        window = window or HEDGE_WINDOW
+        self._latencies = deque(maxlen=window)
+        self._calls = deque(maxlen=window)   # True where the call was hedged
+        self._lock = threading.Lock()
+
+    def record_latency(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def delay(self):
+        """Seconds to wait before hedging, or None while there are too few samples"""
+        with self._lock:
+            if len(self._latencies) < max(self.min_samples, 1):
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(self.percentile * len(ordered)))]
+
+    def start_call(self):
+        with self._lock:
+            self._calls.append(False)
+
+    def try_hedge(self):
+        """Claim a hedge if the recent hedge rate allows one"""
+        with self._lock:
+            if not self._calls or sum(self._calls) + 1 > self.max_rate * len(self._calls):
+                return False
+            # Only the number of hedged calls in the window matters, not which ones
+            try:
+                self._calls.remove(False)
+            except ValueError:
+                return False
+            self._calls.append(True)
+            return True
+
+
+async def _finish(tasks):
+    for task in tasks:
+        if not task.done():
+            task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def run_hedged(make_call, policy, use_case=None):
+    """
+    Run make_call(); if it is still running after policy.delay(), start a second
+    make_call() and return whichever succeeds first. The other one is cancelled.
+    If one attempt fails the other is still awaited; if both fail the first
+    attempt's error is raised.
+
+    Records extraction_hedges_issued / extraction_hedges_won{use_case}.
+
+    Args:
+        make_call (callable): Returns a new coroutine per attempt
+        policy (HedgePolicy): Delay and rate budget (updated with the winner's latency and,
+            when the hedge wins, the cancelled primary's elapsed time as a lower bound)
+
+    Returns:
+        tuple: (result, index of the winning attempt: 0 primary, 1 hedge)
+    """
+    policy.start_call()
+    delay = policy.delay()
+    started = [time.perf_counter()]
+    tasks = [asyncio.ensure_future(make_call())]
+    try:
+        if delay is not None:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and policy.try_hedge():
+                metrics.increment("extraction_hedges_issued", use_case=use_case)
+                started.append(time.perf_counter())
+                tasks.append(asyncio.ensure_future(make_call()))
+
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    winner = tasks.index(task)
+                    now = time.perf_counter()
+                    policy.record_latency(now - started[winner])
+                    if winner:
+                        metrics.increment("extraction_hedges_won", use_case=use_case)
+                        if not tasks[0].done():
+                            # The slow primary is cancelled; its time so far is a lower bound of its
+                            # latency, and leaving it out would pull the hedge delay down over time
+                            policy.record_latency(now - started[0])
+                    return task.result(), winner
+        raise tasks[0].exception()
+    finally:
+        await _finish(tasks)
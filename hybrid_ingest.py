@@ -0,0 +1,206 @@
+import os
+import re
+import atexit
+import logging
+import threading
+from types import SimpleNamespace
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+from PyPDF2 import PdfReader
+
+from document_intelligence import analyze_document, iter_result_pages, slim_result
+from pdf_source import PdfSource, ingest_budget, track_peak_memory, INGEST_MEMORY_FACTOR
+from metrics import metrics
+from fast_path import text_line_candidates
+
+load_dotenv()
+
+# "hybrid": text layer where it is good, Document Intelligence for the rest; "ocr": every page through DI
+INGEST_MODE = os.getenv("INGEST_MODE", "hybrid").lower()
+# Pages scoring below this go to Document Intelligence
+TEXT_LAYER_MIN_QUALITY = float(os.getenv("TEXT_LAYER_MIN_QUALITY", "0.6"))
+# Pages with less text than this are treated as scanned (image-only or a stray header)
+TEXT_LAYER_MIN_CHARS = int(os.getenv("TEXT_LAYER_MIN_CHARS", "40"))
+# Worker processes for text-layer extraction (0 = extract in-process)
+TEXT_LAYER_WORKERS = int(os.getenv("TEXT_LAYER_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Smaller documents are extracted in-process; the pool only pays off for longer ones
+TEXT_LAYER_PARALLEL_MIN_PAGES = 8
+
+_CID_GLYPH = re.compile(r"\(cid:\d+\)")
+_WORD = re.compile(r"[^\W\d_]{2,}")
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    # One pool per process, created on first use and shut down at exit
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=TEXT_LAYER_WORKERS)
+            atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+        return _pool
+
+
+def _extract_range(pdf_path, start, stop):
+    """
+    Text layer of pages [start, stop) (runs in a worker process; PdfReader
+    objects do not pickle, so each worker maps the file itself)
+    """
+    texts = []
+    with PdfSource(pdf_path) as source, source.open() as stream:
+        reader = PdfReader(stream)
+        for index in range(start, stop):
+            try:
+                texts.append(reader.pages[index].extract_text() or "")
+            except Exception as e:
+                logging.warning(f"Text layer extraction failed on page {index + 1}: {str(e)}")
+                texts.append("")
+    return texts
+
+
+def extract_page_texts(source, workers=None):
+    """
+    Text layer of every page, in page order.
+
+    Pages are split into one contiguous range per worker process, so each
+    worker parses the PDF once; workers receive the file path, not its bytes.
+
+    Args:
+        source (PdfSource): Opened PDF source
+        workers (int, optional): Worker processes. Defaults to TEXT_LAYER_WORKERS
+
+    Returns:
+        list: Page texts ("" for pages without a text layer)
+    """
+    with source.open() as stream:
+        page_count = len(PdfReader(stream).pages)
+    workers = TEXT_LAYER_WORKERS if workers is None else workers
+    if workers <= 1 or page_count < TEXT_LAYER_PARALLEL_MIN_PAGES:
+        return _extract_range(source.path, 0, page_count)
+
+    pool = _get_pool()
+    step = -(-page_count // workers)
+    futures = [
+        pool.submit(_extract_range, source.path, start, min(start + step, page_count))
+        for start in range(0, page_count, step)
+    ]
+    texts = []
+    for future in futures:
+        texts.extend(future.result())
+    return texts
+
+
+def text_quality(text):
+    """
+    Score a page's text layer from 0 (unusable) to 1 (clean).
+
+    Low scores come from near-empty pages (scans), undecodable glyphs
+    ("(cid:12)", U+FFFD) and letter soup from broken font encodings, where
+    letters do not form words.
+    """
+    stripped = (text or "").strip()
+    if len(stripped) < TEXT_LAYER_MIN_CHARS:
+        return 0.0
+
+    garbage = stripped.count("�") + sum(len(m) for m in _CID_GLYPH.findall(stripped))
+    unprintable = sum(1 for ch in stripped if not ch.isprintable() and ch not in "\n\t")
+    clean_ratio = max(0.0, 1 - (garbage + unprintable) / len(stripped))
+
+    letters = sum(1 for ch in stripped if ch.isalpha())
+    if not letters:
+        return 0.0
+    words = _WORD.findall(stripped)
+    word_ratio = sum(len(w) for w in words) / letters
+    avg_word_length = sum(len(w) for w in words) / len(words) if words else 0
+    length_factor = 1.0 if 2.5 <= avg_word_length <= 15 else 0.5
+
+    return round(min(1.0, clean_ratio * word_ratio * length_factor), 3)
+
+
+def _page_ranges(page_numbers):
+    """[1, 2, 3, 7] -> "1-3,7" (Document Intelligence `pages` syntax)"""
+    ranges = []
+    for number in sorted(page_numbers):
+        if ranges and number == ranges[-1][1] + 1:
+            ranges[-1][1] = number
+        else:
+            ranges.append([number, number])
+    return ",".join(f"{a}-{b}" if a != b else str(a) for a, b in ranges)
+
+
+def hybrid_ingest(pdf_input, min_quality=None, mode=None):
+    """
+    Page text for a PDF, using the local text layer where it is good enough
+    and Document Intelligence only for scanned or low-quality pages.
+
+    The PDF is read from disk through a memory map (uploads are spooled to a
+    temporary file first), Document Intelligence output is consumed page by
+    page, and the ingest waits for room in the process-wide memory budget
+    (INGEST_MEMORY_BUDGET_MB) before it starts.
+
+    Args:
+        pdf_input: File path, bytes or a binary file-like object (e.g. a Streamlit upload)
+        min_quality (float, optional): Text-layer threshold. Defaults to TEXT_LAYER_MIN_QUALITY
+        mode (str, optional): "hybrid" or "ocr". Defaults to INGEST_MODE
+
+    Returns:
+        tuple: (pages, analyze_result)
+            pages: [{"page_number", "content", "source", "quality"}] in page order,
+                   source being "text_layer" or "ocr"
+            analyze_result: Key-value pairs and tables of the OCR'd pages (see
+                   slim_result) for the fast path, with "Label: value" lines of
+                   the text-layer pages as text_candidates (see text_line_candidates)
+    """
+    mode = (mode or INGEST_MODE).lower()
+    min_quality = TEXT_LAYER_MIN_QUALITY if min_quality is None else min_quality
+
+    with PdfSource(pdf_input) as source, \
+            ingest_budget.reserve(source.size * INGEST_MEMORY_FACTOR), \
+            track_peak_memory("ingest") as peak:
+        texts = []
+        if mode != "ocr":
+            try:
+                texts = extract_page_texts(source)
+            except Exception as e:
+                # Unreadable by PyPDF2 (encrypted, malformed): Document Intelligence gets the whole file
+                logging.warning(f"Text layer unavailable, using Document Intelligence for all pages: {str(e)}")
+
+        if not texts:
+            result = analyze_document(source.path)
+            pages = [dict(page, source="ocr", quality=None) for page in iter_result_pages(result)]
+            metrics.increment("ingest_pages", len(pages), source="ocr")
+            return pages, slim_result(result)
+
+        pages = {}
+        ocr_numbers = []
+        for number, text in enumerate(texts, start=1):
+            quality = text_quality(text)
+            if quality >= min_quality:
+                pages[number] = {"page_number": number, "content": text, "source": "text_layer", "quality": quality}
+            else:
+                ocr_numbers.append(number)
+                pages[number] = {"page_number": number, "content": text, "source": "ocr", "quality": quality}
+        del texts
+
+        result = None
+        if ocr_numbers:
+            result = analyze_document(source.path, pages=_page_ranges(ocr_numbers))
+            for page in iter_result_pages(result):
+                if page["page_number"] in pages:
+                    pages[page["page_number"]]["content"] = page["content"]
+            result = slim_result(result)
+        # Text-layer pages never reach Document Intelligence, so their fast-path candidates come from the text
+        result = result or SimpleNamespace(key_value_pairs=None, tables=None)
+        result.text_candidates = text_line_candidates(
+            [page for page in pages.values() if page["source"] == "text_layer"]
+        )
+
+    metrics.increment("ingest_pages", len(pages) - len(ocr_numbers), source="text_layer")
+    metrics.increment("ingest_pages", len(ocr_numbers), source="ocr")
+    logging.info(
+        f"Hybrid ingest: {len(pages) - len(ocr_numbers)} text-layer page(s), {len(ocr_numbers)} OCR page(s)"
+        + (f", peak {peak['peak_bytes'] / 1024 / 1024:.1f} MB" if peak["peak_bytes"] is not None else "")
+    )
+    return [pages[number] for number in sorted(pages)], result
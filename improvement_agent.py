@@ -3,9 +3,13 @@ from google.adk.models.lite_llm import LiteLlm
 from google.genai import types
 import json
 import os
+import asyncio
 from dotenv import load_dotenv
 from google.adk.sessions import InMemorySessionService
 from google.adk.runners import Runner
+from feedback_index import similar_past_fixes
+from deadline import with_deadline
+from prompt_compaction import PROMPT_MAX_CHARS, compact_prompt
 
 load_dotenv()
 
@@ -29,15 +33,47 @@ improvement_agent = LlmAgent(
     """
 )
 
-async def call_improvement_agent(original_extraction, feedback_text, previous_prompt):
+# Revision strategies used to diversify speculative candidates
+CANDIDATE_STRATEGIES = [
+    "Make the smallest change to the original prompt that fully addresses the feedback.",
+    "Add explicit, field-specific rules for every column the feedback mentions, including where to find each value and how to format it.",
+    "Restructure the prompt into a clear numbered rule list that resolves the feedback and removes any ambiguity that could have caused the error.",
+    "Add a short self-check step the extractor must apply before answering, targeted at the kind of mistake described in the feedback.",
+    "Rewrite the affected instructions from scratch, keeping unrelated instructions unchanged.",
+]
+
+def format_past_fixes(past_fixes):
+    """Context section listing earlier feedback and the prompt changes that addressed it"""
+    lines = ["Similar feedback from earlier reviews and the prompt changes that addressed it "
+             "(reuse what applies instead of re-deriving it; keep the new prompt consistent with these fixes):"]
+    for number, (score, entry) in enumerate(past_fixes, start=1):
+        lines.append(f"{number}. Feedback: {entry['feedback']}")
+        if entry.get('diff'):
+            lines.append("   Prompt change:\n   " + entry['diff'].replace("\n", "\n   "))
+    return "\n".join(lines)
+
+async def call_improvement_agent(original_extraction, feedback_text, previous_prompt, strategy=None,
+                                 use_case=None, past_fixes=None):
+    # Only the reusable template is revised; never resend the document payload
+    if hasattr(previous_prompt, "template"):
+        previous_prompt = previous_prompt.template
+    # Most similar past fixes from the local feedback index (FEEDBACK_INDEX_DIR); [] when disabled
+    if past_fixes is None:
+        past_fixes = similar_past_fixes(feedback_text, use_case=use_case)
     context = (
         f"Previous Extraction JSON:\n{original_extraction}\n"
         f"User Feedback:\n{feedback_text}\n"
         f"Original Prompt:\n{previous_prompt}\n\n"
         "Based on the feedback above, generate an improved extraction prompt template that addresses the user's concerns. "
         "Output ONLY the improved prompt template/instructions - do NOT include any PDF content, document text, or specific data. "
-        "Focus on the extraction instructions, format specifications, and any new requirements from the feedback."
+        "Focus on the extraction instructions, format specifications, and any new requirements from the feedback. "
+        f"Keep the prompt under {PROMPT_MAX_CHARS} characters: rewrite or merge the existing rules a change affects "
+        "instead of appending new rules that repeat or contradict them."
     )
+    if past_fixes:
+        context += f"\n\n{format_past_fixes(past_fixes)}"
+    if strategy:
+        context += f"\n\nRevision strategy: {strategy}"
     content = types.Content(role='user', parts=[types.Part(text=context)])
 
     temp_service = InMemorySessionService()
@@ -49,28 +85,50 @@ async def call_improvement_agent(original_extraction, feedback_text, previous_pr
     runner = Runner(app_name="improver", agent=improvement_agent, session_service=temp_service)
     gen = runner.run_async(user_id=session.user_id, session_id=session.id, new_message=content)
     
-    response_text = ""
-    async for res in gen:
-        # extract cleaned text just like before
-        parts = []
-        if hasattr(res, "content") and hasattr(res.content, "parts"):
-            for part in res.content.parts:
-                if hasattr(part, "text"):
-                    parts.append(part.text)
-        response_text += "\n".join(parts)
+    async def collect():
+        text = ""
+        async for res in gen:
+            # extract cleaned text just like before
+            parts = []
+            if hasattr(res, "content") and hasattr(res.content, "parts"):
+                for part in res.content.parts:
+                    if hasattr(part, "text"):
+                        parts.append(part.text)
+            text += "\n".join(parts)
+        return text
     
-    response_text = response_text.strip()
+    # Cancelled (with the model call) when the request's deadline runs out
+    response_text = (await with_deadline(collect(), "improvement")).strip()
     
     # Try to parse as JSON first
     try:
         json_data = json.loads(response_text)
         if isinstance(json_data, dict) and 'Prompt Title' in json_data and 'Prompt' in json_data:
-            return response_text  # Return JSON string directly
+            # Rules repeated word for word are dropped; rewriting superseded rules is left to the instruction above
+            if isinstance(json_data['Prompt'], str):
+                json_data['Prompt'] = compact_prompt(json_data['Prompt'])
+            return json.dumps(json_data, ensure_ascii=False)
     except json.JSONDecodeError:
         pass  # Not valid JSON, continue with fallback
         
     # If not valid JSON with required fields, wrap the text in our own JSON structure
     return json.dumps({
         "Prompt Title": "Improved Prompt",
-        "Prompt": response_text
+        "Prompt": compact_prompt(response_text)
     })
+
+async def generate_candidate_prompts(original_extraction, feedback_text, previous_prompt, n=3, use_case=None):
+    """Generate n improved prompts concurrently, each with a different revision strategy.
+    Failed candidates are dropped; raises only if every candidate failed."""
+    strategies = [CANDIDATE_STRATEGIES[i % len(CANDIDATE_STRATEGIES)] for i in range(n)]
+    # One index lookup shared by every candidate
+    past_fixes = similar_past_fixes(feedback_text, use_case=use_case)
+    results = await asyncio.gather(*(
+        call_improvement_agent(original_extraction, feedback_text, previous_prompt, strategy=strategy,
+                               past_fixes=past_fixes)
+        for strategy in strategies
+    ), return_exceptions=True)
+    prompts = [r for r in results if not isinstance(r, Exception)]
+    if not prompts:
+        raise results[0]
+    return prompts
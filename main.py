@@ -1,19 +1,44 @@
 import streamlit as st
 import pandas as pd
-from PyPDF2 import PdfReader
-from openpyxl import load_workbook
 import asyncio
-from extraction_agent import call_extraction_agent
+from extraction_agent import call_extraction_agent, get_prompt_cache_stats, get_parse_stats, get_hedge_stats, HEDGING_ENABLED
+from structured_output import loads_extraction
 from improvement_agent import call_improvement_agent
-from document_intelligence import doc_intelligence
+from document_intelligence import pages_to_content
+from hybrid_ingest import hybrid_ingest
+from fast_path import match_columns, remaining_columns, merge_fast_path
+from speculative import NoUsableCandidate, run_speculative_improvement
+from delta_extraction import affected_columns, relevant_pages, merge_delta
+from prompt_builder import DEFAULT_PROMPT_TEMPLATE, build_extraction_prompt, prompt_text_from_improvement
 import json
 import io
 import os
 import getpass
+import hashlib
+import functools
+import logging
 from datetime import datetime
-from database import DatabaseManager, get_latest_prompt, save_improved_prompt
+from database import get_storage_backend, get_latest_prompt, save_improved_prompt, PRIORITY_INTERACTIVE
+from session_history import HistoryStore
+from payload_store import get_default_payload_store
+from excel_schema import read_excel_schema
+from rerun_timing import RerunTimer
+from metrics import metrics
+from feedback_index import get_default_feedback_index
+from grounding import verify_grounding, ungrounded_columns
+from cascade import CASCADE_TIERS, run_cascade, get_cascade_stats
+from prompt_compaction import PROMPT_MAX_CHARS, compact_prompt
+from deadline import Deadline, DeadlineExceeded, DEADLINE_DOCUMENT_SECONDS, TIMED_OUT_STATUS, deadline_scope, with_deadline
 
 st.set_page_config(page_title="Document Extraction Feedback", layout="wide")
+rerun_timer = RerunTimer("app")
+
+# Active prompts are re-read at most this often (saving or refreshing a prompt clears the cache)
+PROMPT_CACHE_TTL_SECONDS = 300
+# Completed runs kept for the rerun timing panel
+RERUN_TIMING_HISTORY = 20
+# Saved prompts scanned for feedback missing from the feedback index on startup
+FEEDBACK_INDEX_SYNC_LIMIT = 500
 st.sidebar.title("Upload Section (Mandatory)")
 
 with st.sidebar.form("file_upload_form"):
@@ -36,7 +61,8 @@ else:
     st.session_state['use_case'] = use_case
 
 if "feedback_log" not in st.session_state:
-    st.session_state.feedback_log = []
+    # Bounded ring buffer of compact entries; full extractions are rebuilt on demand
+    st.session_state.feedback_log = HistoryStore(payload_store=get_default_payload_store())
 if "last_extraction" not in st.session_state:
     st.session_state['last_extraction'] = None
 if "last_prompt" not in st.session_state:
@@ -53,10 +79,11 @@ if "current_prompt_id" not in st.session_state:
     st.session_state['current_prompt_id'] = None
 if "document_id" not in st.session_state:
     st.session_state['document_id'] = None
-if "document_versions" not in st.session_state:
-    st.session_state['document_versions'] = []
-if "current_document_id" not in st.session_state:
-    st.session_state['current_document_id'] = None
+# Version the current extraction was stored as ({'VersionID', 'VersionNumber'}); lineage lives in document_version
+if "base_version" not in st.session_state:
+    st.session_state['base_version'] = None
+if "current_version" not in st.session_state:
+    st.session_state['current_version'] = None
 
 # Detect and store a local user id for local runs (used as user_id in DB operations)
 if 'user_id' not in st.session_state:
@@ -80,42 +107,111 @@ if 'user_id' not in st.session_state:
 
 st.title("Document Extraction Feedback + Prompt Refinement")
 
-def extract_text_from_pdf(pdf_file):
-    # Get file content as bytes and pass directly to doc_intelligence function
-    file_content = pdf_file.getvalue()
+@st.cache_resource(show_spinner="🔎 Reading PDF...", max_entries=16)
+def extract_text_from_pdf(pdf_key, _pdf_file):
+    # Cached per file content (pdf_key) for the server process, so reruns and repeat uploads skip OCR.
+    # cache_resource rather than cache_data: the pages and AnalyzeResult are shared (callers only read them), not pickled.
+    # The upload is spooled to disk and memory-mapped by hybrid_ingest rather than copied with getvalue().
 
-    # Use doc_intelligence function to extract text with Azure Document Intelligence
-    extracted_content = doc_intelligence(file_content)
+    # Local text layer for born-digital pages, Azure Document Intelligence only for scanned/low-quality
+    # pages; the structured result (OCR'd pages only) feeds the key-value/table fast path
+    # Document Intelligence polling is bounded by the OCR share of a fresh document budget
+    with deadline_scope():
+        pages, analyze_result = hybrid_ingest(_pdf_file)
     
-    return extracted_content
+    return pages, analyze_result
 
-def read_excel_schema(excel_file):
-    wb = load_workbook(excel_file)
-    ws = wb.active
-    columns = [cell.value for cell in ws[1]]
-    
-    # Check if second row exists and has data
-    instructions = []
-    if ws.max_row >= 2:
-        # Check if second row has any non-empty cells
-        second_row_values = [cell.value for cell in ws[2]]
-        if any(value is not None and str(value).strip() for value in second_row_values):
-            instructions = second_row_values
-        else:
-            # If second row is empty, use empty strings as placeholders
-            instructions = ["" for _ in columns]
-    else:
-        # If no second row exists, use empty strings as placeholders
-        instructions = ["" for _ in columns]
-    
-    return columns, instructions
+def run_with_deadline(coro, stage, deadline):
+    """
+    asyncio.run a model call under `deadline` (shared by the calls of one user action).
+    When it runs out the call is cancelled, the document is marked TimedOut and the script run stops.
+    With stage None the coroutine gets no stage timeout of its own: the deadline is only
+    made current for the stages it runs (e.g. the model cascade, which keeps earlier tiers' values).
+    """
+    try:
+        with deadline_scope(deadline):
+            return asyncio.run(with_deadline(coro, stage) if stage else coro)
+    except DeadlineExceeded as e:
+        if st.session_state.get('db_manager') and st.session_state.get('document_id'):
+            try:
+                st.session_state['db_manager'].update_document_master_by_id(
+                    document_id=st.session_state['document_id'],
+                    extraction_status=TIMED_OUT_STATUS,
+                    error_message=f"Streamlit {stage or e.stage} timed out: {str(e)}"
+                )
+            except Exception as db_e:
+                logging.error(f"Could not record timeout: {str(db_e)}")
+        st.error(f"⏱️ {str(e)}. Please try again.")
+        st.stop()
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def load_excel_schema(excel_content):
+    """read_excel_schema cached per workbook content"""
+    return read_excel_schema(excel_content)
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def fast_path_columns(pdf_key, columns, instructions, _analyze_result):
+    """Fast-path matches and the columns left for the LLM, cached per document and schema"""
+    matches = match_columns(_analyze_result, columns, instructions)
+    llm_columns, llm_instructions = remaining_columns(columns, instructions, matches)
+    return matches, llm_columns, llm_instructions
+
+@st.cache_resource(show_spinner=False)
+def get_database_manager():
+    """
+    One storage backend (STORAGE_BACKEND) per server process (every call opens its own connection).
+    Raises when the connection test fails, so the failure is not cached and the next run retries.
+    """
+    db_manager = get_storage_backend()
+    if not db_manager.test_connection():
+        raise ConnectionError("Database connection failed")
+    return db_manager
 
+@st.cache_resource(show_spinner=False)
+def sync_feedback_index(_db_manager):
+    """Index feedback saved in model_prompt_library before the index existed (once per process)"""
+    feedback_index = get_default_feedback_index()
+    if feedback_index is None:
+        return 0
+    try:
+        return feedback_index.sync_from_prompt_versions(_db_manager.get_prompt_versions(None, limit=FEEDBACK_INDEX_SYNC_LIMIT))
+    except Exception as e:
+        logging.warning(f"Feedback index sync failed: {str(e)}")
+        return 0
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def check_grounding(extraction, pdf_key, _pdf_pages):
+    """Grounding report of an extraction against the document's pages (no LLM call)"""
+    return verify_grounding(extraction, _pdf_pages)
+
+@st.cache_data(ttl=PROMPT_CACHE_TTL_SECONDS, show_spinner=False)
+def load_active_prompt(use_case):
+    """get_latest_prompt cached briefly; call load_active_prompt.clear() after the active prompt changes"""
+    return get_latest_prompt(use_case)
+
+def record_rerun_timing(timing):
+    timings = st.session_state.setdefault('rerun_timings', [])
+    timings.append(timing)
+    del timings[:-RERUN_TIMING_HISTORY]
+
+def timed_fragment(func):
+    """st.fragment whose runs are recorded in the rerun timing panel"""
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        timer = RerunTimer(func.__name__)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            record_rerun_timing(timer.finish())
+    return st.fragment(run)
+
+@st.cache_data(show_spinner=False, max_entries=64)
 def json_to_excel(json_data, columns):
     """Convert JSON data to Excel format and return as bytes"""
     try:
-        # Parse JSON if it's a string
+        # Parse JSON if it's a string (tolerates code fences/commentary around the object)
         if isinstance(json_data, str):
-            data = json.loads(json_data)
+            data = loads_extraction(json_data)
         else:
             data = json_data
         
@@ -137,7 +233,7 @@ def json_to_excel(json_data, columns):
         
         return output.getvalue()
     
-    except json.JSONDecodeError:
+    except (json.JSONDecodeError, ValueError):
         # If JSON parsing fails, create a simple error sheet
         error_df = pd.DataFrame({"Error": ["Invalid JSON format in extracted data"]})
         output = io.BytesIO()
@@ -145,12 +241,13 @@ def json_to_excel(json_data, columns):
             error_df.to_excel(writer, index=False, sheet_name='Error')
         return output.getvalue()
 
+@st.cache_data(show_spinner=False, max_entries=64)
 def json_to_dataframe(json_data, columns):
     """Convert JSON extraction data to DataFrame for display"""
     try:
-        # Parse JSON if it's a string
+        # Parse JSON if it's a string (tolerates code fences/commentary around the object)
         if isinstance(json_data, str):
-            data = json.loads(json_data)
+            data = loads_extraction(json_data)
         else:
             data = json_data
         
@@ -167,7 +264,7 @@ def json_to_dataframe(json_data, columns):
         
         return df
     
-    except json.JSONDecodeError:
+    except (json.JSONDecodeError, ValueError):
         # If JSON parsing fails, create an error DataFrame
         error_df = pd.DataFrame({"Error": ["Invalid JSON format in extracted data"]})
         return error_df
@@ -176,231 +273,16 @@ def json_to_dataframe(json_data, columns):
         error_df = pd.DataFrame({"Error": [f"Error processing data: {str(e)}"]})
         return error_df
 
-if files_uploaded:
-    # st.markdown("**PDF Preview**")
-    pdf_text = extract_text_from_pdf(pdf_file)
-    # st.text_area("PDF Preview", value=pdf_text[:500], height=120)
-
-    st.markdown("**Excel Schema & Instructions**")
-    columns, instructions = read_excel_schema(excel_file)
-    df = pd.DataFrame([instructions], columns=columns)
-    st.write(df)
-
-    # --- Initialize Database Manager ---
-    if st.session_state['db_manager'] is None:
-        try:
-            st.session_state['db_manager'] = DatabaseManager()
-            # Test connection
-            if st.session_state['db_manager'].test_connection():
-                st.success("✅ Database connected successfully")
-            else:
-                st.warning("⚠️ Database connection failed - using local prompts")
-                st.session_state['db_manager'] = None
-        except Exception as e:
-            st.warning(f"⚠️ Database initialization failed: {str(e)} - using local prompts")
-            st.session_state['db_manager'] = None
-
-    # --- Manage Document in Database ---
-    if st.session_state['db_manager'] and st.session_state.get("last_uploaded_files") != (pdf_file.name, excel_file.name):
-        try:
-            # Always create a new document record for each submit (preserves full history)
-            # Check existing documents only for information/reference
-            existing_docs = st.session_state['db_manager'].get_document_by_filename(pdf_file.name)
-            
-            if existing_docs:
-                st.info(f"📄 Previous submissions found for '{pdf_file.name}'. Creating new record for this session.")
-                
-                # Show existing document info for reference
-                with st.expander(f"📋 Previous Submissions for '{pdf_file.name}'"):
-                    st.write(f"**Last Document ID:** {existing_docs['DocumentID']}")
-                    st.write(f"**Last Status:** {existing_docs.get('ExtractionStatus', 'N/A')}")
-                    st.write(f"**Last Updated:** {existing_docs.get('LastUpdated', 'N/A')}")
-                    st.caption("A new record will be created for this session to preserve complete history.")
-            
-            # Always insert new document request for each submit
-            with st.spinner("📄 Creating new document record in database..."):
-                try:
-                    # determine file extension as source_type
-                    _, ext = os.path.splitext(pdf_file.name)
-                    source_type = ext.lstrip('.').lower() if ext else 'pdf'
-                    
-                    # Add timestamp to source_type to make each submission unique
-                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                    # source_type = f"{source_type}_submit_{timestamp}"
-
-                    # Use existing user_id from session state (already detected during initialization)
-                    local_user = st.session_state.get('user_id', 'streamlit_user')
-
-                    document_id = st.session_state['db_manager'].insert_document_request(
-                        file_name=pdf_file.name,
-                        user_id=local_user,
-                        source_type=source_type
-                    )
-                    if document_id:
-                        st.session_state['document_id'] = document_id
-                        
-                        # Reset document versions for new submission
-                        st.session_state['document_versions'] = []
-                        st.session_state['current_document_id'] = document_id
-                        
-                        st.success(f"📄 New submission record created for '{pdf_file.name}' (ID: {document_id})")
-                        st.info(f"🔖 Source Type: {source_type}")
-                    else:
-                        st.error("❌ Failed to register document in database - stored procedure returned NULL")
-                        st.session_state['document_id'] = None
-                except Exception as insert_e:
-                    st.error(f"❌ Document insertion error: {str(insert_e)}")
-                    st.session_state['document_id'] = None
-        except Exception as e:
-            st.error(f"❌ Document management failed: {str(e)}")
-            st.session_state['document_id'] = None
-
-    # --- Get prompt from database or build locally ---
-    if st.session_state['db_manager']:
-        try:
-            # Try to get prompt from database
-            db_prompt_data = get_latest_prompt(st.session_state.get('use_case', 'Form 926'))
-            if db_prompt_data:
-                # Use database prompt as base and customize with current data
-                base_prompt = db_prompt_data['PromptText']
-                st.session_state['current_prompt_id'] = db_prompt_data['PromptID']
-                
-                # Customize the prompt with current extraction details
-                prompt = f"{base_prompt}\n\n" + (
-                    f"Current Task:\n"
-                    f"Extract the following columns from the PDF text:\n"
-                    f"Columns: {', '.join(columns)}\n"
-                    f"Instructions: {'; '.join(instructions)}\n"
-                    f"PDF Content:\n{pdf_text}\n"
-                )
-                
-                st.info(f"📋 Using database prompt (ID: {db_prompt_data['PromptID']}) - {db_prompt_data['PromptTitle']}")
-            else:
-                # Fallback to local prompt
-                prompt = (
-                    f"Extract the following columns from the PDF text:\n"
-                    f"Columns: {', '.join(columns)}\n"
-                    f"Instructions: {'; '.join(instructions)}\n"
-                    f"PDF Content:\n{pdf_text}\n"
-                    "Return your answer as a JSON object. "
-                    "Do not write any commentary—output only the JSON in this format: "
-                    '{"column1": "extractedValue", ...}'
-                )
-                st.info("📝 No database prompt found - using default prompt")
-        except Exception as e:
-            st.warning(f"⚠️ Database prompt fetch failed: {str(e)} - using local prompt")
-            # Fallback to local prompt
-            prompt = (
-                f"Extract the following columns from the PDF text:\n"
-                f"Columns: {', '.join(columns)}\n"
-                f"Instructions: {'; '.join(instructions)}\n"
-                f"PDF Content:\n{pdf_text}\n"
-                "Return your answer as a JSON object. "
-                "Do not write any commentary—output only the JSON in this format: "
-                '{"column1": "extractedValue", ...}'
-            )
-    else:
-        # Build local prompt when database is not available
-        prompt = (
-            f"Extract the following columns from the PDF text:\n"
-            f"Columns: {', '.join(columns)}\n"
-            f"Instructions: {'; '.join(instructions)}\n"
-            f"PDF Content:\n{pdf_text}\n"
-            "Return your answer as a JSON object. "
-            "Do not write any commentary—output only the JSON in this format: "
-            '{"column1": "extractedValue", ...}'
-        )
-    
-    st.session_state['last_prompt'] = prompt
-
-    # --- Run extraction if new files uploaded OR if no extraction exists yet ---
-    need_extraction = (
-        st.session_state.get("last_uploaded_files") != (pdf_file.name, excel_file.name) or
-        st.session_state.get('last_extraction') is None
-    )
-    
-    if need_extraction:
-        with st.spinner("🔄 Running extraction..."):
-            st.session_state['last_extraction'] = asyncio.run(
-                call_extraction_agent(prompt, columns, instructions)
-            )
-        
-        st.session_state['improved_prompt'] = None
-        st.session_state['improved_extraction'] = None
-        st.session_state["last_uploaded_files"] = (pdf_file.name, excel_file.name)
-    
-    # --- Always save extraction results to database if we have document_id and extraction ---
-    if (st.session_state['db_manager'] and 
-        st.session_state.get('document_id') and 
-        st.session_state.get('last_extraction') and
-        need_extraction):
-        
-        try:
-            with st.spinner("💾 Saving extraction results to database..."):
-                success = st.session_state['db_manager'].update_document_master_by_id(
-                    document_id=st.session_state['document_id'],
-                    extraction_status="Completed",
-                    extraction_output=st.session_state['last_extraction'],
-                    prompt_id=st.session_state.get('current_prompt_id'),
-                    retry_count=0,
-                    error_message=None,
-                    comments=f"Initial extraction completed via Streamlit interface. File: {pdf_file.name}, Columns: {len(columns)}"
-                )
-                if success:
-                    st.success(f"✅ Extraction results saved to database (Document ID: {st.session_state['document_id']})")
-                    
-                    # Initialize document version tracking
-                    if 'document_versions' not in st.session_state:
-                        st.session_state['document_versions'] = []
-                    
-                    # Track this as version 1 (initial extraction)
-                    version_info = {
-                        'version': 1,
-                        'document_id': st.session_state['document_id'],
-                        'extraction_type': 'Initial',
-                        'feedback': None
-                    }
-                    st.session_state['document_versions'] = [version_info]  # Reset for new document
-                    
-                    # Show what was saved for verification
-                    with st.expander("📋 Database Save Details"):
-                        st.write(f"**Document ID:** {st.session_state['document_id']}")
-                        st.write(f"**Version:** 1 (Initial)")
-                        st.write(f"**Status:** Completed")
-                        st.write(f"**Prompt ID:** {st.session_state.get('current_prompt_id', 'N/A')}")
-                        st.write(f"**Extraction Output:** {len(st.session_state['last_extraction'])} characters")
-                        st.write(f"**Comments:** Initial extraction for {pdf_file.name}")
-                else:
-                    st.error("❌ Failed to save extraction results to database")
-        except Exception as e:
-            st.error(f"❌ Database update failed: {str(e)}")
-            # Update status to error in database
-            try:
-                st.session_state['db_manager'].update_document_master_by_id(
-                    document_id=st.session_state['document_id'],
-                    extraction_status="Error",
-                    error_message=f"Initial extraction error: {str(e)}",
-                    retry_count=0,
-                    comments=f"Error during initial extraction for {pdf_file.name}"
-                )
-                st.warning("⚠️ Document status updated to 'Error' in database")
-            except Exception as nested_e:
-                st.error(f"❌ Could not update error status: {str(nested_e)}")
-
-    # --- Show extraction ---
-    st.markdown("### Extraction Agent Output (Initial)")
-    
-    # Display as table
-    extraction_df = json_to_dataframe(st.session_state['last_extraction'], columns)
-    st.dataframe(extraction_df, use_container_width=True)
-    
-    # Option to view raw JSON
-    with st.expander("🔍 View Raw JSON Output"):
-        st.code(st.session_state['last_extraction'], language="json")
-
+@timed_fragment
+def feedback_panel(columns, instructions, pdf_pages, pdf_name):
+    """Feedback, prompt improvement and prompt saving; widget interactions rerun only this panel"""
     # --- Feedback section + RUN IMPROVEMENT AGENT ---
     st.markdown("### Feedback or Correction")
     
+    # Outcome of the last submission (the app reran so the other panels show the new extraction)
+    for notice in st.session_state.pop('feedback_notices', []):
+        st.success(notice)
+    
     # --- Show save button for existing improved prompt ---
     if (st.session_state.get('improved_prompt') and 
         st.session_state['db_manager'] and 
@@ -420,7 +302,7 @@ if files_uploaded:
         
         if save_existing_prompt and st.session_state.feedback_log:
             # Get the last feedback entry for context
-            last_feedback = st.session_state.feedback_log[-1].get('feedback', 'No feedback text available')
+            last_feedback = st.session_state.feedback_log.last().get('feedback') or 'No feedback text available'
             
             try:
                 with st.spinner("💾 Saving previous improved prompt to database..."):
@@ -434,6 +316,7 @@ if files_uploaded:
                     )
                     if success:
                         st.success("✅ Previous improved prompt saved to database and set as active!")
+                        load_active_prompt.clear()
                         # Update current prompt ID for tracking
                         updated_prompt_data = get_latest_prompt(st.session_state.get('use_case', 'Form 926'))
                         if updated_prompt_data:
@@ -447,103 +330,170 @@ if files_uploaded:
     
     feedback = st.text_area("Suggest correction/feedback regarding the extracted data:")
     
+    # Tell the reviewer when the same correction was already made (and saved) before
+    if feedback.strip():
+        feedback_index = get_default_feedback_index()
+        addressed = feedback_index.find_addressed(feedback, use_case=st.session_state.get('use_case')) if feedback_index else None
+        if addressed:
+            score, entry = addressed
+            where = f" in prompt ID {entry['prompt_id']}" if entry['prompt_id'] else ""
+            st.info(f"♻️ Similar feedback was already addressed{where} on {entry['created'][:10]} "
+                    f"(similarity {score:.0%}): \"{entry['feedback'][:150]}\"")
+            if entry['diff']:
+                with st.expander("Prompt change made for it"):
+                    st.code(entry['diff'])
+    
+    candidate_count = st.number_input(
+        "Candidate prompts per feedback",
+        min_value=1, max_value=5, value=1, step=1,
+        help="Above 1, several improved prompts are generated and extracted in parallel and the best-scoring one is shown"
+    )
+    delta_mode = st.checkbox(
+        "Re-extract only the fields the feedback affects",
+        value=True,
+        help="Re-runs extraction for the affected columns on their relevant pages and keeps every other field unchanged. Falls back to a full re-extraction when the feedback cannot be scoped to columns."
+    )
+    
     submit_feedback = st.button("Submit Feedback", key="feedback_button")
     
     if submit_feedback and feedback.strip():
-        with st.spinner("🔄 Generating improved prompt..."):
-            improved_prompt = asyncio.run(
-                call_improvement_agent(
-                    st.session_state['last_extraction'],
-                    feedback,
-                    st.session_state['last_prompt']
+        # One budget for the improvement and the re-extraction
+        feedback_deadline = Deadline(DEADLINE_DOCUMENT_SECONDS)
+        def build_improved_extraction_prompt(improved_prompt):
+            # Combine the improved prompt template with current document data (full schema)
+            return build_extraction_prompt(
+                prompt_text_from_improvement(improved_prompt), columns, instructions, pdf_pages
+            ).render()
+        
+        improved_extraction = None
+        ranked_candidates = None
+        if candidate_count > 1:
+            # --- Speculative mode: N candidate prompts, extracted in parallel, best one kept ---
+            try:
+                with st.spinner(f"🔄 Generating {candidate_count} candidate prompts and extracting in parallel..."):
+                    ranked_candidates = run_with_deadline(
+                        run_speculative_improvement(
+                            st.session_state['last_extraction'],
+                            feedback,
+                            st.session_state['last_prompt'].template,
+                            build_improved_extraction_prompt,
+                            columns,
+                            instructions,
+                            n=int(candidate_count),
+                            use_case=st.session_state.get('use_case')
+                        ),
+                        "improvement", feedback_deadline
+                    )
+            except NoUsableCandidate as e:
+                # Nothing worth ranking: fall back to one improved prompt and a fresh extraction
+                logging.warning(f"Speculative improvement failed: {str(e)}")
+                st.warning(f"⚠️ {str(e)}; generating a single improved prompt instead.")
+
+        if ranked_candidates:
+            improved_prompt = ranked_candidates[0]['prompt']
+            improved_extraction = ranked_candidates[0]['extraction']
+            st.session_state['candidate_ranking'] = [
+                {
+                    'Rank': rank + 1,
+                    'Score': c['score'],
+                    'Feedback Match': c['feedback_score'],
+                    'Agreement': c['agreement'],
+                    'Prompt Title': (json.loads(c['prompt']).get('Prompt Title') if c['prompt'] else None)
+                }
+                for rank, c in enumerate(ranked_candidates)
+            ]
+        else:
+            st.session_state['candidate_ranking'] = None
+            with st.spinner("🔄 Generating improved prompt..."):
+                improved_prompt = run_with_deadline(
+                    call_improvement_agent(
+                        st.session_state['last_extraction'],
+                        feedback,
+                        st.session_state['last_prompt'].template,
+                        use_case=st.session_state.get('use_case')
+                    ),
+                    "improvement", feedback_deadline
                 )
-            )
-            st.session_state['improved_prompt'] = improved_prompt
-            # Store the feedback that generated this prompt for database saving
-            st.session_state['current_feedback'] = feedback
-            # Reset the saved flag since this is a new prompt
-            st.session_state['prompt_saved_to_db'] = False
+        
+        st.session_state['improved_prompt'] = improved_prompt
+        # Store the feedback that generated this prompt for database saving
+        st.session_state['current_feedback'] = feedback
+        # Reset the saved flag since this is a new prompt
+        st.session_state['prompt_saved_to_db'] = False
         
         st.success("✅ Improved prompt generated!")
         
         # --- Run the extraction agent AGAIN with improved prompt ---
         with st.spinner("🔄 Re-running extraction with improved prompt..."):
-            # Combine the improved prompt template with current document data
-            complete_improved_prompt = f"{improved_prompt}\n\n" + (
-                f"Current Task:\n"
-                f"Extract the following columns from the PDF text:\n"
-                f"Columns: {', '.join(columns)}\n"
-                f"Instructions: {'; '.join(instructions)}\n"
-                f"PDF Content:\n{pdf_text}\n"
-            )
+            delta_columns = []
+            if improved_extraction is None and delta_mode:
+                delta_columns = affected_columns(feedback, columns, st.session_state['last_extraction'])
             
-            improved_extraction = asyncio.run(
-                call_extraction_agent(complete_improved_prompt, columns, instructions)
-            )
+            if improved_extraction is None and delta_columns:
+                # --- Delta mode: only the affected columns, only their pages, merged into the previous output ---
+                delta_pages = relevant_pages(pdf_pages, delta_columns, st.session_state['last_extraction'])
+                delta_prompt = build_extraction_prompt(
+                    prompt_text_from_improvement(improved_prompt), columns, instructions,
+                    delta_pages, only_columns=delta_columns
+                )
+                delta_output = run_with_deadline(
+                    call_extraction_agent(delta_prompt.render(), delta_columns,
+                                          [instructions[columns.index(c)] for c in delta_columns],
+                                          use_case=st.session_state.get('use_case')),
+                    "extraction", feedback_deadline
+                )
+                improved_extraction = merge_delta(st.session_state['last_extraction'], delta_output, delta_columns)
+                st.caption(f"🎯 Delta re-extraction: {', '.join(delta_columns)} "
+                           f"(pages {', '.join(str(p['page_number']) for p in delta_pages)})")
+            elif improved_extraction is None:
+                complete_improved_prompt = build_improved_extraction_prompt(improved_prompt)
+                
+                improved_extraction = run_with_deadline(
+                    call_extraction_agent(complete_improved_prompt, columns, instructions,
+                                          use_case=st.session_state.get('use_case')),
+                    "extraction", feedback_deadline
+                )
             st.session_state['improved_extraction'] = improved_extraction
             
-            # --- Save Improved Extraction as New Record in Database ---
-            if st.session_state['db_manager']:
+            # --- Save Improved Extraction as a new version of the document ---
+            if st.session_state['db_manager'] and st.session_state.get('document_id'):
                 try:
-                    feedback_count = len(st.session_state.feedback_log) + 1
-                    next_version = len(st.session_state.get('document_versions', [])) + 1
+                    feedback_count = st.session_state.feedback_log.total_iterations + 1
                     
-                    with st.spinner("💾 Creating new version record for improved extraction..."):
-                        # Create new document record for this iteration
-                        new_document_id = st.session_state['db_manager'].insert_document_request(
-                            file_name=pdf_file.name,
-                            user_id=st.session_state.get('user_id', 'streamlit_user'),
-                            source_type=f"Improvement_V{next_version}"
+                    with st.spinner("💾 Saving improved extraction as a new version..."):
+                        # Stored as a field-level delta against the extraction the feedback was given on
+                        version = st.session_state['db_manager'].insert_document_version(
+                            document_id=st.session_state['document_id'],
+                            extraction_output=improved_extraction,
+                            parent_version=st.session_state.get('base_version'),
+                            parent_output=st.session_state['last_extraction'],
+                            prompt_id=st.session_state.get('current_prompt_id'),
+                            feedback=feedback,
+                            created_by=st.session_state.get('user_id', 'streamlit_user')
+                        )
+                        st.session_state['db_manager'].update_document_master_by_id(
+                            document_id=st.session_state['document_id'],
+                            extraction_status="Improved",
+                            retry_count=feedback_count,
+                            comments=f"Version {version['VersionNumber']} - Iteration #{feedback_count} - Feedback: {feedback[:100]}{'...' if len(feedback) > 100 else ''}"
                         )
+                        st.session_state['current_version'] = version
                         
-                        if new_document_id:
-                            # Update the new record with extraction results
-                            success = st.session_state['db_manager'].update_document_master_by_id(
-                                document_id=new_document_id,
-                                extraction_status="Improved",
-                                extraction_output=improved_extraction,
-                                prompt_id=st.session_state.get('current_prompt_id'),
-                                retry_count=feedback_count,
-                                error_message=None,
-                                comments=f"Version {next_version} - Iteration #{feedback_count} - Feedback: {feedback[:100]}{'...' if len(feedback) > 100 else ''}"
-                            )
-                            
-                            if success:
-                                # Track this new version
-                                version_info = {
-                                    'version': next_version,
-                                    'document_id': new_document_id,
-                                    'extraction_type': 'Improved',
-                                    'feedback': feedback[:200]
-                                }
-                                
-                                if 'document_versions' not in st.session_state:
-                                    st.session_state['document_versions'] = []
-                                st.session_state['document_versions'].append(version_info)
-                                
-                                # Update current document_id to point to latest version
-                                st.session_state['current_document_id'] = new_document_id
-                                
-                                st.success(f"✅ New version (V{next_version}) created successfully (Document ID: {new_document_id})")
-                                
-                                # Show what was saved for verification
-                                with st.expander("📋 New Version Details"):
-                                    st.write(f"**New Document ID:** {new_document_id}")
-                                    st.write(f"**Version:** {next_version}")
-                                    st.write(f"**Status:** Improved")
-                                    st.write(f"**Iteration:** {feedback_count}")
-                                    st.write(f"**Prompt ID:** {st.session_state.get('current_prompt_id', 'N/A')}")
-                                    st.write(f"**Feedback:** {feedback[:200]}{'...' if len(feedback) > 200 else ''}")
-                                    st.write(f"**Extraction Output:** {len(improved_extraction)} characters")
-                                    
-                                    # Show all versions
-                                    st.write("**All Versions:**")
-                                    for v in st.session_state['document_versions']:
-                                        st.write(f"- V{v['version']}: Document ID {v['document_id']} ({v['extraction_type']})")
-                            else:
-                                st.error("❌ Failed to update new document record with extraction results")
-                        else:
-                            st.error("❌ Failed to create new document record for improved extraction")
+                        st.success(f"✅ Version V{version['VersionNumber']} saved (Document ID: {st.session_state['document_id']})")
+                        st.session_state.setdefault('feedback_notices', []).append(
+                            f"✅ Version V{version['VersionNumber']} saved (Document ID: {st.session_state['document_id']})"
+                        )
+                        
+                        # Show what was saved for verification
+                        with st.expander("📋 New Version Details"):
+                            st.write(f"**Document ID:** {st.session_state['document_id']}")
+                            st.write(f"**Version:** {version['VersionNumber']} (Version ID: {version['VersionID']})")
+                            parent = st.session_state.get('base_version')
+                            st.write(f"**Parent Version:** {parent['VersionNumber'] if parent else 'N/A'}")
+                            st.write(f"**Iteration:** {feedback_count}")
+                            st.write(f"**Prompt ID:** {st.session_state.get('current_prompt_id', 'N/A')}")
+                            st.write(f"**Feedback:** {feedback[:200]}{'...' if len(feedback) > 200 else ''}")
+                            st.write(f"**Extraction Output:** {len(improved_extraction)} characters")
                 except Exception as e:
                     st.error(f"❌ Database update failed for improved extraction: {str(e)}")
                     # Try to log the error in the database
@@ -552,29 +502,30 @@ if files_uploaded:
                             document_id=st.session_state['document_id'],
                             extraction_status="Error",
                             error_message=f"Improved extraction error: {str(e)}",
-                            retry_count=len(st.session_state.feedback_log) + 1,
-                            comments=f"Error during improved extraction iteration {len(st.session_state.feedback_log) + 1}"
+                            retry_count=st.session_state.feedback_log.total_iterations + 1,
+                            comments=f"Error during improved extraction iteration {st.session_state.feedback_log.total_iterations + 1}"
                         )
                     except:
                         pass
 
         # --- Log everything ---
-        log_entry = {
-            "old_extraction": st.session_state['last_extraction'],
-            "feedback": feedback,
-            "improved_prompt": improved_prompt,
-            "improved_extraction": improved_extraction,
-            "timestamp": datetime.now().isoformat(),
-            "db_available": st.session_state['db_manager'] is not None,
-            "document_id": st.session_state.get('document_id')
-        }
-        
-        if st.session_state.get('current_prompt_id'):
-            log_entry["prompt_id"] = st.session_state['current_prompt_id']
-            
-        st.session_state.feedback_log.append(log_entry)
+        st.session_state.feedback_log.record(
+            old_extraction=st.session_state['last_extraction'],
+            feedback=feedback,
+            improved_prompt=improved_prompt,
+            improved_extraction=improved_extraction,
+            db_available=st.session_state['db_manager'] is not None,
+            document_id=st.session_state.get('document_id'),
+            prompt_id=st.session_state.get('current_prompt_id')
+        )
         
-        st.success("🎯 Extraction completed with improved prompt!")
+        st.session_state.setdefault('feedback_notices', []).append("🎯 Extraction completed with improved prompt!")
+        # Full rerun so the side-by-side view, export and sidebar pick up the new extraction
+        st.rerun()
+    
+    if st.session_state.get('candidate_ranking'):
+        with st.expander(f"🏁 Candidate Ranking ({len(st.session_state['candidate_ranking'])} candidates)"):
+            st.dataframe(pd.DataFrame(st.session_state['candidate_ranking']), use_container_width=True)
     
     # --- Show improved prompt if it exists (persistent display) ---
     if st.session_state.get('improved_prompt'):
@@ -614,6 +565,8 @@ if files_uploaded:
                             st.write(f"**Use Case:** {st.session_state.get('use_case', 'Form 926')}")
                             st.write(f"**Feedback Summary:** {feedback_summary}")
                             st.write(f"**Prompt Length:** {len(st.session_state['improved_prompt'])} characters")
+                            compacted_length = len(compact_prompt(prompt_text_from_improvement(st.session_state['improved_prompt'])))
+                            st.write(f"**Compacted Template:** {compacted_length} / {PROMPT_MAX_CHARS} characters")
                             st.write(f"**Feedback Length:** {len(feedback_for_prompt)} characters")
                         
                         success = save_improved_prompt(
@@ -626,6 +579,7 @@ if files_uploaded:
                         
                         if success:
                             st.success("✅ Improved prompt saved to database and set as active!")
+                            load_active_prompt.clear()
                             # Update current prompt ID for tracking
                             updated_prompt_data = get_latest_prompt(st.session_state.get('use_case', 'Form 926'))
                             if updated_prompt_data:
@@ -637,6 +591,8 @@ if files_uploaded:
                             
                             # Force a rerun to update the UI
                             st.rerun()
+                        elif compacted_length > PROMPT_MAX_CHARS:
+                            st.error(f"❌ Prompt not saved - {compacted_length} characters after compaction, over the {PROMPT_MAX_CHARS} character limit (PROMPT_MAX_CHARS)")
                         else:
                             st.error("❌ Failed to save prompt to database - stored procedure returned False")
                             
@@ -660,6 +616,67 @@ if files_uploaded:
     elif submit_feedback and not feedback.strip():
         st.warning("⚠️ Please provide feedback before submitting.")
 
+@timed_fragment
+def grounding_panel(columns, instructions, pdf_pages, pdf_key):
+    """Whether each extracted value appears in the document; ungrounded fields can be re-extracted on their own"""
+    current_extraction = st.session_state.get('improved_extraction') or st.session_state.get('last_extraction')
+    if not current_extraction:
+        return
+    report = check_grounding(current_extraction, pdf_key, pdf_pages)
+    if not report:
+        return
+    missing = ungrounded_columns(report)
+    checked = sum(1 for entry in report.values() if entry['status'] != 'empty')
+    
+    with st.expander(f"🔎 Grounding: {checked - len(missing)} of {checked} values found in the document",
+                     expanded=bool(missing)):
+        st.dataframe(pd.DataFrame([
+            {
+                'Column': column,
+                'Value': str(entry['value']) if entry['value'] is not None else None,
+                'Score': entry['score'],
+                'Page': entry['page'],
+                'Status': entry['status'],
+            }
+            for column, entry in report.items()
+        ]).set_index('Column'), use_container_width=True)
+        
+        if not missing:
+            return
+        st.warning(f"⚠️ Not found in the document: {', '.join(missing)}")
+        if st.button("🎯 Re-extract ungrounded fields", key="reground_button",
+                     help="Re-runs extraction for these columns only, on their relevant pages; every other field is kept"):
+            template = (prompt_text_from_improvement(st.session_state['improved_prompt'])
+                        if st.session_state.get('improved_prompt') else st.session_state['last_prompt'].template)
+            with st.spinner("🔄 Re-extracting ungrounded fields..."):
+                delta_pages = relevant_pages(pdf_pages, missing, current_extraction)
+                delta_prompt = build_extraction_prompt(template, columns, instructions, delta_pages, only_columns=missing)
+                delta_output = run_with_deadline(
+                    call_extraction_agent(delta_prompt.render(), missing,
+                                          [instructions[columns.index(c)] for c in missing],
+                                          use_case=st.session_state.get('use_case')),
+                    "extraction", Deadline(DEADLINE_DOCUMENT_SECONDS)
+                )
+                regrounded = merge_delta(current_extraction, delta_output, missing)
+            st.session_state['improved_extraction'] = regrounded
+            
+            if st.session_state['db_manager'] and st.session_state.get('document_id'):
+                try:
+                    st.session_state['current_version'] = st.session_state['db_manager'].insert_document_version(
+                        document_id=st.session_state['document_id'],
+                        extraction_output=regrounded,
+                        parent_version=st.session_state.get('current_version'),
+                        parent_output=current_extraction,
+                        prompt_id=st.session_state.get('current_prompt_id'),
+                        feedback=f"Grounding re-extraction: {', '.join(missing)}",
+                        created_by=st.session_state.get('user_id', 'streamlit_user')
+                    )
+                except Exception as e:
+                    st.session_state.setdefault('feedback_notices', []).append(f"⚠️ Re-extracted, but the version was not saved: {str(e)}")
+            st.rerun()
+
+@timed_fragment
+def side_by_side_panel(columns):
     # --- Show side-by-side results (if improved available) ---
     if st.session_state['improved_extraction']:
         st.markdown("### Side-by-Side Extraction Results")
@@ -680,6 +697,9 @@ if files_uploaded:
             with st.expander("🔍 View Raw JSON"):
                 st.code(st.session_state['improved_extraction'], language="json")
 
+@timed_fragment
+def export_panel(columns):
+    """Excel downloads; download and export buttons rerun only this panel"""
     # --- Excel Export Section (Always Available) ---
     st.markdown("### 📥 Export to Excel")
     
@@ -690,7 +710,7 @@ if files_uploaded:
         # Show preview of current data
         try:
             if isinstance(current_extraction, str):
-                preview_data = json.loads(current_extraction)
+                preview_data = loads_extraction(current_extraction)
             else:
                 preview_data = current_extraction
             
@@ -763,19 +783,19 @@ if files_uploaded:
             st.markdown("**📚 Download Previous Iterations**")
             
             # Show last few feedback iterations
-            recent_feedback = st.session_state.feedback_log[-3:]  # Last 3 iterations
+            recent_feedback = st.session_state.feedback_log.recent(3)  # Last 3 iterations, newest first
             
-            for i, feedback_entry in enumerate(reversed(recent_feedback)):
-                iteration = len(st.session_state.feedback_log) - i
+            for feedback_entry in recent_feedback:
+                iteration = feedback_entry['iteration']
                 
                 col_iter1, col_iter2 = st.columns([3, 1])
                 
                 with col_iter1:
-                    st.write(f"**Iteration {iteration}:** {feedback_entry.get('feedback', 'N/A')[:100]}...")
+                    st.write(f"**Iteration {iteration}:** {(feedback_entry.get('feedback') or 'N/A')[:100]}...")
                 
                 with col_iter2:
-                    if 'improved_extraction' in feedback_entry:
-                        excel_iteration = json_to_excel(feedback_entry['improved_extraction'], columns)
+                    if feedback_entry.get('extraction'):
+                        excel_iteration = json_to_excel(st.session_state.feedback_log.improved_extraction(feedback_entry), columns)
                         
                         st.download_button(
                             label=f"📥 V{iteration}",
@@ -802,7 +822,7 @@ if files_uploaded:
                     # Original extraction
                     if st.session_state.get('last_extraction'):
                         try:
-                            original_data = json.loads(st.session_state['last_extraction']) if isinstance(st.session_state['last_extraction'], str) else st.session_state['last_extraction']
+                            original_data = loads_extraction(st.session_state['last_extraction']) if isinstance(st.session_state['last_extraction'], str) else st.session_state['last_extraction']
                             original_df = pd.DataFrame([original_data])
                             for col in columns:
                                 if col not in original_df.columns:
@@ -813,16 +833,17 @@ if files_uploaded:
                             pass
                     
                     # Each feedback iteration
-                    for i, feedback_entry in enumerate(st.session_state.feedback_log):
-                        if 'improved_extraction' in feedback_entry:
+                    history = st.session_state.feedback_log
+                    for feedback_entry in history.entries():
+                        if feedback_entry.get('extraction'):
                             try:
-                                iter_data = json.loads(feedback_entry['improved_extraction']) if isinstance(feedback_entry['improved_extraction'], str) else feedback_entry['improved_extraction']
+                                iter_data = loads_extraction(history.improved_extraction(feedback_entry))
                                 iter_df = pd.DataFrame([iter_data])
                                 for col in columns:
                                     if col not in iter_df.columns:
                                         iter_df[col] = ""
                                 iter_df = iter_df[columns]
-                                iter_df.to_excel(writer, sheet_name=f'Iteration_{i+1}', index=False)
+                                iter_df.to_excel(writer, sheet_name=f"Iteration_{feedback_entry['iteration']}", index=False)
                             except:
                                 continue
                 
@@ -835,89 +856,490 @@ if files_uploaded:
                     key="download_multi_sheet"
                 )
 
-if st.sidebar.checkbox("Show Feedback Log", value=True):
-    st.sidebar.markdown("### Feedback Log")
-    st.sidebar.write(st.session_state.feedback_log)
+@timed_fragment
+def feedback_log_panel():
+    show_feedback_log = st.checkbox("Show Feedback Log", value=True, key="show_feedback_log")
+    if not show_feedback_log:
+        return
+    st.markdown("### Feedback Log")
+    history = st.session_state.feedback_log
+    if not history:
+        st.caption("No feedback yet.")
+    else:
+        if history.total_iterations > len(history):
+            st.caption(
+                f"Showing the last {len(history)} of {history.total_iterations} iterations"
+            )
+        # Summary rows only; full extractions are rebuilt for the selected entry alone
+        page_size = 10
+        page_entries, page_count = history.page(0, page_size)
+        if page_count > 1:
+            page_number = st.number_input(
+                "Page", min_value=1, max_value=page_count, value=1, key="feedback_log_page"
+            )
+            page_entries, _ = history.page(page_number - 1, page_size)
+        st.dataframe(pd.DataFrame(history.summary_rows(page_entries)), use_container_width=True)
+
+        selected_iteration = st.selectbox(
+            "Details for iteration",
+            options=[None] + [entry['iteration'] for entry in page_entries],
+            key="feedback_log_selected"
+        )
+        if selected_iteration is not None:
+            entry = next(e for e in page_entries if e['iteration'] == selected_iteration)
+            with st.expander(f"Iteration {selected_iteration}", expanded=True):
+                st.caption(entry['timestamp'])
+                st.write(entry['feedback'])
+                st.markdown("**Improved Extraction**")
+                st.code(history.improved_extraction(entry), language="json")
+                st.markdown("**Improved Prompt**")
+                st.code(history.improved_prompt(entry))
+
+@timed_fragment
+def extraction_stats_panel():
+    st.markdown("---")
+    st.markdown("### Extraction Stats")
+
+    # Provider-side prefix caching savings for this process
+    with st.expander("🧊 Prompt Cache"):
+        cache_stats = get_prompt_cache_stats(st.session_state.get('use_case'))
+        st.caption(f"Calls: {cache_stats['calls']} | Prompt tokens: {cache_stats['prompt_tokens']:,}")
+        st.caption(f"Cached tokens: {cache_stats['cached_tokens']:,} ({cache_stats['cached_ratio']:.0%})")
+        if st.session_state.get('last_prompt') is not None:
+            st.caption(f"Prefix hash: {st.session_state['last_prompt'].prefix_hash()}")
+
+    # Ingest: pages read from the text layer vs. sent to OCR, and peak ingest memory (INGEST_TRACE_MEMORY)
+    with st.expander("📥 Ingest"):
+        st.caption(f"Text-layer pages: {metrics.total('ingest_pages', source='text_layer'):,.0f} | "
+                   f"OCR pages: {metrics.total('ingest_pages', source='ocr'):,.0f}")
+        peaks = metrics.snapshot(prefix="ingest_peak_bytes")
+        if peaks:
+            st.caption(f"Peak ingest memory: {max(p['max'] for p in peaks) / 1024 / 1024:,.1f} MB "
+                       f"(avg {sum(p['sum'] for p in peaks) / sum(p['count'] for p in peaks) / 1024 / 1024:,.1f} MB)")
+
+    # Structured output health: how often the JSON needed repair, a retry, or failed outright
+    with st.expander("🧾 JSON Parse Stats"):
+        parse_stats = get_parse_stats(st.session_state.get('use_case'))
+        st.caption(f"Parsed: {parse_stats['calls']} | Repaired: {parse_stats['repaired']}")
+        st.caption(f"Retries: {parse_stats['retries']} | Failures: {parse_stats['failures']}")
 
-# --- Database Status Sidebar ---
-st.sidebar.markdown("---")
-st.sidebar.markdown("### Database Status")
-if st.session_state.get('db_manager'):
-    st.sidebar.success("✅ Connected")
+    # Tail-latency hedging: duplicates sent, how often they answered first, and what they cost
+    if HEDGING_ENABLED:
+        with st.expander("🪁 Hedged Requests"):
+            hedge_stats = get_hedge_stats(st.session_state.get('use_case'))
+            delay = hedge_stats['delay_seconds']
+            st.caption(f"Hedges: {hedge_stats['issued']} | Won: {hedge_stats['won']}")
+            st.caption(f"Extra tokens: {hedge_stats['extra_tokens']:,} | "
+                       f"Threshold: {f'{delay:.1f}s' if delay is not None else 'warming up'}")
+
+    # Model cascade: share of fields each tier got right, and what each tier costs
+    if CASCADE_TIERS:
+        with st.expander("🪜 Model Cascade"):
+            for tier in get_cascade_stats(st.session_state.get('use_case')):
+                st.caption(f"**{tier['deployment']}** - Calls: {tier['calls']} | "
+                           f"Fields accepted: {tier['accepted']}/{tier['fields']} ({tier['hit_rate']:.0%})")
+                st.caption(f"Avg latency: {tier['avg_latency']:.1f}s | Tokens: {tier['tokens']:,} | "
+                           f"Cost: {tier['cost']:.4f}")
+
+@timed_fragment
+def database_status_panel(pdf_name):
+    st.markdown("---")
+    st.markdown("### Database Status")
+    if st.session_state.get('db_manager'):
+        st.success("✅ Connected")
     
-    # Show document status and version information
-    if st.session_state.get('document_id') or st.session_state.get('document_versions'):
-        st.sidebar.markdown("### Document Versions")
-        
-        # Show version history
-        if st.session_state.get('document_versions'):
-            st.sidebar.info(f"📊 Total Versions: {len(st.session_state['document_versions'])}")
-            
-            if files_uploaded:
-                st.sidebar.caption(f"File: {pdf_file.name}")
+        # Document lineage from document_version (survives refreshes; one query per panel run)
+        if st.session_state.get('document_id'):
+            st.markdown("### Document Versions")
+            st.info(f"📄 Document ID: {st.session_state['document_id']}")
+            if pdf_name:
+                st.caption(f"File: {pdf_name}")
+            try:
+                lineage = st.session_state['db_manager'].get_document_lineage(st.session_state['document_id'])
+            except Exception as e:
+                lineage = []
+                st.caption(f"Version history unavailable: {str(e)}")
             
-            # Show each version
-            for version in st.session_state['document_versions']:
-                version_num = version['version']
-                doc_id = version['document_id']
-                extraction_type = version['extraction_type']
+            if lineage:
+                st.info(f"📊 Total Versions: {len(lineage)}")
+                for version in lineage:
+                    version_num = version['VersionNumber']
+                    if version['ParentVersionID'] is None:
+                        st.success(f"📄 V{version_num}: Initial (Prompt ID {version['PromptID'] or 'N/A'})")
+                    else:
+                        st.info(f"🔄 V{version_num}: Improved (Prompt ID {version['PromptID'] or 'N/A'})")
+                        if version.get('Feedback'):
+                            st.caption(f"Feedback: {str(version['Feedback'])[:50]}...")
                 
-                if version_num == 1:
-                    st.sidebar.success(f"📄 V{version_num}: ID {doc_id} ({extraction_type})")
+                # Show current active version
+                if st.session_state.get('current_version'):
+                    st.markdown("**Active Version:**")
+                    st.warning(f"🎯 Current: V{st.session_state['current_version']['VersionNumber']}")
+    
+        if st.session_state.get('current_prompt_id'):
+            st.info(f"📋 Prompt ID: {st.session_state['current_prompt_id']}")
+    
+        # Show selected use case
+        if st.session_state.get('use_case'):
+            st.info(f"📝 Use Case: {st.session_state['use_case']}")
+    
+        # Per-priority queue depth and wait times
+        with st.expander("📊 Queue Statistics"):
+            try:
+                queue_stats = st.session_state['db_manager'].get_queue_statistics()
+                if queue_stats:
+                    st.dataframe(pd.DataFrame(queue_stats).set_index('Priority'), use_container_width=True)
                 else:
-                    st.sidebar.info(f"🔄 V{version_num}: ID {doc_id} ({extraction_type})")
-                    if version.get('feedback'):
-                        st.sidebar.caption(f"Feedback: {version['feedback'][:50]}...")
-            
-            # Show current active version
-            if st.session_state.get('current_document_id'):
-                st.sidebar.markdown("**Active Version:**")
-                st.sidebar.warning(f"🎯 Current: Document ID {st.session_state['current_document_id']}")
-        
-        elif st.session_state.get('document_id'):
-            # Fallback for single document (no versioning yet)
-            st.sidebar.info(f"📄 Document ID: {st.session_state['document_id']}")
-            if files_uploaded:
-                st.sidebar.caption(f"File: {pdf_file.name}")
-                feedback_count = len(st.session_state.feedback_log)
-                if feedback_count > 0:
-                    st.sidebar.caption(f"Iterations: {feedback_count}")
+                    st.caption("Queue is empty")
+            except Exception as e:
+                st.caption(f"Queue statistics unavailable: {str(e)}")
     
-    if st.session_state.get('current_prompt_id'):
-        st.sidebar.info(f"📋 Prompt ID: {st.session_state['current_prompt_id']}")
+        # Prompt template length across saved versions (growth means rules are piling up)
+        with st.expander("📏 Prompt Size"):
+            try:
+                prompt_versions = st.session_state['db_manager'].get_prompt_versions(st.session_state.get('use_case'))
+                if prompt_versions:
+                    sizes = pd.DataFrame([
+                        {'PromptID': v['PromptID'], 'Characters': v['PromptLength'], 'Active': bool(v['IsActive'])}
+                        for v in reversed(prompt_versions)
+                    ]).set_index('PromptID')
+                    st.line_chart(sizes['Characters'])
+                    st.caption(f"Limit: {PROMPT_MAX_CHARS} characters after compaction")
+                else:
+                    st.caption("No saved prompts for this use case")
+            except Exception as e:
+                st.caption(f"Prompt history unavailable: {str(e)}")
     
-    # Show selected use case
-    if st.session_state.get('use_case'):
-        st.sidebar.info(f"📝 Use Case: {st.session_state['use_case']}")
+        # Button to refresh prompt from database
+        if st.button("🔄 Refresh Prompt", help="Get latest prompt from database"):
+            try:
+                load_active_prompt.clear()
+                db_prompt_data = get_latest_prompt(st.session_state.get('use_case', 'Form 926'))
+                if db_prompt_data:
+                    st.session_state['current_prompt_id'] = db_prompt_data['PromptID']
+                    st.success(f"✅ Refreshed to Prompt ID: {db_prompt_data['PromptID']}")
+                    st.rerun()
+                else:
+                    st.warning("⚠️ No active prompts found")
+            except Exception as e:
+                st.error(f"❌ Refresh failed: {str(e)}")
+    else:
+        st.warning("⚠️ Database Offline")
+        st.caption("Using local prompts only")
     
-    # Button to refresh prompt from database
-    if st.sidebar.button("🔄 Refresh Prompt", help="Get latest prompt from database"):
+        # Show connection attempt info for debugging
+        if st.button("🔧 Test Connection", help="Try to connect to database"):
+            try:
+                test_db = get_storage_backend()
+                if test_db.test_connection():
+                    st.success("✅ Connection successful! Refresh page.")
+                else:
+                    st.error("❌ Connection failed")
+                    with st.expander("🔍 Debug Info"):
+                        st.caption(test_db.get_connection_info())
+            except Exception as e:
+                st.error(f"❌ Connection error: {str(e)}")
+
+@timed_fragment
+def prompt_performance_panel():
+    """Per-prompt throughput and quality from the incrementally maintained aggregates (no document_master scan)"""
+    if not st.session_state.get('db_manager'):
+        return
+    with st.expander("📈 Prompt Performance"):
+        try:
+            stats = st.session_state['db_manager'].get_prompt_performance(st.session_state.get('use_case'))
+        except Exception as e:
+            st.caption(f"Prompt performance unavailable: {str(e)}")
+            return
+        if not stats:
+            st.caption("No finished documents for this use case yet")
+            return
+        current = st.session_state.get('current_prompt_id')
+        for row in stats:
+            if current is not None and row['PromptID'] == str(current):
+                st.markdown(f"**Active prompt (ID {row['PromptID']})**")
+                st.caption(f"Documents: {row['DocumentsCompleted']} | Errors: {row['DocumentsErrored']} | "
+                           f"Dead-lettered: {row['DocumentsDeadLettered']}")
+                if row['AvgLatencySeconds'] is not None:
+                    st.caption(f"Avg latency: {row['AvgLatencySeconds']:.1f}s (max {row['MaxLatencySeconds']:.1f}s)")
+                st.caption(f"Retry rate: {(row['RetryRate'] or 0):.1%} | "
+                           f"Improvement iterations: {row['ImprovementIterations']}")
+        st.dataframe(pd.DataFrame([
+            {
+                'Prompt ID': row['PromptID'],
+                'Documents': row['DocumentsCompleted'],
+                'Errors': row['DocumentsErrored'] + row['DocumentsDeadLettered'],
+                'Avg Latency (s)': round(row['AvgLatencySeconds'], 1) if row['AvgLatencySeconds'] is not None else None,
+                'Retry Rate': round(row['RetryRate'] or 0, 3),
+                'Improvements/Doc': round(row['ImprovementsPerDocument'] or 0, 2),
+            }
+            for row in stats
+        ]).set_index('Prompt ID'), use_container_width=True)
+
+def rerun_timing_panel():
+    """Where recent runs spent their time (full reruns as 'app', fragment reruns by panel name)"""
+    st.markdown("---")
+    with st.expander("⏱️ Rerun Timing"):
+        timings = st.session_state.get('rerun_timings', [])
+        if not timings:
+            st.caption("No completed runs yet")
+            return
+        last_app_run = next((t for t in reversed(timings) if t['run'] == 'app'), None)
+        if last_app_run:
+            st.caption(f"Last full rerun: {last_app_run['total_seconds']:.2f}s at {last_app_run['finished_at']}")
+            st.dataframe(pd.DataFrame(
+                [{'Section': name, 'Seconds': round(seconds, 3)} for name, seconds in last_app_run['sections']]
+            ), use_container_width=True)
+        st.caption("Recent runs")
+        st.dataframe(pd.DataFrame([
+            {'Run': t['run'], 'Seconds': round(t['total_seconds'], 3), 'At': t['finished_at']}
+            for t in reversed(timings)
+        ]), use_container_width=True)
+
+if files_uploaded:
+    # st.markdown("**PDF Preview**")
+    # Hashed over the upload buffer in place (no copy of the PDF bytes)
+    pdf_key = hashlib.sha256(pdf_file.getbuffer()).hexdigest()
+    pdf_pages, analyze_result = extract_text_from_pdf(pdf_key, pdf_file)
+    rerun_timer.lap("ingest")
+
+    st.markdown("**Excel Schema & Instructions**")
+    columns, instructions = load_excel_schema(excel_file.getvalue())
+    df = pd.DataFrame([instructions], columns=columns)
+    st.write(df)
+
+    # --- Fast path: fill clearly labeled columns from key-value pairs/tables, LLM gets the rest ---
+    fast_path_matches, llm_columns, llm_instructions = fast_path_columns(
+        pdf_key, columns, instructions, analyze_result
+    )
+    rerun_timer.lap("schema + fast path")
+
+    # --- Initialize Database Manager (shared per process; the connection is tested once) ---
+    if st.session_state['db_manager'] is None:
+        try:
+            st.session_state['db_manager'] = get_database_manager()
+            st.success("✅ Database connected successfully")
+            sync_feedback_index(st.session_state['db_manager'])
+        except ConnectionError:
+            st.warning("⚠️ Database connection failed - using local prompts")
+            st.session_state['db_manager'] = None
+        except Exception as e:
+            st.warning(f"⚠️ Database initialization failed: {str(e)} - using local prompts")
+            st.session_state['db_manager'] = None
+
+    # --- Manage Document in Database ---
+    if st.session_state['db_manager'] and st.session_state.get("last_uploaded_files") != (pdf_file.name, excel_file.name):
+        try:
+            # Always create a new document record for each submit (preserves full history)
+            # Check existing documents only for information/reference
+            existing_docs = st.session_state['db_manager'].get_document_by_filename(pdf_file.name)
+            
+            if existing_docs:
+                st.info(f"📄 Previous submissions found for '{pdf_file.name}'. Creating new record for this session.")
+                
+                # Show existing document info for reference
+                with st.expander(f"📋 Previous Submissions for '{pdf_file.name}'"):
+                    st.write(f"**Last Document ID:** {existing_docs['DocumentID']}")
+                    st.write(f"**Last Status:** {existing_docs.get('ExtractionStatus', 'N/A')}")
+                    st.write(f"**Last Updated:** {existing_docs.get('LastUpdated', 'N/A')}")
+                    st.caption("A new record will be created for this session to preserve complete history.")
+            
+            # Always insert new document request for each submit
+            with st.spinner("📄 Creating new document record in database..."):
+                try:
+                    # determine file extension as source_type
+                    _, ext = os.path.splitext(pdf_file.name)
+                    source_type = ext.lstrip('.').lower() if ext else 'pdf'
+                    
+                    # Add timestamp to source_type to make each submission unique
+                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                    # source_type = f"{source_type}_submit_{timestamp}"
+
+                    # Use existing user_id from session state (already detected during initialization)
+                    local_user = st.session_state.get('user_id', 'streamlit_user')
+
+                    # Interactive submissions jump ahead of bulk backfills in the queue
+                    document_id = st.session_state['db_manager'].insert_document_request(
+                        file_name=pdf_file.name,
+                        user_id=local_user,
+                        source_type=source_type,
+                        priority=PRIORITY_INTERACTIVE
+                    )
+                    if document_id:
+                        st.session_state['document_id'] = document_id
+                        
+                        # Reset document versions for new submission
+                        st.session_state['base_version'] = None
+                        st.session_state['current_version'] = None
+                        
+                        st.success(f"📄 New submission record created for '{pdf_file.name}' (ID: {document_id})")
+                        st.info(f"🔖 Source Type: {source_type}")
+                    else:
+                        st.error("❌ Failed to register document in database - stored procedure returned NULL")
+                        st.session_state['document_id'] = None
+                except Exception as insert_e:
+                    st.error(f"❌ Document insertion error: {str(insert_e)}")
+                    st.session_state['document_id'] = None
+        except Exception as e:
+            st.error(f"❌ Document management failed: {str(e)}")
+            st.session_state['document_id'] = None
+
+    rerun_timer.lap("database")
+
+    # --- Get prompt template from database or use the local default ---
+    # One builder renders every prompt: static instructions and full schema first
+    # (byte-stable, so the provider can cache that prefix across documents), then
+    # the document. The improvement agent only ever sees the template.
+    prompt_template = DEFAULT_PROMPT_TEMPLATE
+    if st.session_state['db_manager']:
         try:
-            db_prompt_data = get_latest_prompt(st.session_state.get('use_case', 'Form 926'))
+            # Try to get prompt from database
+            db_prompt_data = load_active_prompt(st.session_state.get('use_case', 'Form 926'))
             if db_prompt_data:
+                # Use database prompt as base and customize with current data
+                prompt_template = db_prompt_data['PromptText']
                 st.session_state['current_prompt_id'] = db_prompt_data['PromptID']
-                st.sidebar.success(f"✅ Refreshed to Prompt ID: {db_prompt_data['PromptID']}")
-                st.rerun()
+                
+                st.info(f"📋 Using database prompt (ID: {db_prompt_data['PromptID']}) - {db_prompt_data['PromptTitle']}")
             else:
-                st.sidebar.warning("⚠️ No active prompts found")
+                st.info("📝 No database prompt found - using default prompt")
         except Exception as e:
-            st.sidebar.error(f"❌ Refresh failed: {str(e)}")
-else:
-    st.sidebar.warning("⚠️ Database Offline")
-    st.sidebar.caption("Using local prompts only")
+            st.warning(f"⚠️ Database prompt fetch failed: {str(e)} - using local prompt")
+    
+    # Fast-path columns are only excluded in the per-document scope line, keeping the prefix stable
+    prompt = build_extraction_prompt(
+        prompt_template, columns, instructions, pdf_pages,
+        only_columns=llm_columns if fast_path_matches else None
+    )
     
-    # Show connection attempt info for debugging
-    if st.sidebar.button("🔧 Test Connection", help="Try to connect to database"):
+    st.session_state['last_prompt'] = prompt
+    rerun_timer.lap("prompt")
+
+    # --- Run extraction if new files uploaded OR if no extraction exists yet ---
+    need_extraction = (
+        st.session_state.get("last_uploaded_files") != (pdf_file.name, excel_file.name) or
+        st.session_state.get('last_extraction') is None
+    )
+    
+    if need_extraction:
+        with st.spinner("🔄 Running extraction..."):
+            llm_extraction = None
+            if llm_columns and CASCADE_TIERS:
+                # Cheapest deployment first; only fields failing validation go to the stronger ones
+                llm_extraction = run_with_deadline(
+                    run_cascade(prompt_template, columns, instructions, pdf_pages, call_extraction_agent,
+                                use_case=st.session_state.get('use_case'),
+                                only_columns=llm_columns if fast_path_matches else None),
+                    None, Deadline(DEADLINE_DOCUMENT_SECONDS)
+                )
+            elif llm_columns:
+                llm_extraction = run_with_deadline(
+                    call_extraction_agent(prompt.render(), llm_columns, llm_instructions,
+                                          use_case=st.session_state.get('use_case')),
+                    "extraction", Deadline(DEADLINE_DOCUMENT_SECONDS)
+                )
+            st.session_state['last_extraction'] = merge_fast_path(llm_extraction, fast_path_matches, columns)
+        
+        st.session_state['improved_prompt'] = None
+        st.session_state['improved_extraction'] = None
+        st.session_state["last_uploaded_files"] = (pdf_file.name, excel_file.name)
+        st.session_state['candidate_ranking'] = None
+    rerun_timer.lap("extraction")
+    
+    # --- Always save extraction results to database if we have document_id and extraction ---
+    if (st.session_state['db_manager'] and 
+        st.session_state.get('document_id') and 
+        st.session_state.get('last_extraction') and
+        need_extraction):
+        
         try:
-            test_db = DatabaseManager()
-            if test_db.test_connection():
-                st.sidebar.success("✅ Connection successful! Refresh page.")
-            else:
-                st.sidebar.error("❌ Connection failed")
-                with st.sidebar.expander("🔍 Debug Info"):
-                    st.caption(test_db.get_connection_info())
+            with st.spinner("💾 Saving extraction results to database..."):
+                success = st.session_state['db_manager'].update_document_master_by_id(
+                    document_id=st.session_state['document_id'],
+                    extraction_status="Completed",
+                    extraction_output=st.session_state['last_extraction'],
+                    prompt_id=st.session_state.get('current_prompt_id'),
+                    retry_count=0,
+                    error_message=None,
+                    comments=f"Initial extraction completed via Streamlit interface. File: {pdf_file.name}, Columns: {len(columns)}",
+                    ocr_text=pages_to_content(pdf_pages)
+                )
+                if success:
+                    st.success(f"✅ Extraction results saved to database (Document ID: {st.session_state['document_id']})")
+                    
+                    # Record the initial extraction as version 1 (a full snapshot)
+                    version = st.session_state['db_manager'].insert_document_version(
+                        document_id=st.session_state['document_id'],
+                        extraction_output=st.session_state['last_extraction'],
+                        prompt_id=st.session_state.get('current_prompt_id'),
+                        created_by=st.session_state.get('user_id', 'streamlit_user')
+                    )
+                    st.session_state['base_version'] = version
+                    st.session_state['current_version'] = version
+                    
+                    # Show what was saved for verification
+                    with st.expander("📋 Database Save Details"):
+                        st.write(f"**Document ID:** {st.session_state['document_id']}")
+                        st.write(f"**Version:** {version['VersionNumber']} (Initial)")
+                        st.write(f"**Status:** Completed")
+                        st.write(f"**Prompt ID:** {st.session_state.get('current_prompt_id', 'N/A')}")
+                        st.write(f"**Extraction Output:** {len(st.session_state['last_extraction'])} characters")
+                        st.write(f"**Comments:** Initial extraction for {pdf_file.name}")
+                else:
+                    st.error("❌ Failed to save extraction results to database")
         except Exception as e:
-            st.sidebar.error(f"❌ Connection error: {str(e)}")
+            st.error(f"❌ Database update failed: {str(e)}")
+            # Update status to error in database
+            try:
+                st.session_state['db_manager'].update_document_master_by_id(
+                    document_id=st.session_state['document_id'],
+                    extraction_status="Error",
+                    error_message=f"Initial extraction error: {str(e)}",
+                    retry_count=0,
+                    comments=f"Error during initial extraction for {pdf_file.name}"
+                )
+                st.warning("⚠️ Document status updated to 'Error' in database")
+            except Exception as nested_e:
+                st.error(f"❌ Could not update error status: {str(nested_e)}")
+
+    rerun_timer.lap("save results")
+
+    # --- Show extraction ---
+    st.markdown("### Extraction Agent Output (Initial)")
+    
+    # Display as table
+    extraction_df = json_to_dataframe(st.session_state['last_extraction'], columns)
+    st.dataframe(extraction_df, use_container_width=True)
+    
+    if fast_path_matches:
+        st.caption(f"⚡ {len(fast_path_matches)} of {len(columns)} columns filled directly from document key-value pairs/tables (no LLM call)")
+        with st.expander("⚡ Fast Path Matches"):
+            st.dataframe(pd.DataFrame.from_dict(fast_path_matches, orient='index'), use_container_width=True)
+    
+    # Option to view raw JSON
+    with st.expander("🔍 View Raw JSON Output"):
+        st.code(st.session_state['last_extraction'], language="json")
+
+
+    rerun_timer.lap("initial output")
+    with rerun_timer.section("grounding panel"):
+        grounding_panel(columns, instructions, pdf_pages, pdf_key)
+    with rerun_timer.section("feedback panel"):
+        feedback_panel(columns, instructions, pdf_pages, pdf_file.name)
+    with rerun_timer.section("side-by-side panel"):
+        side_by_side_panel(columns)
+    with rerun_timer.section("export panel"):
+        export_panel(columns)
+
+with st.sidebar:
+    with rerun_timer.section("sidebar"):
+        feedback_log_panel()
+        extraction_stats_panel()
+        database_status_panel(pdf_file.name if files_uploaded else None)
+        prompt_performance_panel()
+    rerun_timing_panel()
 
 if not files_uploaded:
     st.info("Please upload both files and confirm to start the extraction/feedback process.")
+
+record_rerun_timing(rerun_timer.finish())
@@ -0,0 +1,86 @@
+import threading
+from collections import defaultdict
+
+
+class MetricsRecorder:
+    """
+    In-process counters and observations, labelled by keyword arguments.
+
+    Thread-safe so agents running on worker threads and the Streamlit script
+    can record into the same instance.
+
+    Usage:
+        metrics.increment("extraction_calls", use_case="Form 926")
+        metrics.observe("extraction_latency_seconds", 4.2, use_case="Form 926")
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._observations = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return (name, tuple(sorted((k, v) for k, v in labels.items() if v is not None)))
+
+    def increment(self, name, value=1, **labels):
+        """Add value to a counter"""
+        with self._lock:
+            self._counters[self._key(name, labels)] += value
+
+    def observe(self, name, value, **labels):
+        """Record one observation (count, sum, min, max are kept)"""
+        key = self._key(name, labels)
+        with self._lock:
+            stats = self._observations.get(key)
+            if stats is None:
+                self._observations[key] = {"count": 1, "sum": value, "min": value, "max": value}
+            else:
+                stats["count"] += 1
+                stats["sum"] += value
+                stats["min"] = min(stats["min"], value)
+                stats["max"] = max(stats["max"], value)
+
+    def counter(self, name, **labels):
+        """Current value of a counter (0 if never incremented)"""
+        with self._lock:
+            return self._counters.get(self._key(name, labels), 0)
+
+    def total(self, name, **labels):
+        """Sum of a counter across every label set that includes the given labels"""
+        wanted = set((k, v) for k, v in labels.items() if v is not None)
+        with self._lock:
+            return sum(
+                value for (counter_name, counter_labels), value in self._counters.items()
+                if counter_name == name and wanted <= set(counter_labels)
+            )
+
+    def snapshot(self, prefix=None):
+        """
+        Copy of all metrics
+
+        Args:
+            prefix (str, optional): Only include metrics whose name starts with this
+
+        Returns:
+            list: dicts with name, labels and either value (counters) or count/sum/min/max/avg
+        """
+        rows = []
+        with self._lock:
+            for (name, labels), value in self._counters.items():
+                if prefix is None or name.startswith(prefix):
+                    rows.append({"name": name, "labels": dict(labels), "value": value})
+            for (name, labels), stats in self._observations.items():
+                if prefix is None or name.startswith(prefix):
+                    rows.append({"name": name, "labels": dict(labels), **stats,
+                                 "avg": stats["sum"] / stats["count"]})
+        return rows
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._observations.clear()
+
+
+# Process-wide recorder shared by the agents, the app and workers
+metrics = MetricsRecorder()
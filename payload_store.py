@@ -0,0 +1,172 @@
+import os
+import gzip
+import hashlib
+import tempfile
+import logging
+from abc import ABC, abstractmethod
+from dotenv import load_dotenv
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional; gzip is always available
+    zstandard = None
+
+load_dotenv()
+
+# References stored in document_master look like "sha256:<hex digest>"
+PAYLOAD_REF_PREFIX = "sha256:"
+
+
+def is_payload_ref(value):
+    """Check whether a column value is a payload store reference rather than inline text"""
+    return isinstance(value, str) and value.startswith(PAYLOAD_REF_PREFIX) and len(value) == len(PAYLOAD_REF_PREFIX) + 64
+
+
+class PayloadStore(ABC):
+    """Interface for storing large text payloads outside of document_master rows"""
+
+    @abstractmethod
+    def put(self, text):
+        """
+        Store a payload
+
+        Args:
+            text (str): Payload to store
+
+        Returns:
+            tuple: (reference, size) where size is the uncompressed size in bytes
+        """
+
+    @abstractmethod
+    def get(self, ref):
+        """
+        Load a payload
+
+        Args:
+            ref (str): Reference returned by put()
+
+        Returns:
+            str: The stored payload
+        """
+
+    @abstractmethod
+    def exists(self, ref):
+        """Check whether a payload is stored"""
+
+
+class LocalPayloadStore(PayloadStore):
+    """
+    Content-addressed payload store on the local filesystem.
+
+    Payloads are keyed by the SHA-256 of their text, so identical outputs and
+    OCR text across improvement iterations are stored once. Files are
+    compressed with zstd when the `zstandard` package is installed, gzip otherwise.
+    """
+
+    def __init__(self, root_dir, codec=None):
+        self.root_dir = root_dir
+        if codec is None:
+            codec = "zstd" if zstandard is not None else "gzip"
+        if codec == "zstd" and zstandard is None:
+            raise ValueError("zstd compression requires the 'zstandard' package")
+        if codec not in ("zstd", "gzip"):
+            raise ValueError(f"Unsupported payload codec: {codec}")
+        self.codec = codec
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    def _path(self, digest, codec):
+        ext = ".zst" if codec == "zstd" else ".gz"
+        return os.path.join(self.root_dir, digest[:2], digest[2:4], digest + ext)
+
+    def _compress(self, data):
+        if self.codec == "zstd":
+            return zstandard.ZstdCompressor(level=3).compress(data)
+        return gzip.compress(data, compresslevel=6)
+
+    def put(self, text):
+        data = text.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        ref = PAYLOAD_REF_PREFIX + digest
+
+        if not self.exists(ref):
+            path = self._path(digest, self.codec)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temp file and rename so readers never see a partial payload
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd, "wb") as tmp:
+                    tmp.write(self._compress(data))
+                os.replace(tmp_path, path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+        return ref, len(data)
+
+    def get(self, ref):
+        if not is_payload_ref(ref):
+            raise ValueError(f"Not a payload reference: {ref}")
+        digest = ref[len(PAYLOAD_REF_PREFIX):]
+
+        zst_path = self._path(digest, "zstd")
+        if os.path.exists(zst_path):
+            if zstandard is None:
+                raise RuntimeError(f"Payload {ref} is zstd-compressed but 'zstandard' is not installed")
+            with open(zst_path, "rb") as f:
+                return zstandard.ZstdDecompressor().decompress(f.read()).decode("utf-8")
+
+        gz_path = self._path(digest, "gzip")
+        if os.path.exists(gz_path):
+            with open(gz_path, "rb") as f:
+                return gzip.decompress(f.read()).decode("utf-8")
+
+        raise KeyError(f"Payload not found: {ref}")
+
+    def exists(self, ref):
+        digest = ref[len(PAYLOAD_REF_PREFIX):]
+        return os.path.exists(self._path(digest, "zstd")) or os.path.exists(self._path(digest, "gzip"))
+
+
+class LazyPayload:
+    """
+    Payload that is only read from the store when first used.
+
+    Not a str: read the text with `.value` (or str()) before parsing it.
+    `ref` and `size` (UTF-8 bytes, as stored in the *Size columns) are
+    available without touching the store; len() is the text's length in
+    characters, like len() of the text itself.
+    """
+
+    def __init__(self, store, ref, size=None):
+        self.store = store
+        self.ref = ref
+        self.size = size
+        self._value = None
+
+    @property
+    def value(self):
+        if self._value is None:
+            self._value = self.store.get(self.ref)
+        return self._value
+
+    def __str__(self):
+        return self.value
+
+    def __len__(self):
+        return len(self.value)
+
+    def __repr__(self):
+        return f"LazyPayload(ref={self.ref!r}, size={self.size!r})"
+
+
+def get_default_payload_store():
+    """Build the payload store configured by PAYLOAD_STORE_DIR, or None if offloading is disabled"""
+    root_dir = os.getenv("PAYLOAD_STORE_DIR")
+    if not root_dir:
+        return None
+    try:
+        return LocalPayloadStore(root_dir, codec=os.getenv("PAYLOAD_STORE_CODEC") or None)
+    except Exception as e:
+        logging.error(f"Payload store initialization failed, storing payloads inline: {str(e)}")
+        return None
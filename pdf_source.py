@@ -0,0 +1,195 @@
+import os
+import mmap
+import hashlib
+import logging
+import tempfile
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+from metrics import metrics
+
+load_dotenv()
+
+# Chunk size for copying/hashing uploads (never more than this is read at once)
+INGEST_CHUNK_BYTES = int(os.getenv("INGEST_CHUNK_BYTES", str(1024 * 1024)))
+# Total memory that concurrent ingests may reserve; 0 disables the budget
+INGEST_MEMORY_BUDGET_MB = int(os.getenv("INGEST_MEMORY_BUDGET_MB", "1024"))
+# Working memory an ingest needs per byte of PDF (page text, DI result, prompt)
+INGEST_MEMORY_FACTOR = float(os.getenv("INGEST_MEMORY_FACTOR", "4"))
+# Measure peak Python allocations per ingest with tracemalloc (slows allocation while active)
+INGEST_TRACE_MEMORY = os.getenv("INGEST_TRACE_MEMORY", "false").lower() in ("1", "true", "yes")
+
+
+def spool_to_temp_file(file_input):
+    """
+    Copy an upload (bytes, BytesIO, UploadedFile or any binary file object) to a
+    temporary file in INGEST_CHUNK_BYTES chunks; the caller removes the file.
+
+    Returns:
+        str: Path of the temporary file
+    """
+    # memoryview over bytes / BytesIO buffers avoids the copy getvalue() would make
+    if isinstance(file_input, (bytes, bytearray, memoryview)):
+        view = memoryview(file_input)
+    elif hasattr(file_input, "getbuffer"):
+        view = file_input.getbuffer()
+    else:
+        view = None
+
+    handle = tempfile.NamedTemporaryFile(prefix="ingest_", suffix=".pdf", delete=False)
+    with handle:
+        if view is not None:
+            for offset in range(0, len(view), INGEST_CHUNK_BYTES):
+                handle.write(view[offset:offset + INGEST_CHUNK_BYTES])
+            view.release()
+        else:
+            file_input.seek(0)
+            for chunk in iter(lambda: file_input.read(INGEST_CHUNK_BYTES), b""):
+                handle.write(chunk)
+    return handle.name
+
+
+class PdfSource:
+    """
+    A PDF on disk, read through a memory map instead of being held as bytes.
+
+    Paths are used as-is; uploads (bytes, BytesIO, Streamlit UploadedFile) are
+    spooled to a temporary file in INGEST_CHUNK_BYTES chunks. Worker processes
+    get the path and map the file themselves, so the PDF is never pickled or
+    copied per worker.
+
+    Usage:
+        with PdfSource(uploaded_file) as source:
+            with source.open() as stream:
+                reader = PdfReader(stream)
+    """
+
+    def __init__(self, file_input):
+        self._input = file_input
+        self._temp_path = None
+        self.path = None
+        self.size = 0
+
+    def __enter__(self):
+        if isinstance(self._input, (str, os.PathLike)):
+            self.path = os.fspath(self._input)
+        else:
+            self.path = spool_to_temp_file(self._input)
+            self._temp_path = self.path
+        self.size = os.path.getsize(self.path)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._temp_path:
+            try:
+                os.remove(self._temp_path)
+            except OSError as e:
+                logging.warning(f"Could not remove spooled PDF {self._temp_path}: {str(e)}")
+        return False
+
+    @contextmanager
+    def open(self):
+        """Read-only memory map of the file (a seekable stream for PdfReader / Document Intelligence)"""
+        with open(self.path, "rb") as handle:
+            mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                yield mapped
+            finally:
+                mapped.close()
+
+    def sha256(self):
+        """Content hash computed in chunks"""
+        digest = hashlib.sha256()
+        with open(self.path, "rb") as handle:
+            for chunk in iter(lambda: handle.read(INGEST_CHUNK_BYTES), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+
+class MemoryBudget:
+    """
+    Caps the working memory of concurrent ingests.
+
+    Each ingest reserves INGEST_MEMORY_FACTOR x its file size and waits until
+    that fits in the budget. A single document larger than the whole budget is
+    admitted once nothing else is running, so it cannot wait forever.
+    """
+
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self.reserved = 0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def reserve(self, nbytes):
+        if not self.budget_bytes:
+            yield
+            return
+        nbytes = int(nbytes)
+        with self._condition:
+            while self.reserved and self.reserved + nbytes > self.budget_bytes:
+                self._condition.wait()
+            self.reserved += nbytes
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.reserved -= nbytes
+                self._condition.notify_all()
+
+
+# Process-wide budget shared by the app, the service and workers
+ingest_budget = MemoryBudget(INGEST_MEMORY_BUDGET_MB * 1024 * 1024)
+
+_tracing_lock = threading.Lock()
+# Running peak of each open block, keyed by id(stats); tracemalloc keeps one process-wide peak
+_block_peaks = {}
+_started_tracing = False
+
+
+def _fold_peak():
+    """Fold the traced peak so far into every open block, then restart it (call with _tracing_lock held)"""
+    _, peak = tracemalloc.get_traced_memory()
+    for key in _block_peaks:
+        _block_peaks[key] = max(_block_peaks[key], peak)
+    tracemalloc.reset_peak()
+
+
+@contextmanager
+def track_peak_memory(stage):
+    """
+    Record the peak traced allocation of a block as ingest_peak_bytes{stage}
+    (only when INGEST_TRACE_MEMORY is on). tracemalloc is process-wide, so
+    concurrent blocks see each other's allocations; the peak is an upper bound.
+    Tracing is stopped only if this module started it.
+
+    Yields:
+        dict: Filled with peak_bytes when the block exits
+    """
+    global _started_tracing
+    stats = {"peak_bytes": None}
+    if not INGEST_TRACE_MEMORY:
+        yield stats
+        return
+    key = id(stats)
+    with _tracing_lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started_tracing = True
+        # Other open blocks keep the peak they reached before this one resets it
+        _fold_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        _block_peaks[key] = baseline
+    try:
+        yield stats
+    finally:
+        with _tracing_lock:
+            _fold_peak()
+            peak = _block_peaks.pop(key)
+            if not _block_peaks and _started_tracing:
+                tracemalloc.stop()
+                _started_tracing = False
+        stats["peak_bytes"] = max(0, peak - baseline)
+        metrics.observe("ingest_peak_bytes", stats["peak_bytes"], stage=stage)
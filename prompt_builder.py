@@ -0,0 +1,139 @@
+import json
+import hashlib
+from itertools import chain
+
+# Instructions used when no prompt is stored in the database for the use case
+DEFAULT_PROMPT_TEMPLATE = (
+    "Return your answer as a JSON object. "
+    "Do not write any commentary—output only the JSON in this format: "
+    '{"column1": "extractedValue", ...}'
+)
+
+
+def iter_page_blocks(pages):
+    """Yield the "Page N:" block of each page (the document format used in extraction prompts)"""
+    for page in pages:
+        yield f"Page {page['page_number']}:\n{page['content']}\n\n"
+
+
+def normalize_block(text):
+    """
+    Byte-stable form of a prompt block: unix newlines, no trailing spaces,
+    no leading/trailing blank lines. Identical inputs that differ only in
+    incidental whitespace render to identical bytes, so provider-side prefix
+    caching can reuse them.
+    """
+    lines = str(text or "").replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip("\n")
+
+
+class ExtractionPrompt:
+    """
+    Extraction prompt kept as separate parts, rendered static-first:
+
+    - template: reusable extraction instructions (what the improvement agent revises
+      and what is stored in model_prompt_library)
+    - task: the schema section listing every column and its row instruction
+    - document: the PDF content, as text or as a list of page dicts
+      (page blocks are only joined into the final prompt string by render())
+    - scope: optional per-document line restricting which columns to return
+
+    template + task form the prefix shared by every document of a use case and
+    schema; document and scope come last so they never break that prefix. Only
+    render() joins the parts; the improvement agent is given `template` alone,
+    so the document is never resent there.
+    """
+
+    def __init__(self, template, task, document, scope=""):
+        self.template = template or ""
+        self.task = task or ""
+        self.document = document or ""
+        self.scope = scope or ""
+
+    def prefix(self):
+        """Static part of the prompt (instructions + schema)"""
+        return f"{self.template}\n\n{self.task}"
+
+    def prefix_hash(self):
+        """Short hash of the static prefix; equal hashes mean the prefix is cacheable across documents"""
+        return hashlib.sha256(self.prefix().encode("utf-8")).hexdigest()[:12]
+
+    def _document_parts(self):
+        if isinstance(self.document, str):
+            return (self.document,)
+        return iter_page_blocks(self.document)
+
+    def render(self):
+        """Full prompt text for the extraction agent (built in a single join)"""
+        scope = (f"\n{self.scope}\n",) if self.scope else ()
+        return "".join(chain(
+            (self.prefix(), "\nPDF Content:\n"), self._document_parts(), ("\n",), scope
+        ))
+
+    def with_template(self, template):
+        """Same schema and document with a different template (e.g. an improved prompt)"""
+        return ExtractionPrompt(normalize_block(template), self.task, self.document, self.scope)
+
+    def __str__(self):
+        return self.render()
+
+
+def build_task_section(columns, instructions):
+    """Schema section: one line per column with its row-2 instruction, in schema order"""
+    instructions = list(instructions or [])
+    lines = ["Current Task:", "Extract the following columns from the PDF text:"]
+    for index, column in enumerate(columns):
+        instruction = instructions[index] if index < len(instructions) else None
+        instruction = " ".join(str(instruction).split()) if instruction is not None else ""
+        lines.append(f"- {column}: {instruction}" if instruction else f"- {column}")
+    return "\n".join(lines) + "\n"
+
+
+def build_scope_line(only_columns):
+    """Per-document restriction to a subset of the schema (e.g. columns the fast path could not fill)"""
+    return (
+        "For this document, return only these keys: "
+        + json.dumps(list(only_columns), ensure_ascii=False)
+    )
+
+
+def build_extraction_prompt(template, columns, instructions, document, only_columns=None):
+    """
+    Build the extraction prompt used by the UI and workers.
+
+    Args:
+        template (str): Extraction instructions (database prompt, improved prompt or DEFAULT_PROMPT_TEMPLATE)
+        columns (list): Full Excel schema columns
+        instructions (list): Row-2 instructions aligned with columns
+        document (str or list): PDF content, or its pages as {"page_number", "content"} dicts
+        only_columns (list, optional): Subset of columns to return for this document.
+            The full schema stays in the prefix so it is identical across documents.
+
+    Returns:
+        ExtractionPrompt
+    """
+    scope = ""
+    if only_columns is not None and list(only_columns) != list(columns):
+        scope = build_scope_line(only_columns)
+    return ExtractionPrompt(
+        normalize_block(template or DEFAULT_PROMPT_TEMPLATE),
+        build_task_section(columns, instructions),
+        document,
+        scope
+    )
+
+
+def prompt_text_from_improvement(improved_prompt):
+    """
+    Template text from call_improvement_agent output.
+
+    The agent returns JSON with 'Prompt Title' and 'Prompt'; only the 'Prompt'
+    part is an extraction template. Falls back to the raw text.
+    """
+    try:
+        data = json.loads(improved_prompt)
+        if isinstance(data, dict) and data.get('Prompt'):
+            return data['Prompt']
+    except (json.JSONDecodeError, TypeError):
+        pass
+    return improved_prompt
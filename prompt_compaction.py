@@ -0,0 +1,105 @@
+import os
+import re
+import logging
+from dotenv import load_dotenv
+
+from metrics import metrics
+from prompt_builder import normalize_block
+
+load_dotenv()
+
+# Longest prompt template (characters, after compaction) that may be set active
+PROMPT_MAX_CHARS = int(os.getenv("PROMPT_MAX_CHARS", "4000"))
+
+_LIST_MARKER = re.compile(r"^\s*(?:[-*•]|\d+[.)]|[a-zA-Z][.)])\s+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[A-Z\"'(])")
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+class PromptBudgetExceeded(ValueError):
+    """A prompt is still longer than PROMPT_MAX_CHARS after compaction"""
+
+    def __init__(self, length, max_chars):
+        self.length = length
+        self.max_chars = max_chars
+        super().__init__(f"Prompt is {length} characters after compaction; the limit is {max_chars}")
+
+
+def _rule_units(line):
+    """A list item is one rule; a prose line is one rule per sentence"""
+    if _LIST_MARKER.match(line):
+        return [line]
+    return [sentence for sentence in _SENTENCE_END.split(line) if sentence.strip()]
+
+
+def _rule_key(rule):
+    """Words of a rule without list marker, case and punctuation; equal keys mean the same rule"""
+    return tuple(_WORD.findall(_LIST_MARKER.sub("", rule).lower()))
+
+
+def compact_prompt(text):
+    """
+    Remove repeated rules from a prompt template.
+
+    Each list item, and each sentence of a prose line, is a rule. A rule that
+    repeats an earlier one word for word (ignoring list markers, case and
+    punctuation) is dropped; the first occurrence stays where it is. Rules
+    that differ in any word - another column, field, number or a negation -
+    are always kept, so no instruction is lost. Lines left empty are dropped
+    and blank lines are collapsed.
+
+    Args:
+        text (str): Prompt template
+
+    Returns:
+        str: Compacted template
+    """
+    lines = [_rule_units(line) if line.strip() else [] for line in normalize_block(text).split("\n")]
+
+    seen = set()
+    removed = 0
+    kept = [[] for _ in lines]
+    for row, rules in enumerate(lines):
+        for rule in rules:
+            key = _rule_key(rule)
+            if key and key in seen:
+                removed += 1
+                continue
+            seen.add(key)
+            kept[row].append(rule.strip() if kept[row] else rule.rstrip())
+
+    output = []
+    for row, rules in enumerate(kept):
+        if rules:
+            output.append(" ".join(rules))
+        elif not lines[row] and output and output[-1]:
+            output.append("")
+
+    if removed:
+        metrics.increment("prompt_compaction_rules_removed", removed)
+    return normalize_block("\n".join(output))
+
+
+def enforce_prompt_budget(text, max_chars=None):
+    """
+    Compact a prompt and check it against the length budget before it is set active
+
+    Args:
+        text (str): Prompt template
+        max_chars (int, optional): Defaults to PROMPT_MAX_CHARS
+
+    Returns:
+        str: The compacted template
+
+    Raises:
+        PromptBudgetExceeded: The compacted template is still too long
+    """
+    max_chars = max_chars or PROMPT_MAX_CHARS
+    compacted = compact_prompt(text)
+    metrics.observe("prompt_chars", len(compacted))
+    if len(compacted) < len(text or ""):
+        logging.info(f"Prompt compacted from {len(text)} to {len(compacted)} characters")
+    if len(compacted) > max_chars:
+        metrics.increment("prompt_budget_rejections")
+        raise PromptBudgetExceeded(len(compacted), max_chars)
+    return compacted
@@ -0,0 +1,102 @@
+import os
+import socket
+import threading
+import logging
+from dotenv import load_dotenv
+
+from database import get_storage_backend
+
+load_dotenv()
+
+
+def default_worker_id():
+    """Identifier for this worker process (host:pid), used as the lease owner"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class LeaseHeartbeat:
+    """
+    Keeps the lease on a claimed document alive while a long job runs.
+
+    Renews the lease every `interval` seconds on a background thread until the
+    block exits. If a renewal reports the claim was lost (the reaper already
+    returned the document to the queue), `lost` is set so the job can stop
+    early. Writes made with worker_id= are refused once the claim is lost, so
+    results never land on a document another worker now owns.
+
+    Usage:
+        doc = db.fetch_and_lock_next_document(worker_id=worker_id)
+        with LeaseHeartbeat(db, doc['DocumentID'], worker_id) as heartbeat:
+            ...
+            if heartbeat.lost:
+                return
+            db.update_document_master_by_id(doc['DocumentID'], extraction_status='Completed',
+                                            extraction_output=output, worker_id=worker_id)
+    """
+
+    def __init__(self, db_manager, document_id, worker_id, lease_seconds=None, interval=None):
+        self.db_manager = db_manager
+        self.document_id = document_id
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds or int(os.getenv("QUEUE_LEASE_SECONDS", "300"))
+        # Renew at a third of the lease so one missed heartbeat does not lose the claim
+        self.interval = interval or max(1, self.lease_seconds // 3)
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                if not self.db_manager.renew_document_lease(self.document_id, self.worker_id, self.lease_seconds):
+                    logging.warning(f"Lease lost for document {self.document_id} (worker {self.worker_id})")
+                    self.lost = True
+                    return
+            except Exception as e:
+                # Transient DB errors: keep trying until the lease actually expires
+                logging.error(f"Lease heartbeat failed for document {self.document_id}: {str(e)}")
+
+    def __enter__(self):
+        self._thread = threading.Thread(
+            target=self._run, name=f"lease-heartbeat-{self.document_id}", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        return False
+
+
+def run_reaper(db_manager=None, interval=None, max_retries=None, stop_event=None):
+    """
+    Periodically return expired Processing documents to the queue.
+
+    Args:
+        db_manager (StorageBackend, optional): Database to reap. Defaults to get_storage_backend()
+        interval (int, optional): Seconds between sweeps. Defaults to QUEUE_REAPER_INTERVAL env var, or 60
+        max_retries (int, optional): Retries before dead-lettering. Defaults to QUEUE_MAX_RETRIES env var
+        stop_event (threading.Event, optional): Set to stop the loop
+    """
+    db_manager = db_manager or get_storage_backend()
+    interval = interval or int(os.getenv("QUEUE_REAPER_INTERVAL", "60"))
+    stop_event = stop_event or threading.Event()
+
+    while not stop_event.is_set():
+        try:
+            reaped = db_manager.reap_expired_leases(max_retries=max_retries)
+            for doc in reaped:
+                logging.info(
+                    f"Reaped document {doc['DocumentID']} from worker {doc.get('ExpiredWorkerID')}: "
+                    f"{doc['ExtractionStatus']} (retry {doc['RetryCount']})"
+                )
+        except Exception as e:
+            logging.error(f"Reaper sweep failed: {str(e)}")
+        stop_event.wait(interval)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run_reaper()
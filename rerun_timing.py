@@ -0,0 +1,61 @@
+import time
+from contextlib import contextmanager
+
+from metrics import metrics
+
+
+class RerunTimer:
+    """
+    Wall-clock breakdown of one Streamlit run (a full script rerun or a fragment rerun).
+
+    lap() closes the section that started at the previous lap, so long blocks
+    can be timed without re-indenting them; section() times a nested block.
+
+    Usage:
+        timer = RerunTimer("app")
+        ...  # OCR
+        timer.lap("ocr")
+        with timer.section("extraction"):
+            ...
+        timer.finish()
+    """
+
+    def __init__(self, run):
+        self.run = run
+        self.sections = []
+        self._start = time.perf_counter()
+        self._last_lap = self._start
+
+    def lap(self, name):
+        """Record the time since the previous lap (or the start) under `name`"""
+        now = time.perf_counter()
+        self.sections.append((name, now - self._last_lap))
+        self._last_lap = now
+
+    @contextmanager
+    def section(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            self.sections.append((name, now - started))
+            self._last_lap = now
+
+    def finish(self):
+        """
+        Close the run and record it in metrics (rerun_seconds / rerun_section_seconds)
+
+        Returns:
+            dict: run, total_seconds, sections [(name, seconds)] and finished_at
+        """
+        total = time.perf_counter() - self._start
+        metrics.observe("rerun_seconds", total, run=self.run)
+        for name, seconds in self.sections:
+            metrics.observe("rerun_section_seconds", seconds, run=self.run, section=name)
+        return {
+            "run": self.run,
+            "total_seconds": total,
+            "sections": list(self.sections),
+            "finished_at": time.strftime("%H:%M:%S"),
+        }
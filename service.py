@@ -0,0 +1,539 @@
+import os
+import json
+import asyncio
+import logging
+import itertools
+from collections import OrderedDict
+from contextlib import nullcontext
+from typing import Optional
+
+import uvicorn
+from dotenv import load_dotenv
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from pydantic import BaseModel
+
+from database import get_storage_backend, PRIORITY_NORMAL
+from async_database import AsyncDatabaseManager
+from write_behind import with_write_behind
+from queue_worker import LeaseHeartbeat, default_worker_id
+from document_intelligence import pages_to_content
+from hybrid_ingest import hybrid_ingest
+from pdf_source import spool_to_temp_file
+from extraction_agent import call_extraction_agent
+from improvement_agent import call_improvement_agent
+from feedback_index import record_fix
+from excel_schema import read_excel_schema, schema_from_json
+from fast_path import match_columns, remaining_columns, merge_fast_path
+from delta_extraction import affected_columns, relevant_pages, merge_delta
+from prompt_builder import DEFAULT_PROMPT_TEMPLATE, build_extraction_prompt, prompt_text_from_improvement
+from structured_output import loads_extraction
+from grounding import verify_grounding, ungrounded_columns
+from cascade import CASCADE_TIERS, run_cascade
+from prompt_compaction import PromptBudgetExceeded, enforce_prompt_budget
+from deadline import DeadlineExceeded, TIMED_OUT_STATUS, deadline_scope, with_deadline
+
+load_dotenv()
+
+# Documents extracted at the same time per process; further submissions wait for a slot
+SERVICE_MAX_CONCURRENT_JOBS = int(os.getenv("SERVICE_MAX_CONCURRENT_JOBS", "8"))
+# Finished documents kept in memory for feedback; older ones are only readable from the database
+SERVICE_JOB_CACHE_SIZE = int(os.getenv("SERVICE_JOB_CACHE_SIZE", "200"))
+# Upper bound for the `wait` parameter on submit/poll
+SERVICE_MAX_WAIT_SECONDS = 300
+
+
+class FeedbackRequest(BaseModel):
+    feedback: str
+    delta: bool = True
+    save_prompt: bool = False
+
+
+class ExtractionJob:
+    """
+    A document submitted to this service instance.
+
+    Keeps what feedback needs to re-extract without another OCR call: the
+    schema, the OCR pages and the prompt template the extraction used.
+    """
+
+    def __init__(self, document_id, file_name, use_case, columns, instructions, user_id=None, priority=None):
+        self.document_id = document_id
+        self.file_name = file_name
+        self.use_case = use_case
+        self.columns = columns
+        self.instructions = instructions
+        self.user_id = user_id
+        self.priority = priority
+        self.status = "Submitted"
+        self.extraction = None
+        self.error = None
+        self.pages = []
+        self.prompt_template = None
+        self.prompt_id = None
+        self.fast_path_columns = []
+        self.grounding = {}
+        self.version = 1
+        self.current_version = None
+        self.done = asyncio.Event()
+        self.lock = asyncio.Lock()
+
+    def to_dict(self):
+        return {
+            "document_id": self.document_id,
+            "file_name": self.file_name,
+            "use_case": self.use_case,
+            "status": self.status,
+            "version": self.version,
+            "extraction": _as_json(self.extraction),
+            "fast_path_columns": self.fast_path_columns,
+            "grounding": self.grounding,
+            "ungrounded_columns": ungrounded_columns(self.grounding),
+            "prompt_id": self.prompt_id,
+            "error": self.error,
+        }
+
+
+def _as_json(extraction):
+    """Extraction output as an object when it parses, otherwise the raw text"""
+    if extraction is None:
+        return None
+    try:
+        return loads_extraction(str(extraction))
+    except ValueError:
+        return str(extraction)
+
+
+def default_database():
+    """The STORAGE_BACKEND database when configured, otherwise None (documents kept in memory only)"""
+    try:
+        return with_write_behind(get_storage_backend(reuse_connections=True))
+    except ValueError as e:
+        logging.warning(f"Database not configured ({str(e)}); the service will not persist documents")
+        return None
+
+
+def default_ocr(pdf_path):
+    """Hybrid ingest: (pages, AnalyzeResult of the OCR'd pages or None)"""
+    return hybrid_ingest(pdf_path)
+
+
+def create_app(db=None, ocr=None, extractor=None, improver=None, max_concurrent_jobs=None):
+    """
+    Build the headless extraction service.
+
+    Every backend defaults to the one the Streamlit app uses; pass stand-ins to
+    run it locally without Azure, the LLM or SQL Server.
+
+    Args:
+        db: StorageBackend. Defaults to get_storage_backend() when configured;
+            without one, document IDs are local to the process.
+        ocr: Blocking callable(pdf_path) -> (pages, analyze_result); pages are
+            [{"page_number", "content"}] in page order, analyze_result may be None
+        extractor: async callable(prompt, columns, instructions, use_case=None) -> JSON text
+            (the model cascade only runs with the default call_extraction_agent)
+        improver: async callable(original_extraction, feedback, previous_prompt, use_case=None) -> improvement JSON text
+            (use_case scopes the past fixes it draws on)
+        max_concurrent_jobs (int, optional): Extractions running at once (SERVICE_MAX_CONCURRENT_JOBS)
+
+    Returns:
+        FastAPI
+    """
+    db = db if db is not None else default_database()
+    # Database calls run on their own bounded pool, overlapping with OCR and LLM awaits
+    async_db = AsyncDatabaseManager(db) if db is not None else None
+    ocr = ocr or default_ocr
+    extractor = extractor or call_extraction_agent
+    improver = improver or call_improvement_agent
+    slots = asyncio.Semaphore(max_concurrent_jobs or SERVICE_MAX_CONCURRENT_JOBS)
+
+    jobs = OrderedDict()
+    tasks = set()
+    local_ids = itertools.count(1)
+    # Owner of this process's leases, as a queue worker's
+    worker_id = default_worker_id()
+
+    app = FastAPI(title="Document Extraction Service")
+    app.state.jobs = jobs
+
+    @app.on_event("shutdown")
+    def close_database():
+        if async_db is not None:
+            async_db.close()
+
+    async def persist(method, *args, **kwargs):
+        # Status writes of a running extraction: a failure is logged, the extraction goes on
+        if async_db is None:
+            return None
+        try:
+            return await async_db.run(method, *args, **kwargs)
+        except Exception as e:
+            logging.error(f"Database call {method} failed: {str(e)}")
+            return None
+
+    async def read(method, *args, **kwargs):
+        # Reads answering a request: an unreachable database is a 503, not "not found"
+        if async_db is None:
+            raise HTTPException(status_code=503, detail="Database not configured")
+        try:
+            return await async_db.run(method, *args, **kwargs)
+        except Exception as e:
+            logging.error(f"Database call {method} failed: {str(e)}")
+            raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
+
+    async def new_document_id(file_name, user_id, source_type, priority):
+        if db is None:
+            return next(local_ids)
+        document_id = await persist(
+            "insert_document_request", file_name=file_name, user_id=user_id,
+            source_type=source_type, priority=priority
+        )
+        if not document_id:
+            raise HTTPException(status_code=503, detail="Failed to register document in database")
+        return document_id
+
+    def remember(job):
+        jobs[job.document_id] = job
+        jobs.move_to_end(job.document_id)
+        for document_id in list(jobs):
+            if len(jobs) <= SERVICE_JOB_CACHE_SIZE:
+                break
+            if jobs[document_id].done.is_set():
+                del jobs[document_id]
+
+    async def resolve_prompt(use_case):
+        if db is not None:
+            try:
+                prompt_data = await async_db.get_active_prompt(use_case)
+                if prompt_data:
+                    return prompt_data['PromptText'], prompt_data['PromptID']
+            except Exception as e:
+                logging.warning(f"Prompt fetch failed for {use_case}: {str(e)} - using default prompt")
+        return DEFAULT_PROMPT_TEMPLATE, None
+
+    async def claim(job):
+        # Claimed under a renewable lease, so the reaper requeues the document if this process dies
+        document = await persist(
+            "fetch_and_lock_next_document", assigned_to=job.user_id, worker_id=worker_id, document_id=job.document_id
+        )
+        if document is None and async_db is not None:
+            logging.warning(f"Could not claim document {job.document_id}; extracting without a lease")
+        return worker_id if document is not None else None
+
+    async def process(job, pdf_path):
+        async with slots:
+            job.status = "Processing"
+            owner = await claim(job)
+            heartbeat = LeaseHeartbeat(db, job.document_id, owner) if owner else nullcontext()
+            try:
+                # Stopped before the final status write, which releases the lease
+                with heartbeat, deadline_scope():
+                    # OCR, the LLM and the database calls share one budget (DEADLINE_DOCUMENT_SECONDS)
+                    job.pages, result = await asyncio.to_thread(ocr, pdf_path)
+
+                    matches = match_columns(result, job.columns, job.instructions) if result is not None else {}
+                    llm_columns, llm_instructions = remaining_columns(job.columns, job.instructions, matches)
+                    job.prompt_template, job.prompt_id = await resolve_prompt(job.use_case)
+                    prompt = build_extraction_prompt(
+                        job.prompt_template, job.columns, job.instructions, job.pages,
+                        only_columns=llm_columns if matches else None
+                    )
+
+                    llm_extraction = None
+                    if llm_columns and CASCADE_TIERS and extractor is call_extraction_agent:
+                        llm_extraction = await run_cascade(
+                            job.prompt_template, job.columns, job.instructions, job.pages, extractor,
+                            use_case=job.use_case, only_columns=llm_columns if matches else None
+                        )
+                    elif llm_columns:
+                        llm_extraction = await with_deadline(
+                            extractor(prompt.render(), llm_columns, llm_instructions, use_case=job.use_case),
+                            "extraction"
+                        )
+                    job.extraction = merge_fast_path(llm_extraction, matches, job.columns)
+                    job.fast_path_columns = list(matches)
+                    job.grounding = await asyncio.to_thread(verify_grounding, job.extraction, job.pages, job.columns)
+                job.status = "Completed"
+                updated = await persist(
+                    "update_document_master_by_id", job.document_id,
+                    extraction_status="Completed",
+                    extraction_output=job.extraction,
+                    prompt_id=job.prompt_id,
+                    retry_count=0,
+                    comments=f"Extraction completed via HTTP service. File: {job.file_name}, Columns: {len(job.columns)}",
+                    ocr_text=pages_to_content(job.pages),
+                    worker_id=owner
+                )
+                if updated is False:
+                    logging.warning(f"Lease on document {job.document_id} was lost; its database row was not updated")
+                job.current_version = await persist(
+                    "insert_document_version", job.document_id, job.extraction,
+                    prompt_id=job.prompt_id, created_by=job.user_id
+                )
+            except DeadlineExceeded as e:
+                # Recorded outside the deadline scope, so this write still has time to run
+                logging.error(f"Extraction timed out for document {job.document_id}: {str(e)}")
+                job.status = TIMED_OUT_STATUS
+                job.error = str(e)
+                await persist(
+                    "update_document_master_by_id", job.document_id,
+                    extraction_status=TIMED_OUT_STATUS,
+                    error_message=f"Service extraction timed out: {str(e)}",
+                    retry_count=0,
+                    worker_id=owner
+                )
+            except Exception as e:
+                logging.error(f"Extraction failed for document {job.document_id}: {str(e)}")
+                job.status = "Error"
+                job.error = str(e)
+                await persist(
+                    "update_document_master_by_id", job.document_id,
+                    extraction_status="Error",
+                    error_message=f"Service extraction error: {str(e)}",
+                    retry_count=0,
+                    worker_id=owner
+                )
+            finally:
+                job.done.set()
+                try:
+                    os.remove(pdf_path)
+                except OSError:
+                    pass
+
+    async def wait_for_job(job, wait):
+        if wait and wait > 0 and not job.done.is_set():
+            try:
+                await asyncio.wait_for(job.done.wait(), timeout=min(wait, SERVICE_MAX_WAIT_SECONDS))
+            except asyncio.TimeoutError:
+                pass
+
+    @app.get("/health")
+    async def health():
+        return {
+            "status": "ok",
+            "database": db is not None,
+            "in_flight": sum(1 for job in jobs.values() if not job.done.is_set()),
+        }
+
+    @app.post("/documents", status_code=202)
+    async def submit_document(
+        pdf: UploadFile = File(...),
+        schema: Optional[UploadFile] = File(None),
+        schema_json: Optional[str] = Form(None),
+        use_case: str = Form("Form 926"),
+        user_id: Optional[str] = Form(None),
+        priority: int = Form(PRIORITY_NORMAL),
+        wait: float = Form(0),
+    ):
+        """
+        Submit a PDF plus its schema (an Excel template, or schema_json as
+        {"column": "instruction"} / ["column", ...]). Returns the DocumentID at
+        once; pass `wait` (seconds) to hold the response until the extraction finishes.
+        """
+        try:
+            if schema is not None:
+                columns, instructions = await asyncio.to_thread(read_excel_schema, await schema.read())
+            elif schema_json:
+                columns, instructions = schema_from_json(schema_json)
+            else:
+                raise HTTPException(status_code=422, detail="Provide a schema workbook or schema_json")
+        except (ValueError, json.JSONDecodeError) as e:
+            raise HTTPException(status_code=422, detail=f"Invalid schema: {str(e)}")
+
+        # Spooled to disk in chunks: the upload is closed when this request returns
+        pdf_path = await asyncio.to_thread(spool_to_temp_file, pdf.file)
+        file_name = pdf.filename or "document.pdf"
+        try:
+            document_id = await new_document_id(file_name, user_id, "api", priority)
+        except BaseException:
+            # No job owns the spooled file yet, so it is removed here
+            try:
+                os.remove(pdf_path)
+            except OSError:
+                pass
+            raise
+        job = ExtractionJob(document_id, file_name, use_case, columns, instructions,
+                            user_id=user_id, priority=priority)
+        remember(job)
+
+        task = asyncio.create_task(process(job, pdf_path))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+        await wait_for_job(job, wait)
+        return job.to_dict()
+
+    @app.get("/documents/{document_id}")
+    async def get_document(document_id: int, wait: float = 0):
+        """Status and extraction of a document; `wait` (seconds) long-polls until it finishes"""
+        job = jobs.get(document_id)
+        if job is not None:
+            await wait_for_job(job, wait)
+            return job.to_dict()
+
+        document = await read("get_document_by_id", document_id) if db is not None else None
+        if not document:
+            raise HTTPException(status_code=404, detail=f"Document {document_id} not found")
+        return {
+            "document_id": document['DocumentID'],
+            "file_name": document['FileName'],
+            "status": document['ExtractionStatus'],
+            "extraction": _as_json(document.get('ExtractionOutput')),
+            "prompt_id": document.get('PromptID'),
+            "error": str(document['ErrorMessage']) if document.get('ErrorMessage') else None,
+        }
+
+    @app.post("/documents/{document_id}/feedback")
+    async def submit_feedback(document_id: int, request: FeedbackRequest):
+        """
+        Improve the prompt from reviewer feedback and re-extract. Each round builds
+        on the previous one (latest extraction and prompt) and is stored as a new
+        document version.
+        """
+        job = jobs.get(document_id)
+        if job is None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Document {document_id} is not held by this service instance; resubmit it to give feedback"
+            )
+        if not job.done.is_set():
+            raise HTTPException(status_code=409, detail="Extraction is still running")
+        if job.status != "Completed":
+            raise HTTPException(status_code=409, detail=f"Document is in status {job.status}")
+        if not request.feedback.strip():
+            raise HTTPException(status_code=422, detail="Feedback is empty")
+
+        async with job.lock:
+            try:
+                with deadline_scope():
+                    improved_prompt = await with_deadline(
+                        improver(job.extraction, request.feedback, job.prompt_template, use_case=job.use_case),
+                        "improvement"
+                    )
+                    template = prompt_text_from_improvement(improved_prompt)
+
+                    delta_columns = affected_columns(request.feedback, job.columns, job.extraction) if request.delta else []
+                    if delta_columns:
+                        delta_pages = relevant_pages(job.pages, delta_columns, job.extraction)
+                        delta_prompt = build_extraction_prompt(
+                            template, job.columns, job.instructions,
+                            delta_pages, only_columns=delta_columns
+                        )
+                        delta_output = await with_deadline(extractor(
+                            delta_prompt.render(), delta_columns,
+                            [job.instructions[job.columns.index(c)] for c in delta_columns],
+                            use_case=job.use_case
+                        ), "extraction")
+                        improved_extraction = merge_delta(job.extraction, delta_output, delta_columns)
+                    else:
+                        prompt = build_extraction_prompt(template, job.columns, job.instructions, job.pages)
+                        improved_extraction = await with_deadline(
+                            extractor(prompt.render(), job.columns, job.instructions, use_case=job.use_case),
+                            "extraction"
+                        )
+            except DeadlineExceeded as e:
+                raise HTTPException(status_code=504, detail=str(e))
+
+            # A field-level delta against the version the feedback was given on
+            version = await persist(
+                "insert_document_version", job.document_id, improved_extraction,
+                parent_version=job.current_version, parent_output=job.extraction,
+                prompt_id=job.prompt_id, feedback=request.feedback, created_by=job.user_id
+            )
+            job.version = version['VersionNumber'] if version else job.version + 1
+            job.current_version = version
+            await persist(
+                "update_document_master_by_id", job.document_id,
+                extraction_status="Improved",
+                retry_count=job.version - 1,
+                comments=f"Version {job.version} via HTTP service - Feedback: {request.feedback[:100]}"
+            )
+
+            prompt_title = None
+            try:
+                prompt_title = json.loads(improved_prompt).get('Prompt Title')
+            except (json.JSONDecodeError, TypeError, AttributeError):
+                pass
+            prompt_saved = False
+            prompt_error = None
+            if request.save_prompt and db is not None:
+                # Only a compacted prompt within the length budget may become active
+                try:
+                    template = enforce_prompt_budget(template)
+                except PromptBudgetExceeded as e:
+                    prompt_error = str(e)
+                else:
+                    prompt_saved = bool(await persist(
+                        "insert_prompt_and_set_active",
+                        prompt_title or f"Improved prompt: {request.feedback[:80]}",
+                        template, job.use_case, None, request.feedback
+                    ))
+                    if prompt_saved:
+                        # Indexed under the saved PromptID, so syncing from prompt versions does not add it again
+                        saved_prompt = await persist("get_active_prompt", job.use_case)
+                        await asyncio.to_thread(record_fix, request.feedback, job.prompt_template, template,
+                                                use_case=job.use_case,
+                                                prompt_id=saved_prompt['PromptID'] if saved_prompt else None)
+
+            job.extraction = improved_extraction
+            job.prompt_template = template
+            job.grounding = await asyncio.to_thread(verify_grounding, job.extraction, job.pages, job.columns)
+
+        return {
+            "document_id": job.document_id,
+            "version": job.version,
+            "version_id": version['VersionID'] if version else None,
+            "prompt_title": prompt_title,
+            "improved_prompt": template,
+            "prompt_saved": prompt_saved,
+            "prompt_error": prompt_error,
+            "affected_columns": delta_columns,
+            "extraction": _as_json(improved_extraction),
+            "grounding": job.grounding,
+            "ungrounded_columns": ungrounded_columns(job.grounding),
+        }
+
+    @app.get("/documents/{document_id}/versions")
+    async def get_document_versions(document_id: int):
+        """Lineage of a document, oldest first (feedback and prompt per version, without outputs)"""
+        lineage = await read("get_document_lineage", document_id) or []
+        return [
+            {
+                "version_id": version['VersionID'],
+                "version": version['VersionNumber'],
+                "parent_version_id": version['ParentVersionID'],
+                "prompt_id": version['PromptID'],
+                "feedback": str(version['Feedback']) if version.get('Feedback') else None,
+                "created_by": version['CreatedBy'],
+                "created_time": version['CreatedTime'],
+            }
+            for version in lineage
+        ]
+
+    @app.get("/documents/{document_id}/versions/{version_number}")
+    async def get_document_version(document_id: int, version_number: int):
+        """Extraction of one version, rebuilt from its lineage"""
+        output = await read("get_document_version", document_id, version_number)
+        if output is None:
+            raise HTTPException(status_code=404, detail=f"Version {version_number} of document {document_id} not found")
+        return {"document_id": document_id, "version": version_number, "extraction": _as_json(output)}
+
+    @app.get("/prompts/{use_case}")
+    async def get_active_prompt(use_case: str):
+        prompt_data = await read("get_active_prompt", use_case)
+        if not prompt_data:
+            raise HTTPException(status_code=404, detail=f"No active prompt for {use_case}")
+        return prompt_data
+
+    @app.get("/prompts/{use_case}/versions")
+    async def get_prompt_versions(use_case: str, limit: int = 20):
+        return await read("get_prompt_versions", use_case, limit) or []
+
+    return app
+
+
+if __name__ == "__main__":
+    uvicorn.run(
+        create_app(),
+        host=os.getenv("SERVICE_HOST", "0.0.0.0"),
+        port=int(os.getenv("SERVICE_PORT", "8000"))
+    )
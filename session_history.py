@@ -0,0 +1,153 @@
+import os
+import json
+import hashlib
+from collections import deque
+from datetime import datetime
+from dotenv import load_dotenv
+
+from field_delta import parse_fields, diff_fields, apply_field_delta
+
+load_dotenv()
+
+# Feedback iterations kept in a review session; older ones live in the database only
+HISTORY_MAX_ENTRIES = int(os.getenv("HISTORY_MAX_ENTRIES", "50"))
+
+
+class HistoryStore:
+    """
+    Bounded feedback history for a review session.
+
+    A ring buffer of compact entries replaces full copies of every extraction
+    and prompt:
+
+    - the extraction feedback was given on is stored once per distinct value
+      (as a baseline) and each entry refers to it by hash
+    - the improved extraction is stored as a field-level delta against that baseline
+    - improved prompts go to the payload store when one is available, leaving a reference
+
+    Full extractions are only rebuilt when a view asks for one, so rerun cost
+    does not grow with the number of iterations.
+    """
+
+    def __init__(self, max_entries=None, payload_store=None):
+        self.max_entries = max_entries or HISTORY_MAX_ENTRIES
+        self.payload_store = payload_store
+        self._entries = deque(maxlen=self.max_entries)
+        self._baselines = {}
+        self.total_iterations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __bool__(self):
+        return bool(self._entries)
+
+    def _add_baseline(self, extraction):
+        text = extraction if isinstance(extraction, str) else json.dumps(extraction, ensure_ascii=False)
+        key = hashlib.sha256((text or "").encode("utf-8")).hexdigest()[:16]
+        self._baselines.setdefault(key, text)
+        return key
+
+    def _prune_baselines(self):
+        referenced = {entry["baseline"] for entry in self._entries}
+        for key in list(self._baselines):
+            if key not in referenced:
+                del self._baselines[key]
+
+    def record(self, old_extraction, feedback, improved_prompt, improved_extraction, **details):
+        """
+        Add one feedback iteration
+
+        Args:
+            old_extraction (str): Extraction the feedback was given on
+            feedback (str): Reviewer feedback
+            improved_prompt (str): Prompt produced by the improvement agent
+            improved_extraction (str): Extraction produced with the improved prompt
+            **details: Small metadata kept as-is (document_id, prompt_id, db_available, ...)
+
+        Returns:
+            dict: The stored entry
+        """
+        self.total_iterations += 1
+        baseline_key = self._add_baseline(old_extraction)
+
+        old_fields = parse_fields(old_extraction)
+        new_fields = parse_fields(improved_extraction)
+        if old_fields is not None and new_fields is not None:
+            extraction = {"delta": diff_fields(old_fields, new_fields)}
+        else:
+            # Not JSON: nothing to diff against, keep the text
+            extraction = {"text": improved_extraction}
+
+        prompt = {"text": improved_prompt}
+        if self.payload_store and improved_prompt:
+            ref, size = self.payload_store.put(improved_prompt)
+            prompt = {"ref": ref, "size": size}
+
+        entry = {
+            "iteration": self.total_iterations,
+            "timestamp": datetime.now().isoformat(),
+            "feedback": feedback,
+            "baseline": baseline_key,
+            "extraction": extraction,
+            "prompt": prompt,
+            **details,
+        }
+        self._entries.append(entry)
+        self._prune_baselines()
+        return entry
+
+    def last(self):
+        return self._entries[-1] if self._entries else None
+
+    def entries(self):
+        """All retained entries, oldest first (compact form)"""
+        return list(self._entries)
+
+    def recent(self, count):
+        """The `count` most recent entries, newest first"""
+        return list(self._entries)[-count:][::-1]
+
+    def page(self, page_index, page_size=10):
+        """
+        One page of entries, newest first
+
+        Returns:
+            tuple: (entries on the page, total number of pages)
+        """
+        newest_first = list(self._entries)[::-1]
+        pages = max(1, -(-len(newest_first) // page_size))
+        start = page_index * page_size
+        return newest_first[start:start + page_size], pages
+
+    def old_extraction(self, entry):
+        """Full extraction the entry's feedback was given on"""
+        return self._baselines.get(entry["baseline"])
+
+    def improved_extraction(self, entry):
+        """Full improved extraction of an entry, rebuilt from its delta"""
+        if "text" in entry["extraction"]:
+            return entry["extraction"]["text"]
+        base = parse_fields(self._baselines.get(entry["baseline"])) or {}
+        return json.dumps(apply_field_delta(base, entry["extraction"]["delta"]), ensure_ascii=False)
+
+    def improved_prompt(self, entry):
+        """Improved prompt of an entry (loaded from the payload store if offloaded)"""
+        if "ref" in entry["prompt"]:
+            return self.payload_store.get(entry["prompt"]["ref"])
+        return entry["prompt"]["text"]
+
+    def summary_rows(self, entries):
+        """Lightweight rows for tabular display (no extraction rebuilt)"""
+        rows = []
+        for entry in entries:
+            delta = entry["extraction"].get("delta")
+            rows.append({
+                "Iteration": entry["iteration"],
+                "Time": entry["timestamp"][:19],
+                "Feedback": (entry["feedback"] or "")[:80],
+                "Changed Fields": ", ".join(delta["set"]) if delta else "(not JSON)",
+                "Document ID": entry.get("document_id"),
+                "Prompt ID": entry.get("prompt_id"),
+            })
+        return rows
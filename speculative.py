@@ -0,0 +1,141 @@
+import re
+import asyncio
+import logging
+
+from extraction_agent import call_extraction_agent
+from improvement_agent import generate_candidate_prompts
+from delta_extraction import columns_mentioned
+from structured_output import QUOTED_TEXT, normalize_value, parse_extraction
+
+class NoUsableCandidate(RuntimeError):
+    """Every candidate extraction failed or returned no JSON, so there is nothing to rank"""
+
+
+# Weight of feedback alignment vs. cross-candidate agreement in the final score
+FEEDBACK_WEIGHT = 0.6
+AGREEMENT_WEIGHT = 0.4
+
+# A quoted phrase or a number (amount, date, percentage) given in the feedback
+_LITERAL = re.compile(QUOTED_TEXT.pattern + r"|(\$?-?\d[\d,./-]*%?)")
+
+
+def feedback_targets(feedback, columns):
+    """
+    Work out what the feedback asks for.
+
+    Returns:
+        tuple: (columns named in the feedback, literal values quoted or numbers given in it)
+    """
+    mentioned = columns_mentioned(feedback, columns)
+    literals = [normalize_value(quoted or number) for quoted, number in _LITERAL.findall(feedback or "")]
+    return mentioned, [l for l in literals if l]
+
+
+def feedback_score(candidate, original, mentioned, literals, columns):
+    """
+    Score how well a candidate extraction answers the feedback (0-1).
+
+    Rewards changing the columns the feedback names, containing the values the
+    reviewer supplied, and leaving every other column as it was.
+    """
+    components = []
+    if mentioned:
+        changed = sum(normalize_value(candidate.get(c)) != normalize_value(original.get(c)) for c in mentioned)
+        components.append(changed / len(mentioned))
+    if literals:
+        values = " | ".join(normalize_value(v) for v in candidate.values())
+        components.append(sum(l in values for l in literals) / len(literals))
+    untouched = [c for c in columns if c not in mentioned]
+    if mentioned and untouched:
+        stable = sum(normalize_value(candidate.get(c)) == normalize_value(original.get(c)) for c in untouched)
+        components.append(stable / len(untouched))
+    return sum(components) / len(components) if components else 0.5
+
+
+def agreement_score(index, parsed, columns):
+    """Mean fraction of the other valid candidates that agree with this one, per column"""
+    others = [p for i, p in enumerate(parsed) if i != index and p is not None]
+    if not others or not columns:
+        return 0.5
+    candidate = parsed[index]
+    per_column = [
+        sum(normalize_value(candidate.get(c)) == normalize_value(o.get(c)) for o in others) / len(others)
+        for c in columns
+    ]
+    return sum(per_column) / len(per_column)
+
+
+def score_candidates(original_extraction, feedback, candidates, columns):
+    """
+    Rank candidate (prompt, extraction) pairs.
+
+    Args:
+        original_extraction (str): JSON the feedback was given on
+        feedback (str): Reviewer feedback
+        candidates (list): dicts with 'prompt' and 'extraction'
+        columns (list): Excel column names
+
+    Returns:
+        list: candidates with 'score', 'feedback_score' and 'agreement' added, best first
+    """
+    original = parse_extraction(original_extraction) or {}
+    mentioned, literals = feedback_targets(feedback, columns)
+    # Failed ({} from None) and unparseable (None) candidates are both invalid
+    parsed = [parse_extraction(c["extraction"]) or None for c in candidates]
+
+    for index, candidate in enumerate(candidates):
+        if parsed[index] is None:
+            # Failed or unparseable extraction never wins
+            candidate.update(score=0.0, feedback_score=0.0, agreement=0.0)
+            continue
+        f_score = feedback_score(parsed[index], original, mentioned, literals, columns)
+        a_score = agreement_score(index, parsed, columns)
+        candidate.update(
+            feedback_score=round(f_score, 3),
+            agreement=round(a_score, 3),
+            score=round(FEEDBACK_WEIGHT * f_score + AGREEMENT_WEIGHT * a_score, 3),
+        )
+
+    # A valid candidate outranks a failed one even when both score 0
+    valid = {id(c) for c, p in zip(candidates, parsed) if p is not None}
+    return sorted(candidates, key=lambda c: (c["score"], id(c) in valid), reverse=True)
+
+
+async def run_speculative_improvement(original_extraction, feedback, previous_prompt, build_prompt,
+                                      columns, instructions, n=3, use_case=None):
+    """
+    Generate n improved prompts and re-run extraction for all of them in parallel.
+
+    Args:
+        original_extraction (str): JSON the feedback was given on
+        feedback (str): Reviewer feedback
+        previous_prompt (str): Prompt that produced original_extraction
+        build_prompt (callable): Turns an improved prompt into the full extraction prompt
+        columns (list): Excel column names
+        instructions (list): Row-2 instructions
+        n (int): Number of candidates
+        use_case (str, optional): Use case label for token metrics
+
+    Returns:
+        list: Ranked candidate dicts (prompt, extraction, score, feedback_score, agreement), best first
+
+    Raises:
+        NoUsableCandidate: No candidate produced a parseable extraction
+    """
+    prompts = await generate_candidate_prompts(original_extraction, feedback, previous_prompt, n=n,
+                                               use_case=use_case)
+    extractions = await asyncio.gather(
+        *(call_extraction_agent(build_prompt(p), columns, instructions, use_case=use_case) for p in prompts),
+        return_exceptions=True
+    )
+
+    candidates = []
+    for prompt, extraction in zip(prompts, extractions):
+        if isinstance(extraction, Exception):
+            logging.error(f"Speculative candidate extraction failed: {str(extraction)}")
+            extraction = None
+        candidates.append({"prompt": prompt, "extraction": extraction})
+
+    if not any(parse_extraction(c["extraction"]) for c in candidates if c["extraction"] is not None):
+        raise NoUsableCandidate(f"None of the {len(candidates)} candidate prompts produced an extraction")
+    return score_candidates(original_extraction, feedback, candidates, columns)
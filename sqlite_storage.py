@@ -0,0 +1,495 @@
+import os
+import time
+import sqlite3
+import logging
+from contextlib import closing, contextmanager
+from dotenv import load_dotenv
+
+from storage import StorageBackend, PRIORITY_NORMAL
+from metrics import metrics
+from deadline import current_deadline
+
+load_dotenv()
+
+# Database file (created with the schema on first use)
+SQLITE_DATABASE_PATH = os.getenv("SQLITE_DATABASE_PATH", "document_extraction.db")
+# How long a writer keeps retrying while another connection holds the write lock
+SQLITE_BUSY_TIMEOUT_SECONDS = float(os.getenv("SQLITE_BUSY_TIMEOUT_SECONDS", "30"))
+SQLITE_SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "db_scripts", "sqlite", "CreateSchema.sql")
+
+_NOW = "datetime('now', 'localtime')"
+_DOCUMENT_COLUMNS = """
+    DocumentID, FileName, ExtractionStatus, CreatedTime, LastUpdated,
+    UserID, SourceType, RetryCount, PromptID, ExtractionOutput, ErrorMessage, Comments,
+    Priority, WorkerID, LeaseExpiry, ExtractionOutputRef, ExtractionOutputSize,
+    OcrTextRef, OcrTextSize
+"""
+_RECORD_STATS = f"""
+    INSERT INTO prompt_performance_stats (
+        PromptID, UseCase, DocumentsCompleted, DocumentsErrored, DocumentsDeadLettered,
+        LatencySamples, TotalLatencySeconds, MaxLatencySeconds,
+        RetriedDocuments, TotalRetries, ImprovementIterations, LastUpdated
+    )
+    VALUES (
+        :prompt_id, (SELECT UseCase FROM model_prompt_library WHERE PromptID = CAST(:prompt_id AS INTEGER)),
+        :completed, :errored, :dead_lettered,
+        :latency_samples, :latency, :latency_max,
+        :retried, :retries, :improved, {_NOW}
+    )
+    ON CONFLICT (PromptID) DO UPDATE SET
+        UseCase = COALESCE(UseCase, excluded.UseCase),
+        DocumentsCompleted = DocumentsCompleted + excluded.DocumentsCompleted,
+        DocumentsErrored = DocumentsErrored + excluded.DocumentsErrored,
+        DocumentsDeadLettered = DocumentsDeadLettered + excluded.DocumentsDeadLettered,
+        LatencySamples = LatencySamples + excluded.LatencySamples,
+        TotalLatencySeconds = TotalLatencySeconds + excluded.TotalLatencySeconds,
+        MaxLatencySeconds = CASE WHEN excluded.MaxLatencySeconds > COALESCE(MaxLatencySeconds, -1)
+                                 THEN excluded.MaxLatencySeconds ELSE MaxLatencySeconds END,
+        RetriedDocuments = RetriedDocuments + excluded.RetriedDocuments,
+        TotalRetries = TotalRetries + excluded.TotalRetries,
+        ImprovementIterations = ImprovementIterations + excluded.ImprovementIterations,
+        LastUpdated = excluded.LastUpdated
+"""
+
+
+def _is_lock_error(error):
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+
+class SqliteDatabaseManager(StorageBackend):
+    """
+    Single-file SQLite backend with the semantics of the SQL Server stored procedures.
+
+    Runs the app, workers and load tests without a database server. Every
+    write runs in a BEGIN IMMEDIATE transaction, which takes SQLite's single
+    write lock up front; that is what makes the claim in
+    fetch_and_lock_next_document atomic (the role UPDLOCK/READPAST play on
+    SQL Server). Readers never block in WAL mode. A writer that finds the lock
+    taken backs off and retries for up to SQLITE_BUSY_TIMEOUT_SECONDS, and
+    each failed attempt is counted as storage_lock_conflicts{backend="sqlite"}.
+    """
+
+    def __init__(self, database_path=None, payload_store=None, busy_timeout=None):
+        super().__init__(payload_store)
+        self.database_path = database_path or SQLITE_DATABASE_PATH
+        self.busy_timeout = SQLITE_BUSY_TIMEOUT_SECONDS if busy_timeout is None else busy_timeout
+        self._create_schema()
+
+    def _create_schema(self):
+        with open(SQLITE_SCHEMA_PATH, "r", encoding="utf-8") as f:
+            schema = f.read()
+        with closing(sqlite3.connect(self.database_path, timeout=self.busy_timeout)) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(schema)
+
+    def get_connection(self):
+        """Autocommit connection; transactions are opened explicitly"""
+        try:
+            conn = sqlite3.connect(self.database_path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            return conn
+        except Exception as e:
+            logging.error(f"Database connection failed: {str(e)}")
+            raise
+
+    @contextmanager
+    def _read(self):
+        with closing(self.get_connection()) as conn:
+            yield conn
+
+    @contextmanager
+    def _write_transaction(self):
+        """BEGIN IMMEDIATE with back-off while another writer holds the lock; commits on success"""
+        with closing(self.get_connection()) as conn:
+            # Lock waits also end with the request deadline, if one is set
+            request_deadline = current_deadline()
+            busy_timeout = self.busy_timeout if request_deadline is None else min(self.busy_timeout, request_deadline.remaining())
+            deadline = time.monotonic() + busy_timeout
+            delay = 0.001
+            # Fail fast on the write lock so waits are retried (and counted) here, not in SQLite's busy handler
+            conn.execute("PRAGMA busy_timeout = 0")
+            while True:
+                try:
+                    conn.execute("BEGIN IMMEDIATE")
+                    conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout * 1000)}")
+                    break
+                except sqlite3.OperationalError as e:
+                    if not _is_lock_error(e) or time.monotonic() >= deadline:
+                        raise
+                    metrics.increment("storage_lock_conflicts", backend="sqlite")
+                    time.sleep(delay)
+                    delay = min(delay * 2, 0.05)
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    # --- Prompts ---
+
+    def get_active_prompt(self, use_case=None):
+        try:
+            with self._read() as conn:
+                row = conn.execute("""
+                    SELECT PromptID, PromptTitle, PromptText, UseCase, EffectivenessScore
+                    FROM model_prompt_library
+                    WHERE IsActive = 1 AND (:use_case IS NULL OR UseCase = :use_case)
+                    ORDER BY EffectivenessScore DESC, LastModifiedTime DESC
+                    LIMIT 1
+                """, {"use_case": use_case}).fetchone()
+                return dict(row) if row else None
+        except Exception as e:
+            logging.error(f"Error fetching active prompt: {str(e)}")
+            raise
+
+    def insert_prompt_and_set_active(self, prompt_title, prompt_text, use_case, effectiveness_score=None, feedback_requested=None):
+        try:
+            with self._write_transaction() as conn:
+                conn.execute("UPDATE model_prompt_library SET IsActive = 0 WHERE UseCase = ?", (use_case,))
+                conn.execute(f"""
+                    INSERT INTO model_prompt_library
+                        (PromptTitle, PromptText, UseCase, EffectivenessScore, IsActive, LastModifiedTime, FeedbackRequested)
+                    VALUES (?, ?, ?, ?, 1, {_NOW}, ?)
+                """, (prompt_title, prompt_text, use_case, effectiveness_score, feedback_requested))
+            return True
+        except Exception as e:
+            logging.error(f"Error inserting prompt: {str(e)}")
+            raise
+
+    def get_prompt_versions(self, use_case=None, limit=20):
+        try:
+            with self._read() as conn:
+                rows = conn.execute("""
+                    SELECT PromptID, PromptTitle, PromptText, LENGTH(PromptText) AS PromptLength, UseCase,
+                           IsActive, EffectivenessScore, CreatedTime, FeedbackRequested
+                    FROM model_prompt_library
+                    WHERE (:use_case IS NULL OR UseCase = :use_case)
+                    ORDER BY CreatedTime DESC, PromptID DESC
+                    LIMIT :limit
+                """, {"use_case": use_case, "limit": limit or 20}).fetchall()
+                return [dict(row) for row in rows]
+        except Exception as e:
+            logging.error(f"Error fetching prompt versions: {str(e)}")
+            raise
+
+    # --- Work queue ---
+
+    def insert_document_request(self, file_name, user_id=None, source_type=None, priority=None):
+        try:
+            with self._write_transaction() as conn:
+                cursor = conn.execute(f"""
+                    INSERT INTO document_master
+                        (FileName, ExtractionStatus, CreatedTime, LastUpdated, UserID, SourceType, RetryCount, Priority)
+                    VALUES (?, 'Submitted', {_NOW}, {_NOW}, ?, ?, 0, ?)
+                """, (file_name, user_id, source_type, priority if priority is not None else PRIORITY_NORMAL))
+                return cursor.lastrowid
+        except Exception as e:
+            logging.error(f"Error inserting document request: {str(e)}")
+            return None
+
+    def fetch_and_lock_next_document(self, current_status='Submitted', next_status='Processing', assigned_to=None,
+                                     aging_minutes=None, worker_id=None, lease_seconds=None, document_id=None):
+        try:
+            if aging_minutes is None:
+                aging_minutes = int(os.getenv("QUEUE_AGING_MINUTES", "15"))
+            if lease_seconds is None:
+                lease_seconds = int(os.getenv("QUEUE_LEASE_SECONDS", "300"))
+            with self._write_transaction() as conn:
+                # Every aging_minutes spent waiting promotes a document by one priority level
+                row = conn.execute(f"""
+                    SELECT DocumentID
+                    FROM document_master
+                    WHERE ExtractionStatus = :status AND (:document_id IS NULL OR DocumentID = :document_id)
+                    ORDER BY Priority - CAST((julianday({_NOW}) - julianday(CreatedTime)) * 1440 AS INTEGER) / :aging,
+                             CreatedTime
+                    LIMIT 1
+                """, {"status": current_status, "aging": aging_minutes or 15, "document_id": document_id}).fetchone()
+                if row is None:
+                    return None
+                conn.execute(f"""
+                    UPDATE document_master
+                    SET ExtractionStatus = ?, LastUpdated = {_NOW}, PickedTime = {_NOW}, UserID = ?, WorkerID = ?,
+                        LeaseExpiry = datetime('now', 'localtime', ?)
+                    WHERE DocumentID = ?
+                """, (next_status, assigned_to, worker_id, f"{lease_seconds or 300} seconds", row['DocumentID']))
+                document = conn.execute("SELECT * FROM document_master WHERE DocumentID = ?", (row['DocumentID'],)).fetchone()
+            # The claim only needs the row; offloaded text is read when the worker asks for it
+            return self._attach_payloads(dict(document), resolve=False)
+        except Exception as e:
+            logging.error(f"Error fetching next document: {str(e)}")
+            raise
+
+    def renew_document_lease(self, document_id, worker_id, lease_seconds=None):
+        try:
+            if lease_seconds is None:
+                lease_seconds = int(os.getenv("QUEUE_LEASE_SECONDS", "300"))
+            with self._write_transaction() as conn:
+                cursor = conn.execute(f"""
+                    UPDATE document_master
+                    SET LeaseExpiry = datetime('now', 'localtime', ?), LastUpdated = {_NOW}
+                    WHERE DocumentID = ? AND WorkerID = ? AND ExtractionStatus = 'Processing'
+                """, (f"{lease_seconds or 300} seconds", document_id, worker_id))
+                return cursor.rowcount > 0
+        except Exception as e:
+            logging.error(f"Error renewing document lease: {str(e)}")
+            raise
+
+    def reap_expired_leases(self, max_retries=None):
+        try:
+            if max_retries is None:
+                max_retries = int(os.getenv("QUEUE_MAX_RETRIES", "3"))
+            reaped = []
+            with self._write_transaction() as conn:
+                expired = conn.execute(f"""
+                    SELECT DocumentID, RetryCount, WorkerID, PromptID
+                    FROM document_master
+                    WHERE ExtractionStatus = 'Processing' AND LeaseExpiry IS NOT NULL AND LeaseExpiry < {_NOW}
+                """).fetchall()
+                for row in expired:
+                    retry_count = (row['RetryCount'] or 0) + 1
+                    dead = retry_count > max_retries
+                    status = 'DeadLetter' if dead else 'Submitted'
+                    conn.execute(f"""
+                        UPDATE document_master
+                        SET RetryCount = ?, ExtractionStatus = ?,
+                            ErrorMessage = CASE WHEN ? THEN ? ELSE ErrorMessage END,
+                            WorkerID = NULL, LeaseExpiry = NULL, LastUpdated = {_NOW}
+                        WHERE DocumentID = ?
+                    """, (retry_count, status, dead,
+                          f"Lease expired on worker {row['WorkerID']} after {retry_count} attempts", row['DocumentID']))
+                    if dead:
+                        self._record_stats(conn, row['PromptID'], dead_lettered=1, retried=1, retries=retry_count)
+                    reaped.append({
+                        'DocumentID': row['DocumentID'], 'ExtractionStatus': status,
+                        'RetryCount': retry_count, 'ExpiredWorkerID': row['WorkerID'],
+                    })
+            return reaped
+        except Exception as e:
+            logging.error(f"Error reaping expired leases: {str(e)}")
+            raise
+
+    def _record_stats(self, conn, prompt_id, completed=0, errored=0, dead_lettered=0, latency=None,
+                      retried=0, retries=0, improved=0):
+        # Same running totals usp_UpdateDocumentMasterByID / usp_ReapExpiredLeases maintain
+        conn.execute(_RECORD_STATS, {
+            "prompt_id": str(prompt_id) if prompt_id is not None else 'Default',
+            "completed": completed, "errored": errored, "dead_lettered": dead_lettered,
+            "latency_samples": 0 if latency is None else 1, "latency": latency or 0, "latency_max": latency,
+            "retried": retried, "retries": retries, "improved": improved,
+        })
+
+    def _apply_update(self, conn, document_id, extraction_status=None, extraction_output=None, prompt_id=None,
+                      retry_count=None, error_message=None, comments=None, ocr_text=None, improved_count=0,
+                      worker_id=None):
+        old = conn.execute("SELECT ExtractionStatus, WorkerID FROM document_master WHERE DocumentID = ?",
+                           (document_id,)).fetchone()
+        if old is None:
+            return False
+        # Same guard as @WorkerID in usp_UpdateDocumentMasterByID: a lost claim writes nothing
+        if worker_id is not None and (old['WorkerID'] != worker_id or old['ExtractionStatus'] != 'Processing'):
+            return False
+        update = self._prepare_update(extraction_output, ocr_text, error_message, comments)
+        conn.execute(f"""
+            UPDATE document_master
+            SET
+                ExtractionStatus = COALESCE(:status, ExtractionStatus),
+                ExtractionOutput = CASE WHEN :output_ref IS NOT NULL THEN NULL
+                                        ELSE COALESCE(:output, ExtractionOutput) END,
+                ExtractionOutputRef = CASE WHEN :output IS NOT NULL AND :output_ref IS NULL THEN NULL
+                                           ELSE COALESCE(:output_ref, ExtractionOutputRef) END,
+                ExtractionOutputSize = CASE WHEN :output IS NOT NULL AND :output_ref IS NULL THEN NULL
+                                            ELSE COALESCE(:output_size, ExtractionOutputSize) END,
+                OcrTextRef = COALESCE(:ocr_ref, OcrTextRef),
+                OcrTextSize = COALESCE(:ocr_size, OcrTextSize),
+                PromptID = COALESCE(:prompt_id, PromptID),
+                ErrorMessage = COALESCE(:error_message, ErrorMessage),
+                Comments = COALESCE(:comments, Comments),
+                RetryCount = COALESCE(:retry_count, RetryCount),
+                WorkerID = CASE WHEN :status IS NOT NULL AND :status <> 'Processing'
+                                THEN NULL ELSE WorkerID END,
+                LeaseExpiry = CASE WHEN :status IS NOT NULL AND :status <> 'Processing'
+                                   THEN NULL ELSE LeaseExpiry END,
+                LastUpdated = {_NOW},
+                CompletedTime = {_NOW}
+            WHERE DocumentID = :document_id
+        """, {
+            "document_id": document_id, "status": extraction_status,
+            "output": None if update['extraction_output'] is None else str(update['extraction_output']),
+            "output_ref": update['output_ref'], "output_size": update['output_size'],
+            "ocr_ref": update['ocr_ref'], "ocr_size": update['ocr_size'],
+            "prompt_id": str(prompt_id) if prompt_id is not None else None,
+            "error_message": update['error_message'], "comments": update['comments'],
+            "retry_count": retry_count,
+        })
+
+        # Fold the status transition into the per-prompt running totals
+        finished = extraction_status in ('Completed', 'Error') and extraction_status != old['ExtractionStatus']
+        if finished or improved_count:
+            new = conn.execute("""
+                SELECT PromptID, RetryCount,
+                       (julianday(CompletedTime) - julianday(PickedTime)) * 86400 AS LatencySeconds
+                FROM document_master WHERE DocumentID = ?
+            """, (document_id,)).fetchone()
+            retries = (new['RetryCount'] or 0) if finished else 0
+            self._record_stats(
+                conn, new['PromptID'],
+                completed=int(finished and extraction_status == 'Completed'),
+                errored=int(finished and extraction_status == 'Error'),
+                latency=new['LatencySeconds'] if finished and extraction_status == 'Completed' else None,
+                retried=int(retries > 0), retries=retries,
+                improved=improved_count,
+            )
+        return True
+
+    def update_document_master_by_id(self, document_id, extraction_status=None, extraction_output=None,
+                                     prompt_id=None, retry_count=None, error_message=None, comments=None,
+                                     ocr_text=None, worker_id=None):
+        try:
+            with self._write_transaction() as conn:
+                return self._apply_update(
+                    conn, document_id, extraction_status, extraction_output, prompt_id, retry_count,
+                    error_message, comments, ocr_text, improved_count=int(extraction_status == 'Improved'),
+                    worker_id=worker_id
+                )
+        except Exception as e:
+            logging.error(f"Error updating document: {str(e)}")
+            raise
+
+    def batch_update_document_master(self, updates):
+        try:
+            with self._write_transaction() as conn:
+                return sum(
+                    self._apply_update(conn, **entry)
+                    for entry in updates
+                )
+        except Exception as e:
+            logging.error(f"Error batch updating documents: {str(e)}")
+            raise
+
+    def get_queue_statistics(self, window_minutes=60):
+        try:
+            with self._read() as conn:
+                rows = conn.execute(f"""
+                    SELECT
+                        Priority,
+                        SUM(CASE WHEN ExtractionStatus = 'Submitted' THEN 1 ELSE 0 END) AS QueuedCount,
+                        SUM(CASE WHEN ExtractionStatus = 'Processing' THEN 1 ELSE 0 END) AS ProcessingCount,
+                        MAX(CASE WHEN ExtractionStatus = 'Submitted'
+                                 THEN CAST((julianday({_NOW}) - julianday(CreatedTime)) * 86400 AS INTEGER) END) AS OldestQueuedWaitSeconds,
+                        AVG(CASE WHEN ExtractionStatus = 'Submitted'
+                                 THEN (julianday({_NOW}) - julianday(CreatedTime)) * 86400 END) AS AvgQueuedWaitSeconds,
+                        SUM(CASE WHEN PickedTime >= datetime('now', 'localtime', :window) THEN 1 ELSE 0 END) AS PickedInWindow,
+                        AVG(CASE WHEN PickedTime >= datetime('now', 'localtime', :window)
+                                 THEN (julianday(PickedTime) - julianday(CreatedTime)) * 86400 END) AS AvgPickupWaitSeconds,
+                        MAX(CASE WHEN PickedTime >= datetime('now', 'localtime', :window)
+                                 THEN CAST((julianday(PickedTime) - julianday(CreatedTime)) * 86400 AS INTEGER) END) AS MaxPickupWaitSeconds
+                    FROM document_master
+                    WHERE ExtractionStatus IN ('Submitted', 'Processing')
+                       OR PickedTime >= datetime('now', 'localtime', :window)
+                    GROUP BY Priority
+                    ORDER BY Priority
+                """, {"window": f"-{window_minutes or 60} minutes"}).fetchall()
+                return [dict(row) for row in rows]
+        except Exception as e:
+            logging.error(f"Error fetching queue statistics: {str(e)}")
+            raise
+
+    def get_prompt_performance(self, use_case=None, prompt_id=None):
+        try:
+            with self._read() as conn:
+                rows = conn.execute("""
+                    SELECT
+                        PromptID, UseCase, DocumentsCompleted, DocumentsErrored, DocumentsDeadLettered,
+                        TotalLatencySeconds / NULLIF(LatencySamples, 0) AS AvgLatencySeconds,
+                        MaxLatencySeconds,
+                        CAST(RetriedDocuments AS REAL)
+                            / NULLIF(DocumentsCompleted + DocumentsErrored + DocumentsDeadLettered, 0) AS RetryRate,
+                        TotalRetries,
+                        ImprovementIterations,
+                        CAST(ImprovementIterations AS REAL) / NULLIF(DocumentsCompleted, 0) AS ImprovementsPerDocument,
+                        LastUpdated
+                    FROM prompt_performance_stats
+                    WHERE (:use_case IS NULL OR UseCase = :use_case)
+                      AND (:prompt_id IS NULL OR PromptID = :prompt_id)
+                    ORDER BY LastUpdated DESC
+                """, {"use_case": use_case, "prompt_id": str(prompt_id) if prompt_id is not None else None}).fetchall()
+                return [dict(row) for row in rows]
+        except Exception as e:
+            logging.error(f"Error fetching prompt performance: {str(e)}")
+            raise
+
+    # --- Documents and versions ---
+
+    def get_document_by_id(self, document_id):
+        try:
+            with self._read() as conn:
+                row = conn.execute(f"SELECT {_DOCUMENT_COLUMNS} FROM document_master WHERE DocumentID = ?",
+                                   (document_id,)).fetchone()
+                return self._attach_payloads(dict(row)) if row else None
+        except Exception as e:
+            logging.error(f"Error fetching document by ID: {str(e)}")
+            raise
+
+    def get_document_by_filename(self, filename):
+        try:
+            with self._read() as conn:
+                row = conn.execute(f"""
+                    SELECT {_DOCUMENT_COLUMNS} FROM document_master
+                    WHERE FileName = ? ORDER BY CreatedTime DESC, DocumentID DESC LIMIT 1
+                """, (filename,)).fetchone()
+                return self._attach_payloads(dict(row)) if row else None
+        except Exception as e:
+            logging.error(f"Error fetching document by filename: {str(e)}")
+            raise
+
+    def insert_document_version(self, document_id, extraction_output, parent_version=None, parent_output=None,
+                                prompt_id=None, feedback=None, created_by=None):
+        try:
+            is_snapshot, output_data = self._prepare_version(extraction_output, parent_version, parent_output)
+            with self._write_transaction() as conn:
+                version_number = conn.execute(
+                    "SELECT COALESCE(MAX(VersionNumber), 0) + 1 FROM document_version WHERE DocumentID = ?",
+                    (document_id,)
+                ).fetchone()[0]
+                cursor = conn.execute(f"""
+                    INSERT INTO document_version
+                        (DocumentID, VersionNumber, ParentVersionID, PromptID, IsSnapshot, OutputData, Feedback, CreatedBy, CreatedTime)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, {_NOW})
+                """, (document_id, version_number, parent_version['VersionID'] if parent_version else None,
+                      str(prompt_id) if prompt_id is not None else None, int(is_snapshot), output_data,
+                      self._offload_if_large(feedback), created_by))
+                return {'VersionID': cursor.lastrowid, 'VersionNumber': version_number}
+        except Exception as e:
+            logging.error(f"Error inserting document version: {str(e)}")
+            raise
+
+    def get_document_lineage(self, document_id, up_to_version=None):
+        try:
+            with self._read() as conn:
+                rows = conn.execute("""
+                    SELECT VersionID, DocumentID, VersionNumber, ParentVersionID, PromptID,
+                           IsSnapshot, OutputData, Feedback, CreatedBy, CreatedTime
+                    FROM document_version
+                    WHERE DocumentID = :document_id AND (:up_to IS NULL OR VersionNumber <= :up_to)
+                    ORDER BY VersionNumber
+                """, {"document_id": document_id, "up_to": up_to_version}).fetchall()
+            return self._attach_lineage_payloads([dict(row) for row in rows])
+        except Exception as e:
+            logging.error(f"Error fetching document lineage: {str(e)}")
+            raise
+
+    # --- Diagnostics ---
+
+    def test_connection(self):
+        try:
+            with self._read() as conn:
+                return conn.execute("SELECT 1").fetchone()[0] == 1
+        except Exception as e:
+            logging.error(f"Connection test failed: {str(e)}")
+            return False
+
+    def get_connection_info(self):
+        return f"sqlite:///{os.path.abspath(self.database_path)}"
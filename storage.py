@@ -0,0 +1,270 @@
+import os
+import logging
+from abc import ABC, abstractmethod
+from dotenv import load_dotenv
+
+from payload_store import get_default_payload_store, is_payload_ref, LazyPayload
+from version_lineage import encode_version, rebuild_version
+
+load_dotenv()
+
+# Queue priorities for document_master.Priority (lower values are claimed first)
+PRIORITY_INTERACTIVE = 1
+PRIORITY_NORMAL = 5
+PRIORITY_BULK = 9
+
+# "sqlserver" (pyodbc + the stored procedures in db_scripts/) or "sqlite" (single-file, no server)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlserver").lower()
+
+
+class StorageBackend(ABC):
+    """
+    Data layer used by the app, the service and queue workers.
+
+    Implementations keep the semantics of the SQL Server stored procedures:
+    priority-with-aging claims under a renewable lease, lease reaping with
+    dead-lettering, one active prompt per use case, payload offloading and
+    delta-encoded document versions. Payload handling and version encoding
+    live here so every backend stores the same thing.
+    """
+
+    def __init__(self, payload_store=None):
+        # Large outputs/OCR text go to the payload store when one is configured (PAYLOAD_STORE_DIR)
+        self.payload_store = payload_store if payload_store is not None else get_default_payload_store()
+        self.payload_inline_limit = int(os.getenv("PAYLOAD_INLINE_LIMIT", "4000"))
+
+    # --- Payload helpers shared by every backend ---
+
+    def _offload_text(self, text):
+        """Store text in the payload store, returning (ref, size)"""
+        return self.payload_store.put(str(text))
+
+    def _offload_if_large(self, text):
+        """Replace text longer than payload_inline_limit with a payload reference"""
+        if text is None or not self.payload_store or len(str(text)) <= self.payload_inline_limit:
+            return text
+        ref, _ = self._offload_text(text)
+        return ref
+
+    def _attach_payloads(self, document, resolve=True):
+        """
+        Attach payload references in a document row.
+
+        Every offloaded field gets a LazyPayload under '<field>Payload'
+        (ExtractionOutputPayload, CommentsPayload, ErrorMessagePayload,
+        OcrTextPayload), read from the store on first use. With resolve,
+        ExtractionOutput, Comments and ErrorMessage are also filled with their
+        text (plain str, as when stored inline); without it they are left None
+        until resolve_payloads is called. The OCR text is never resolved.
+        """
+        if not document or not self.payload_store:
+            return document
+        if document.get('ExtractionOutputRef'):
+            document['ExtractionOutputPayload'] = LazyPayload(
+                self.payload_store, document['ExtractionOutputRef'], document.get('ExtractionOutputSize')
+            )
+        if document.get('OcrTextRef'):
+            document['OcrTextPayload'] = LazyPayload(
+                self.payload_store, document['OcrTextRef'], document.get('OcrTextSize')
+            )
+        for key in ('Comments', 'ErrorMessage'):
+            if is_payload_ref(document.get(key)):
+                document[f'{key}Payload'] = LazyPayload(self.payload_store, document[key])
+                document[key] = None
+        return self.resolve_payloads(document) if resolve else document
+
+    def resolve_payloads(self, document):
+        """
+        Fill ExtractionOutput, Comments and ErrorMessage of a row from its lazy
+        payloads (e.g. a claimed document once its output is needed)
+
+        Returns:
+            dict: The same document
+        """
+        for key in ('ExtractionOutput', 'Comments', 'ErrorMessage'):
+            payload = (document or {}).get(f'{key}Payload')
+            if payload is not None:
+                document[key] = payload.value
+        return document
+
+    def _prepare_update(self, extraction_output, ocr_text, error_message, comments):
+        """
+        Offload the payloads of an update_document_master_by_id call
+
+        Returns:
+            dict: extraction_output, output_ref, output_size, ocr_ref, ocr_size, error_message, comments
+        """
+        output_ref = output_size = ocr_ref = ocr_size = None
+        if self.payload_store:
+            if extraction_output is not None:
+                output_ref, output_size = self._offload_text(extraction_output)
+                extraction_output = None
+            if ocr_text is not None:
+                ocr_ref, ocr_size = self._offload_text(ocr_text)
+            error_message = self._offload_if_large(error_message)
+            comments = self._offload_if_large(comments)
+        return {
+            'extraction_output': extraction_output, 'output_ref': output_ref, 'output_size': output_size,
+            'ocr_ref': ocr_ref, 'ocr_size': ocr_size, 'error_message': error_message, 'comments': comments,
+        }
+
+    def _prepare_version(self, extraction_output, parent_version, parent_output):
+        """Storage form of a new version: (is_snapshot, output_data), large snapshots offloaded"""
+        is_snapshot, output_data = encode_version(
+            extraction_output,
+            parent_output if parent_version else None,
+            parent_version['VersionNumber'] if parent_version else None
+        )
+        if is_snapshot:
+            output_data = self._offload_if_large(output_data)
+        return is_snapshot, output_data
+
+    def _attach_lineage_payloads(self, lineage):
+        # Offloaded snapshots/feedback are returned as text, like inline ones
+        if self.payload_store:
+            for version in lineage:
+                for key in ('OutputData', 'Feedback'):
+                    if is_payload_ref(version.get(key)):
+                        version[key] = self.payload_store.get(version[key])
+        return lineage
+
+    # --- Prompts ---
+
+    @abstractmethod
+    def get_active_prompt(self, use_case=None):
+        """Active prompt for a use case (PromptID, PromptTitle, PromptText, UseCase, EffectivenessScore) or None"""
+
+    @abstractmethod
+    def insert_prompt_and_set_active(self, prompt_title, prompt_text, use_case, effectiveness_score=None, feedback_requested=None):
+        """Insert a prompt and make it the only active one for its use case"""
+
+    @abstractmethod
+    def get_prompt_versions(self, use_case=None, limit=20):
+        """Most recent prompts of a use case (all use cases if None), newest first"""
+
+    # --- Work queue ---
+
+    @abstractmethod
+    def insert_document_request(self, file_name, user_id=None, source_type=None, priority=None):
+        """Queue a document ('Submitted'); returns its DocumentID or None"""
+
+    @abstractmethod
+    def fetch_and_lock_next_document(self, current_status='Submitted', next_status='Processing', assigned_to=None,
+                                     aging_minutes=None, worker_id=None, lease_seconds=None, document_id=None):
+        """
+        Claim the next document by aged priority (or only document_id) under a lease; returns the row or None.
+        Offloaded payloads of the row are not read (see resolve_payloads)
+        """
+
+    @abstractmethod
+    def renew_document_lease(self, document_id, worker_id, lease_seconds=None):
+        """Extend a claim held by worker_id; False when the claim was lost"""
+
+    @abstractmethod
+    def reap_expired_leases(self, max_retries=None):
+        """Requeue or dead-letter documents whose lease expired"""
+
+    @abstractmethod
+    def update_document_master_by_id(self, document_id, extraction_status=None, extraction_output=None,
+                                     prompt_id=None, retry_count=None, error_message=None, comments=None,
+                                     ocr_text=None, worker_id=None):
+        """
+        Update a document (None leaves a column unchanged); leaving 'Processing' releases the lease.
+        With worker_id, the update applies only while that worker holds the claim.
+        Returns True when the row was updated (False: unknown document or claim lost)
+        """
+
+    @abstractmethod
+    def batch_update_document_master(self, updates):
+        """
+        Apply several coalesced updates in one round trip (see write_behind.WriteBehindBuffer)
+
+        Args:
+            updates (list): dicts with document_id, the update_document_master_by_id keyword
+                arguments (missing or None leaves a column unchanged; worker_id guards
+                the entry as in update_document_master_by_id) and improved_count,
+                the number of 'Improved' updates folded into the entry
+
+        Returns:
+            int: Documents updated
+        """
+
+    @abstractmethod
+    def get_queue_statistics(self, window_minutes=60):
+        """Queue depth, throughput and latency figures over the last window_minutes"""
+
+    @abstractmethod
+    def get_prompt_performance(self, use_case=None, prompt_id=None):
+        """Rows of prompt_performance_stats, filtered by use case and/or prompt"""
+
+    # --- Documents and versions ---
+
+    @abstractmethod
+    def get_document_by_id(self, document_id):
+        """Document row (payload references resolved, see _attach_payloads) or None"""
+
+    @abstractmethod
+    def get_document_by_filename(self, filename):
+        """Most recent document row with this file name (payload references resolved) or None"""
+
+    @abstractmethod
+    def insert_document_version(self, document_id, extraction_output, parent_version=None, parent_output=None,
+                                prompt_id=None, feedback=None, created_by=None):
+        """Store a version, delta-encoded against parent_output when possible; returns {VersionID, VersionNumber}"""
+
+    @abstractmethod
+    def get_document_lineage(self, document_id, up_to_version=None):
+        """Version rows needed to rebuild up_to_version (default the latest), oldest first"""
+
+    def get_document_version(self, document_id, version_number=None):
+        """
+        Rebuild the full extraction output of one version from its lineage
+
+        Args:
+            document_id (int): Root DocumentID
+            version_number (int, optional): Version to rebuild. Defaults to the latest
+
+        Returns:
+            str: Extraction output, or None if the version does not exist
+        """
+        return rebuild_version(self.get_document_lineage(document_id, version_number), version_number)
+
+    # --- Connections ---
+
+    def reset_connection(self):
+        """Drop the calling thread's cached connection, for backends that keep one"""
+
+    def close_connections(self):
+        """Close connections the backend keeps open"""
+
+    # --- Diagnostics ---
+
+    @abstractmethod
+    def test_connection(self):
+        """True when the backend is reachable"""
+
+    def get_connection_info(self):
+        return type(self).__name__
+
+
+def get_storage_backend(backend=None, payload_store=None, reuse_connections=False):
+    """
+    Build the configured storage backend
+
+    Args:
+        backend (str, optional): "sqlserver" or "sqlite". Defaults to STORAGE_BACKEND
+        payload_store (PayloadStore, optional): Defaults to the PAYLOAD_STORE_DIR store
+        reuse_connections (bool): Keep one SQL Server connection open per thread
+            (SQLite connections are cheap file opens and are not reused)
+
+    Returns:
+        StorageBackend
+    """
+    backend = (backend or STORAGE_BACKEND).lower()
+    if backend == "sqlite":
+        from sqlite_storage import SqliteDatabaseManager
+        return SqliteDatabaseManager(payload_store=payload_store)
+    if backend != "sqlserver":
+        logging.warning(f"Unknown STORAGE_BACKEND '{backend}', using SQL Server")
+    from database import DatabaseManager
+    return DatabaseManager(payload_store=payload_store, reuse_connections=reuse_connections)
@@ -0,0 +1,157 @@
+import re
+import json
+
+_FENCE = re.compile(r"```(?:json|JSON)?\s*(.*?)```", re.DOTALL)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+# Text in straight or curly quotes, e.g. Take the value of 'Employer ID'
+QUOTED_TEXT = re.compile(r"[\"'“”‘’]([^\"'“”‘’]{1,100})[\"'“”‘’]")
+
+
+def build_json_schema(columns, instructions=None):
+    """
+    JSON Schema for one extraction: every Excel column is a required string
+    (or null when the value is not in the document), described by its row-2
+    instruction, with no extra keys.
+
+    Args:
+        columns (list): Excel column names from read_excel_schema
+        instructions (list, optional): Row-2 instructions aligned with columns
+
+    Returns:
+        dict: JSON Schema
+    """
+    instructions = list(instructions or [])
+    properties = {}
+    for index, column in enumerate(columns):
+        if not column:
+            continue
+        prop = {"type": ["string", "null"]}
+        instruction = instructions[index] if index < len(instructions) else None
+        if instruction is not None and str(instruction).strip():
+            prop["description"] = str(instruction).strip()
+        properties[str(column)] = prop
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False,
+    }
+
+
+def build_response_format(columns, instructions=None):
+    """OpenAI/LiteLLM `response_format` requesting a strict JSON Schema response"""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "document_extraction",
+            "schema": build_json_schema(columns, instructions),
+            "strict": True,
+        },
+    }
+
+
+def _first_json_object(text):
+    """Slice from the first '{' to its matching '}', ignoring braces inside strings"""
+    start = text.find("{")
+    if start < 0:
+        return None
+    depth = 0
+    in_string = False
+    escaped = False
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:index + 1]
+    # Missing closing braces only; a value cut off mid-string is not repaired
+    if depth <= 0 or in_string:
+        return None
+    return text[start:].rstrip() + "}" * depth
+
+
+def parse_json_output(text):
+    """
+    Parse model output as a JSON object, tolerating code fences, commentary
+    before/after the object, and trailing commas.
+
+    Args:
+        text (str or dict): Model output
+
+    Returns:
+        tuple: (data, repaired) where repaired is True if plain json.loads failed
+
+    Raises:
+        ValueError: If no JSON object can be recovered
+    """
+    if isinstance(text, dict):
+        return text, False
+    if text is None:
+        raise ValueError("No output to parse")
+    text = str(text)
+
+    try:
+        data = json.loads(text)
+        if isinstance(data, dict):
+            return data, False
+    except json.JSONDecodeError:
+        pass
+
+    candidates = [m.group(1) for m in _FENCE.finditer(text)] + [text]
+    for candidate in candidates:
+        obj = _first_json_object(candidate)
+        if obj is None:
+            continue
+        for attempt in (obj, _TRAILING_COMMA.sub(r"\1", obj)):
+            try:
+                data = json.loads(attempt)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(data, dict):
+                return data, True
+
+    raise ValueError("Output does not contain a valid JSON object")
+
+
+def loads_extraction(text):
+    """Parse an extraction output into a dict (tolerant); raises ValueError if impossible"""
+    data, _ = parse_json_output(text)
+    return data
+
+
+def parse_extraction(extraction):
+    """
+    Extraction output as a dict, parsed tolerantly (see parse_json_output)
+
+    Returns:
+        dict | None: The extraction ({} when there is none), or None if it cannot be parsed
+    """
+    if isinstance(extraction, dict):
+        return extraction
+    if extraction in (None, ""):
+        return {}
+    try:
+        return loads_extraction(extraction)
+    except (ValueError, TypeError):
+        return None
+
+
+def normalize_value(value):
+    """Lowercase and collapse whitespace so extracted values compare on their text (None -> "")"""
+    return " ".join(str(value if value is not None else "").lower().split())
+
+
+def quoted_phrases(text):
+    """Phrases given in straight or curly quotes"""
+    return QUOTED_TEXT.findall(text or "")
@@ -0,0 +1,56 @@
+import asyncio
+import json
+
+from cascade import run_cascade, validate_fields
+from deadline import Deadline, deadline_scope, with_deadline
+
+PAGES = [{"page_number": 1, "content": "Invoice Date: March 3, 2024\nTotal Amount: $1,234.50\nVendor: Acme Corp"}]
+COLUMNS = ["Invoice Date", "Total Amount", "Vendor"]
+INSTRUCTIONS = ["", "", "Company name as printed next to the total"]
+TIERS = [("small", 0.0), ("large", 0.0)]
+
+
+def test_validate_fields_infers_types_from_column_names_only():
+    extraction = {"Invoice Date": "soon", "Total Amount": "N/A", "Vendor": "Acme Corp"}
+    assert validate_fields(extraction, COLUMNS, PAGES) == {"Invoice Date": "type", "Total Amount": "empty"}
+
+
+def test_failing_fields_are_escalated_to_the_next_tier():
+    calls = []
+
+    async def extractor(prompt, columns, instructions, use_case=None, deployment=None, usage=None):
+        calls.append((deployment, list(columns)))
+        if deployment == "small":
+            return json.dumps({"Invoice Date": "soon", "Total Amount": "1234.50", "Vendor": "Acme Corp"})
+        return json.dumps({"Invoice Date": "2024-03-03"})
+
+    output = asyncio.run(run_cascade("T", COLUMNS, INSTRUCTIONS, PAGES, extractor, tiers=TIERS))
+    assert json.loads(output) == {"Invoice Date": "2024-03-03", "Total Amount": "1234.50", "Vendor": "Acme Corp"}
+    assert calls == [("small", COLUMNS), ("large", ["Invoice Date"])]
+
+
+def test_slow_later_tier_keeps_earlier_values_under_a_deadline():
+    first = json.dumps({"Invoice Date": "soon", "Total Amount": "1234.50", "Vendor": "Acme Corp"})
+
+    async def extractor(prompt, columns, instructions, use_case=None, deployment=None, usage=None):
+        if deployment == "large":
+            await asyncio.sleep(5)
+        return first
+
+    async def extractor_with_stage_deadline(*args, **kwargs):
+        # call_extraction_agent applies the "extraction" stage deadline to every call
+        return await with_deadline(extractor(*args, **kwargs), "extraction")
+
+    with deadline_scope(Deadline(0.5)):
+        output = asyncio.run(run_cascade("T", COLUMNS, INSTRUCTIONS, PAGES, extractor_with_stage_deadline, tiers=TIERS))
+    assert output == first
+
+
+def test_unparseable_first_tier_is_replaced_by_the_next_tier():
+    async def extractor(prompt, columns, instructions, use_case=None, deployment=None, usage=None):
+        if deployment == "small":
+            return "Sorry, I could not produce JSON"
+        return json.dumps({"Invoice Date": "2024-03-03", "Total Amount": "1234.50", "Vendor": "Acme Corp"})
+
+    output = asyncio.run(run_cascade("T", COLUMNS, INSTRUCTIONS, PAGES, extractor, tiers=TIERS))
+    assert json.loads(output) == {"Invoice Date": "2024-03-03", "Total Amount": "1234.50", "Vendor": "Acme Corp"}
@@ -0,0 +1,29 @@
+import json
+
+from delta_extraction import merge_delta, relevant_pages
+
+
+def test_merge_delta_parses_fenced_original():
+    merged = merge_delta('```json\n{"a": "1", "b": "2"}\n```', '{"b": "3"}', ["b"])
+    assert json.loads(merged) == {"a": "1", "b": "3"}
+
+
+def test_merge_delta_keeps_unparseable_original_unchanged():
+    assert merge_delta("Sorry, I could not read the form", '{"b": "3"}', ["b"]) == "Sorry, I could not read the form"
+
+
+def test_merge_delta_keeps_original_values_when_delta_is_unusable():
+    assert merge_delta('{"a": "1", "b": "2"}', "no json here", ["b"]) == '{"a": "1", "b": "2"}'
+
+
+def test_relevant_pages_match_whole_words():
+    pages = [
+        {"page_number": 1, "content": "This return is being filed late."},
+        {"page_number": 2, "content": "EIN: 12-3456789"},
+    ]
+    assert [page["page_number"] for page in relevant_pages(pages, ["EIN"], {})] == [2]
+
+
+def test_relevant_pages_fall_back_to_every_page():
+    pages = [{"page_number": 1, "content": "Cover letter"}, {"page_number": 2, "content": "Schedule B"}]
+    assert relevant_pages(pages, ["EIN"], {}) == pages
@@ -0,0 +1,47 @@
+import pytest
+
+import document_intelligence
+from deadline import Deadline, DeadlineExceeded, deadline_scope
+
+
+class _Poller:
+    def __init__(self, finishes):
+        self.finishes = finishes
+        self.waited = []
+
+    def wait(self, timeout=None):
+        self.waited.append(timeout)
+
+    def done(self):
+        return self.finishes
+
+    def result(self, timeout=None):
+        if not self.finishes:
+            raise AssertionError("a partial result was read")
+        return "result"
+
+
+class _Client:
+    def __init__(self, poller):
+        self.poller = poller
+
+    def begin_analyze_document(self, *args, **kwargs):
+        return self.poller
+
+
+def test_ocr_past_its_deadline_raises_without_reading_a_result(monkeypatch):
+    poller = _Poller(finishes=False)
+    monkeypatch.setattr(document_intelligence, "get_document_analysis_client", lambda: _Client(poller))
+
+    with deadline_scope(Deadline(10)), pytest.raises(DeadlineExceeded) as excinfo:
+        document_intelligence.analyze_document(b"%PDF")
+    assert excinfo.value.stage == "ocr"
+    assert 0 < poller.waited[0] <= 5
+
+
+def test_ocr_without_a_deadline_waits_for_the_result(monkeypatch):
+    poller = _Poller(finishes=True)
+    monkeypatch.setattr(document_intelligence, "get_document_analysis_client", lambda: _Client(poller))
+
+    assert document_intelligence.analyze_document(b"%PDF") == "result"
+    assert poller.waited == [None]
@@ -0,0 +1,50 @@
+import os
+import json
+import asyncio
+
+import pytest
+
+# The agents are built at import time and need a deployment name; no model is called in these tests
+os.environ.setdefault("OPENAI_DEPLOYMENT", "test-deployment")
+
+litellm = pytest.importorskip("litellm")
+extraction_agent = pytest.importorskip("extraction_agent")
+
+COLUMNS = ["Vendor"]
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(extraction_agent, "_structured_unsupported", set())
+
+
+def fake_runner(error, calls):
+    async def run_agent(agent, prompt, use_case, usage):
+        structured = agent is not extraction_agent.get_extraction_agent()
+        calls.append(structured)
+        if structured:
+            raise error
+        return json.dumps({"Vendor": "Acme"})
+    return run_agent
+
+
+def test_rejected_response_format_falls_back_once_per_deployment(monkeypatch):
+    calls = []
+    error = litellm.UnsupportedParamsError(message="response_format is not supported", llm_provider="azure")
+    monkeypatch.setattr(extraction_agent, "_run_agent", fake_runner(error, calls))
+
+    for _ in range(2):
+        output = asyncio.run(extraction_agent.call_extraction_agent("prompt", COLUMNS, [None], hedge=False))
+        assert json.loads(output) == {"Vendor": "Acme"}
+    # The second call goes straight to free text
+    assert calls == [True, False, False]
+
+
+def test_other_errors_are_not_retried_as_free_text(monkeypatch):
+    calls = []
+    monkeypatch.setattr(extraction_agent, "_run_agent", fake_runner(ConnectionError("reset"), calls))
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(extraction_agent.call_extraction_agent("prompt", COLUMNS, [None], hedge=False))
+    assert calls == [True]
+    assert not extraction_agent._structured_unsupported
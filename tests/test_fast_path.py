@@ -0,0 +1,31 @@
+import json
+from types import SimpleNamespace
+
+from fast_path import TEXT_LINE_CONFIDENCE, match_columns, merge_fast_path, text_line_candidates
+
+COLUMNS = ["EIN", "Name", "Total"]
+MATCHES = {"EIN": {"value": "12-3456789"}}
+
+
+def test_merge_parses_fenced_llm_output():
+    merged = merge_fast_path('```json\n{"Name": "Acme", "Total": "10"}\n```', MATCHES, COLUMNS)
+    assert json.loads(merged) == {"EIN": "12-3456789", "Name": "Acme", "Total": "10"}
+
+
+def test_fast_path_values_survive_unparseable_llm_output():
+    assert json.loads(merge_fast_path("I could not find these fields.", MATCHES, COLUMNS)) == {"EIN": "12-3456789"}
+
+
+def test_skipped_llm_returns_fast_path_values_in_schema_order():
+    matches = {"Total": {"value": "10"}, "EIN": {"value": "12-3456789"}}
+    assert merge_fast_path(None, matches, COLUMNS) == '{"EIN": "12-3456789", "Total": "10"}'
+
+
+def test_text_layer_lines_feed_the_fast_path():
+    pages = [{"page_number": 2, "content": "INVOICE\nInvoice Number: INV-20431\nNotes: paid by card, thanks\n"}]
+    result = SimpleNamespace(key_value_pairs=None, tables=None, text_candidates=text_line_candidates(pages))
+
+    matches = match_columns(result, ["Invoice Number", "Vendor"])
+    assert matches == {"Invoice Number": {
+        "value": "INV-20431", "confidence": TEXT_LINE_CONFIDENCE, "source": "text_layer", "page": 2
+    }}
@@ -0,0 +1,46 @@
+import numpy as np
+
+from feedback_index import FeedbackIndex
+
+
+def test_entries_persist_and_reload(tmp_path):
+    index = FeedbackIndex(str(tmp_path), dim=64)
+    for number in range(20):
+        index.add(f"Feedback number {number}", use_case="Invoices", prompt_id=number)
+    index.add("Total is missing the currency symbol", "Keep the currency symbol in Total",
+              use_case="Invoices", prompt_id=99)
+
+    reloaded = FeedbackIndex(str(tmp_path), dim=64)
+    assert len(reloaded) == 21
+    assert reloaded.has_prompt(99) and reloaded.has_prompt("3")
+    assert np.array_equal(reloaded._vectors[:21], index._vectors[:21])
+    _, entry = reloaded.search("currency symbol dropped from the total", k=1, min_score=0)[0]
+    assert entry["diff"] == "Keep the currency symbol in Total"
+
+
+def test_reload_re_embeds_after_an_interrupted_append(tmp_path):
+    index = FeedbackIndex(str(tmp_path), dim=64)
+    index.add("Vendor name is truncated", prompt_id=1)
+    index.add("Dates must use ISO format", prompt_id=2)
+    # The metadata line of the second add was written, its vector row only partly
+    vectors = tmp_path / "vectors.f32"
+    vectors.write_bytes(vectors.read_bytes()[:-8])
+
+    reloaded = FeedbackIndex(str(tmp_path), dim=64)
+    assert len(reloaded) == 2
+    assert reloaded.find_addressed("Dates must use ISO format")[1]["prompt_id"] == "2"
+    assert vectors.stat().st_size == 2 * 64 * 4
+
+
+def test_sync_indexes_only_new_prompt_versions(tmp_path):
+    index = FeedbackIndex(str(tmp_path), dim=64)
+    versions = [
+        {"PromptID": 2, "UseCase": "Invoices", "CreatedTime": "2024-01-02", "PromptText": "Return JSON.\nKeep currency.",
+         "FeedbackRequested": "Currency is missing"},
+        {"PromptID": 1, "UseCase": "Invoices", "CreatedTime": "2024-01-01", "PromptText": "Return JSON.",
+         "FeedbackRequested": None},
+    ]
+    assert index.sync_from_prompt_versions(versions) == 1
+    assert index.entries[0]["diff"] == "Keep currency."
+
+    assert FeedbackIndex(str(tmp_path), dim=64).sync_from_prompt_versions(versions) == 0
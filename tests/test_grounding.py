@@ -0,0 +1,49 @@
+import pytest
+
+from grounding import normalize_text, ungrounded_columns, verify_grounding
+
+
+@pytest.mark.parametrize("text", ["2024-03-05", "03/05/2024", "March 5, 2024", "5th Mar 2024", "Mar. 5 2024", "3.5.24"])
+def test_dates_normalize_to_one_form(text):
+    assert normalize_text(text) == "20240305"
+
+
+def test_day_first_numeric_dates_are_recognized():
+    assert normalize_text("25/12/2023") == "20231225"
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("$1,234.50", "1234.5"),
+    ("1234.50", "1234.5"),
+    ("€ 1,234", "1234"),
+    ("007", "7"),
+    ("12.00%", "12"),
+])
+def test_numbers_normalize_to_one_form(text, expected):
+    assert normalize_text(text) == expected
+
+
+def test_values_are_grounded_across_formats():
+    pages = [
+        {"page_number": 1, "content": "Invoice from Acme Industrial Supply"},
+        {"page_number": 2, "content": "Issued March 5, 2024. Amount due: $1,234.50"},
+    ]
+    extraction = ('{"Vendor": "Acme Industrial Supply", "Date": "2024-03-05", "Total": "1234.5", '
+                  '"PO Number": "N/A", "Tax ID": "98-7654321"}')
+
+    report = verify_grounding(extraction, pages)
+    assert {column: (entry["status"], entry["page"]) for column, entry in report.items()} == {
+        "Vendor": ("grounded", 1),
+        "Date": ("grounded", 2),
+        "Total": ("grounded", 2),
+        "PO Number": ("empty", None),
+        "Tax ID": ("ungrounded", None),
+    }
+    assert ungrounded_columns(report) == ["Tax ID"]
+
+
+def test_short_values_need_a_whole_token():
+    pages = [{"page_number": 1, "content": "Quantity 120 units"}]
+    report = verify_grounding({"Quantity": "12", "Unit": "units"}, pages)
+    assert report["Quantity"]["status"] == "ungrounded"
+    assert report["Unit"]["status"] == "grounded"
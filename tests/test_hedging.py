@@ -0,0 +1,22 @@
+import asyncio
+
+from hedging import HedgePolicy, run_hedged
+
+
+def test_hedge_win_records_the_primary_as_a_lower_bound():
+    policy = HedgePolicy(percentile=0.5, max_rate=1.0, min_samples=1, window=10)
+    policy.record_latency(0.05)
+    attempts = []
+
+    async def call():
+        attempts.append(None)
+        # The primary hangs; the hedge answers at once
+        await asyncio.sleep(10 if len(attempts) == 1 else 0)
+        return len(attempts)
+
+    _, winner = asyncio.run(run_hedged(call, policy))
+    assert winner == 1
+    latencies = sorted(policy._latencies)
+    assert len(latencies) == 3
+    # Hedge latency, the seed sample, then the primary censored at the moment the hedge won
+    assert latencies[-1] >= 0.05
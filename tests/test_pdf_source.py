@@ -0,0 +1,29 @@
+import tracemalloc
+
+import pdf_source
+from pdf_source import track_peak_memory
+
+
+def test_nested_block_keeps_the_outer_peak(monkeypatch):
+    monkeypatch.setattr(pdf_source, "INGEST_TRACE_MEMORY", True)
+    with track_peak_memory("outer") as outer:
+        block = bytearray(4 * 1024 * 1024)
+        del block
+        # Entering another block must not reset the peak the outer block already reached
+        with track_peak_memory("inner") as inner:
+            pass
+    assert outer["peak_bytes"] >= 4 * 1024 * 1024
+    assert inner["peak_bytes"] < 4 * 1024 * 1024
+    assert not tracemalloc.is_tracing()
+
+
+def test_tracing_started_elsewhere_is_left_on(monkeypatch):
+    monkeypatch.setattr(pdf_source, "INGEST_TRACE_MEMORY", True)
+    tracemalloc.start()
+    try:
+        with track_peak_memory("ingest") as stats:
+            pass
+        assert stats["peak_bytes"] is not None
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
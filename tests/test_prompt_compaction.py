@@ -0,0 +1,47 @@
+import pytest
+
+from prompt_compaction import PromptBudgetExceeded, compact_prompt, enforce_prompt_budget
+
+
+def test_exact_duplicate_rules_are_removed():
+    prompt = (
+        "Return only JSON.\n"
+        "- Extract the vendor name exactly as printed.\n"
+        "- Extract the vendor name exactly as printed.\n"
+    )
+    assert compact_prompt(prompt) == "Return only JSON.\n- Extract the vendor name exactly as printed."
+
+
+def test_normalized_duplicates_are_removed():
+    prompt = (
+        "1. Extract the vendor name exactly as printed.\n"
+        "* extract the Vendor name, exactly as printed\n"
+        "Return only JSON. Return only JSON!"
+    )
+    assert compact_prompt(prompt) == "1. Extract the vendor name exactly as printed.\nReturn only JSON."
+
+
+def test_rules_for_different_columns_are_kept():
+    prompt = (
+        "- Format the Invoice Date column as YYYY-MM-DD using the date printed next to the label.\n"
+        "- Format the Due Date column as YYYY-MM-DD using the date printed next to the label."
+    )
+    assert compact_prompt(prompt) == prompt
+
+
+def test_rules_with_different_numbers_are_kept():
+    prompt = "- Round the Total Amount to 2 decimal places.\n- Round the Tax Amount to 2 decimal places.\n" \
+             "- Round the Tax Rate to 4 decimal places."
+    assert compact_prompt(prompt) == prompt
+
+
+def test_negated_rule_is_kept():
+    prompt = "- Include the currency symbol in the Total column.\n- Do not include the currency symbol in the Total column."
+    assert compact_prompt(prompt) == prompt
+
+
+def test_budget_applies_after_compaction():
+    rule = "- Extract the vendor name exactly as printed.\n"
+    assert enforce_prompt_budget(rule * 10, max_chars=60) == rule.strip()
+    with pytest.raises(PromptBudgetExceeded):
+        enforce_prompt_budget(rule + "- Extract the invoice number exactly as printed.", max_chars=60)
@@ -0,0 +1,167 @@
+import os
+import json
+import tempfile
+
+import pytest
+
+# The agents are built at import time and need a deployment name; no model is called in these tests
+os.environ.setdefault("OPENAI_DEPLOYMENT", "test-deployment")
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+# Also skipped when pyodbc is installed without the ODBC driver manager (libodbc)
+service = pytest.importorskip("service", exc_type=ImportError)
+
+from fastapi.testclient import TestClient
+
+from sqlite_storage import SqliteDatabaseManager
+
+SCHEMA = json.dumps({"Vendor": "Company name", "Total": "Amount due"})
+PAGES = [{"page_number": 1, "content": "Vendor: Acme Corp\nTotal: 1,234.50"}]
+
+
+def fake_ocr(pdf_path):
+    return PAGES, None
+
+
+async def fake_extractor(prompt, columns, instructions, use_case=None, **kwargs):
+    values = {"Vendor": "acme corp", "Total": "1234.50"}
+    return json.dumps({column: values[column] for column in columns})
+
+
+improved_use_cases = []
+
+
+async def fake_improver(original_extraction, feedback, previous_prompt, use_case=None):
+    improved_use_cases.append(use_case)
+    return json.dumps({"Prompt Title": "Vendor casing", "Prompt": "Return JSON.\n- Keep the vendor name's capitalization."})
+
+
+async def fixed_extractor(prompt, columns, instructions, use_case=None, **kwargs):
+    values = {"Vendor": "Acme Corp", "Total": "1234.50"}
+    return json.dumps({column: values[column] for column in columns})
+
+
+class UnavailableDatabase:
+    """Stand-in for a database that cannot be reached"""
+
+    def __getattr__(self, name):
+        def fail(*args, **kwargs):
+            raise ConnectionError("database is down")
+        return fail
+
+
+@pytest.fixture
+def database(tmp_path):
+    return SqliteDatabaseManager(database_path=str(tmp_path / "service.db"), payload_store=None)
+
+
+def make_client(db, extractor=fake_extractor):
+    app = service.create_app(db=db, ocr=fake_ocr, extractor=extractor, improver=fake_improver)
+    return TestClient(app)
+
+
+def submit(client, wait=5):
+    return client.post(
+        "/documents",
+        files={"pdf": ("invoice.pdf", b"%PDF-1.4 stand-in", "application/pdf")},
+        data={"schema_json": SCHEMA, "use_case": "Invoices", "wait": str(wait)},
+    )
+
+
+def test_submit_and_wait(database):
+    with make_client(database) as client:
+        response = submit(client)
+        assert response.status_code == 202
+        body = response.json()
+        assert body["status"] == "Completed"
+        assert body["extraction"] == {"Vendor": "acme corp", "Total": "1234.50"}
+
+        stored = database.get_document_by_id(body["document_id"])
+        assert stored["ExtractionStatus"] == "Completed"
+        assert json.loads(stored["ExtractionOutput"]) == body["extraction"]
+
+
+def test_extraction_runs_under_a_lease(database):
+    leases = []
+
+    async def extractor(prompt, columns, instructions, use_case=None, **kwargs):
+        row = database.get_document_by_id(1)
+        leases.append((row["ExtractionStatus"], row["WorkerID"], row["LeaseExpiry"]))
+        return await fake_extractor(prompt, columns, instructions, use_case)
+
+    with make_client(database, extractor) as client:
+        document_id = submit(client).json()["document_id"]
+
+    status, worker_id, lease_expiry = leases[0]
+    assert (status, bool(worker_id), bool(lease_expiry)) == ("Processing", True, True)
+    # Completing releases the claim
+    stored = database.get_document_by_id(document_id)
+    assert (stored["ExtractionStatus"], stored["WorkerID"], stored["LeaseExpiry"]) == ("Completed", None, None)
+
+
+def test_submit_then_poll(database):
+    with make_client(database) as client:
+        document_id = submit(client, wait=0).json()["document_id"]
+        body = client.get(f"/documents/{document_id}", params={"wait": 5}).json()
+        assert body["status"] == "Completed"
+
+        versions = client.get(f"/documents/{document_id}/versions").json()
+        assert [version["version"] for version in versions] == [1]
+
+
+def test_feedback_creates_a_version_and_saves_the_prompt(database, monkeypatch):
+    indexed = []
+    monkeypatch.setattr(service, "record_fix", lambda *args, **kwargs: indexed.append(kwargs))
+
+    async def extractor(prompt, columns, instructions, use_case=None, **kwargs):
+        # The improved prompt asks for the printed capitalization
+        if "capitalization" in prompt:
+            return await fixed_extractor(prompt, columns, instructions, use_case)
+        return await fake_extractor(prompt, columns, instructions, use_case)
+
+    with make_client(database, extractor) as client:
+        document_id = submit(client).json()["document_id"]
+        response = client.post(
+            f"/documents/{document_id}/feedback",
+            json={"feedback": "Vendor: Acme Corp", "save_prompt": True},
+        )
+        assert response.status_code == 200
+        body = response.json()
+        assert body["version"] == 2
+        assert body["affected_columns"] == ["Vendor"]
+        assert body["extraction"] == {"Vendor": "Acme Corp", "Total": "1234.50"}
+        assert body["prompt_saved"] is True
+
+        prompt = client.get("/prompts/Invoices").json()
+        assert prompt["PromptTitle"] == "Vendor casing"
+        # Indexed under the saved prompt, so a later sync from prompt versions skips it
+        assert indexed == [{"use_case": "Invoices", "prompt_id": prompt["PromptID"]}]
+        # Past fixes are drawn from this use case only
+        assert improved_use_cases[-1] == "Invoices"
+        version = client.get(f"/documents/{document_id}/versions/2").json()
+        assert version["extraction"] == body["extraction"]
+
+
+def test_unknown_document_is_404(database):
+    with make_client(database) as client:
+        assert client.get("/documents/999").status_code == 404
+        assert client.get("/documents/999/versions/1").status_code == 404
+
+
+def test_database_outage_is_503_not_404():
+    with make_client(UnavailableDatabase()) as client:
+        assert client.get("/documents/1").status_code == 503
+        assert client.get("/documents/1/versions").status_code == 503
+        assert client.get("/prompts/Invoices").status_code == 503
+
+
+def test_spooled_upload_is_removed_when_registration_fails(monkeypatch, tmp_path):
+    class FailingInsert:
+        def insert_document_request(self, **kwargs):
+            return None
+
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    with make_client(FailingInsert()) as client:
+        assert submit(client).status_code == 503
+    assert list(tmp_path.iterdir()) == []
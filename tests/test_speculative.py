@@ -0,0 +1,42 @@
+import os
+import json
+import asyncio
+
+import pytest
+
+# The agents are built at import time and need a deployment name; no model is called in these tests
+os.environ.setdefault("OPENAI_DEPLOYMENT", "test-deployment")
+
+speculative = pytest.importorskip("speculative")
+
+COLUMNS = ["Vendor"]
+ORIGINAL = json.dumps({"Vendor": "acme"})
+
+
+def run(monkeypatch, outputs):
+    async def generate_candidate_prompts(original_extraction, feedback, previous_prompt, n=3, use_case=None):
+        return [json.dumps({"Prompt Title": f"Candidate {index}", "Prompt": "Return JSON."}) for index in range(n)]
+
+    async def call_extraction_agent(prompt, columns, instructions, use_case=None):
+        output = outputs.pop(0)
+        if isinstance(output, Exception):
+            raise output
+        return output
+
+    monkeypatch.setattr(speculative, "generate_candidate_prompts", generate_candidate_prompts)
+    monkeypatch.setattr(speculative, "call_extraction_agent", call_extraction_agent)
+    return asyncio.run(speculative.run_speculative_improvement(
+        ORIGINAL, 'Vendor should be "Acme Corp"', "Return JSON.", lambda prompt: prompt,
+        COLUMNS, [None], n=len(outputs)
+    ))
+
+
+def test_best_candidate_answers_the_feedback(monkeypatch):
+    ranked = run(monkeypatch, [ConnectionError("reset"), json.dumps({"Vendor": "Acme Corp"}), "no JSON"])
+    assert json.loads(ranked[0]["extraction"]) == {"Vendor": "Acme Corp"}
+    assert [c["score"] for c in ranked[1:]] == [0.0, 0.0]
+
+
+def test_nothing_is_ranked_when_every_candidate_fails(monkeypatch):
+    with pytest.raises(speculative.NoUsableCandidate):
+        run(monkeypatch, [ConnectionError("reset"), "Sorry, I cannot help with that"])
@@ -0,0 +1,150 @@
+import json
+
+import pytest
+
+from payload_store import LocalPayloadStore
+from sqlite_storage import SqliteDatabaseManager
+from storage import PRIORITY_BULK, PRIORITY_INTERACTIVE
+
+
+@pytest.fixture
+def db(tmp_path):
+    return SqliteDatabaseManager(database_path=str(tmp_path / "storage.db"), payload_store=None)
+
+
+def test_one_active_prompt_per_use_case(db):
+    db.insert_prompt_and_set_active("First", "Return JSON.", "Invoices")
+    db.insert_prompt_and_set_active("Second", "Return JSON only.", "Invoices")
+    db.insert_prompt_and_set_active("Other", "Return JSON.", "Receipts")
+
+    assert db.get_active_prompt("Invoices")["PromptTitle"] == "Second"
+    versions = db.get_prompt_versions("Invoices")
+    assert [(v["PromptTitle"], v["IsActive"]) for v in versions] == [("Second", 1), ("First", 0)]
+
+
+def test_claim_by_priority_and_renew_the_lease(db):
+    bulk = db.insert_document_request("bulk.pdf", priority=PRIORITY_BULK)
+    interactive = db.insert_document_request("interactive.pdf", priority=PRIORITY_INTERACTIVE)
+
+    claimed = db.fetch_and_lock_next_document(worker_id="worker-1")
+    assert claimed["DocumentID"] == interactive
+    assert claimed["ExtractionStatus"] == "Processing"
+    assert db.renew_document_lease(interactive, "worker-1")
+    assert not db.renew_document_lease(interactive, "worker-2")
+    assert db.fetch_and_lock_next_document(worker_id="worker-2")["DocumentID"] == bulk
+    assert db.fetch_and_lock_next_document(worker_id="worker-3") is None
+
+
+def test_leaving_processing_releases_the_lease_and_updates_stats(db):
+    db.insert_prompt_and_set_active("Invoices v1", "Return JSON.", "Invoices")
+    prompt_id = db.get_active_prompt("Invoices")["PromptID"]
+    document_id = db.insert_document_request("invoice.pdf")
+    db.fetch_and_lock_next_document(worker_id="worker-1")
+
+    db.update_document_master_by_id(document_id, extraction_status="Completed",
+                                    extraction_output='{"Vendor": "Acme"}', prompt_id=prompt_id)
+    document = db.get_document_by_id(document_id)
+    assert document["ExtractionOutput"] == '{"Vendor": "Acme"}'
+    assert document["WorkerID"] is None
+    assert document["LeaseExpiry"] is None
+    assert not db.renew_document_lease(document_id, "worker-1")
+
+    stats = db.get_prompt_performance(prompt_id=prompt_id)
+    assert len(stats) == 1
+    assert stats[0]["UseCase"] == "Invoices"
+    assert stats[0]["DocumentsCompleted"] == 1
+
+
+def test_batch_update_applies_every_entry(db):
+    first = db.insert_document_request("a.pdf")
+    second = db.insert_document_request("b.pdf")
+    updated = db.batch_update_document_master([
+        {"document_id": first, "extraction_status": "Completed", "improved_count": 0},
+        {"document_id": second, "extraction_status": "Error", "error_message": "OCR failed", "improved_count": 0},
+    ])
+    assert updated == 2
+    assert db.get_document_by_filename("b.pdf")["ErrorMessage"] == "OCR failed"
+
+
+def test_expired_leases_are_requeued_then_dead_lettered(db):
+    document_id = db.insert_document_request("stuck.pdf")
+    db.fetch_and_lock_next_document(worker_id="worker-1", lease_seconds=-1)
+
+    reaped = db.reap_expired_leases(max_retries=1)
+    assert [(r["DocumentID"], r["ExtractionStatus"]) for r in reaped] == [(document_id, "Submitted")]
+
+    db.fetch_and_lock_next_document(worker_id="worker-2", lease_seconds=-1)
+    assert db.reap_expired_leases(max_retries=1)[0]["ExtractionStatus"] == "DeadLetter"
+    assert db.get_document_by_id(document_id)["WorkerID"] is None
+
+
+def test_versions_rebuild_from_the_lineage(db):
+    document_id = db.insert_document_request("invoice.pdf")
+    first_output = json.dumps({"Vendor": "acme", "Total": "10"})
+    second_output = json.dumps({"Vendor": "Acme", "Total": "10"})
+    first = db.insert_document_version(document_id, first_output)
+    parent = {"VersionID": first["VersionID"], "VersionNumber": first["VersionNumber"]}
+    db.insert_document_version(document_id, second_output, parent_version=parent, parent_output=first_output,
+                               feedback="Vendor: Acme")
+
+    lineage = db.get_document_lineage(document_id)
+    assert [v["VersionNumber"] for v in lineage] == [1, 2]
+    assert json.loads(db.get_document_version(document_id, 1)) == json.loads(first_output)
+    assert json.loads(db.get_document_version(document_id)) == json.loads(second_output)
+
+
+def test_offloaded_payloads_read_back_as_text(tmp_path):
+    store = LocalPayloadStore(str(tmp_path / "payloads"))
+    db = SqliteDatabaseManager(database_path=str(tmp_path / "storage.db"), payload_store=store)
+    document_id = db.insert_document_request("invoice.pdf")
+    db.update_document_master_by_id(document_id, extraction_status="Completed",
+                                    extraction_output='{"Vendor": "Acme"}', ocr_text="Vendor: Acme")
+
+    document = db.get_document_by_id(document_id)
+    assert document["ExtractionOutputRef"]
+    assert json.loads(document["ExtractionOutput"]) == {"Vendor": "Acme"}
+    assert document["OcrTextPayload"].value == "Vendor: Acme"
+
+
+def test_a_worker_that_lost_its_claim_cannot_overwrite_the_new_owner(db):
+    document_id = db.insert_document_request("contested.pdf")
+    db.fetch_and_lock_next_document(worker_id="worker-1", lease_seconds=-1)
+    db.reap_expired_leases()
+    db.fetch_and_lock_next_document(worker_id="worker-2")
+
+    assert not db.update_document_master_by_id(document_id, extraction_status="Completed",
+                                               extraction_output='{"Vendor": "stale"}', worker_id="worker-1")
+    assert db.update_document_master_by_id(document_id, extraction_status="Completed",
+                                           extraction_output='{"Vendor": "Acme"}', worker_id="worker-2")
+    document = db.get_document_by_id(document_id)
+    assert document["ExtractionOutput"] == '{"Vendor": "Acme"}'
+    # Finished: no worker holds the claim any more
+    assert not db.update_document_master_by_id(document_id, comments="late", worker_id="worker-2")
+
+
+def test_claim_a_specific_document(db):
+    first = db.insert_document_request("first.pdf", priority=PRIORITY_INTERACTIVE)
+    second = db.insert_document_request("second.pdf", priority=PRIORITY_BULK)
+
+    assert db.fetch_and_lock_next_document(worker_id="service", document_id=second)["DocumentID"] == second
+    assert db.fetch_and_lock_next_document(worker_id="service", document_id=second) is None
+    assert db.fetch_and_lock_next_document(worker_id="worker-1")["DocumentID"] == first
+
+
+def test_claims_leave_offloaded_payloads_unread(tmp_path):
+    store = LocalPayloadStore(str(tmp_path / "payloads"))
+    db = SqliteDatabaseManager(database_path=str(tmp_path / "storage.db"), payload_store=store)
+    db.payload_inline_limit = 5
+    document_id = db.insert_document_request("invoice.pdf")
+    db.update_document_master_by_id(document_id, extraction_output='{"Vendor": "Acme"}', comments="Re-queued by admin")
+
+    reads = []
+    get = store.get
+    store.get = lambda ref: reads.append(ref) or get(ref)
+    claimed = db.fetch_and_lock_next_document(worker_id="worker-1")
+    assert (claimed["ExtractionOutput"], claimed["Comments"]) == (None, None)
+    assert reads == []
+
+    db.resolve_payloads(claimed)
+    assert json.loads(claimed["ExtractionOutput"]) == {"Vendor": "Acme"}
+    assert claimed["Comments"] == "Re-queued by admin"
@@ -0,0 +1,14 @@
+from structured_output import normalize_value, parse_extraction, quoted_phrases
+
+
+def test_parse_extraction_is_tolerant_and_reports_failures():
+    assert parse_extraction('```json\n{"Vendor": "Acme",}\n```') == {"Vendor": "Acme"}
+    assert parse_extraction({"Vendor": "Acme"}) == {"Vendor": "Acme"}
+    assert parse_extraction(None) == {}
+    assert parse_extraction("no JSON here") is None
+
+
+def test_normalize_value_and_quoted_phrases():
+    assert normalize_value("  Acme\n CORP ") == "acme corp"
+    assert normalize_value(None) == ""
+    assert quoted_phrases("Take the value of 'Employer ID', not “EIN”") == ["Employer ID", "EIN"]
@@ -0,0 +1,53 @@
+import json
+
+import version_lineage
+from version_lineage import encode_version, rebuild_lineage, rebuild_version
+
+
+def _lineage(outputs):
+    """get_document_lineage rows for a chain of outputs, each version the child of the one before"""
+    rows = []
+    for number, output in enumerate(outputs, start=1):
+        parent = rows[-1] if rows else None
+        is_snapshot, data = encode_version(output, outputs[number - 2] if parent else None,
+                                           parent["VersionNumber"] if parent else None)
+        rows.append({"VersionID": 100 + number, "ParentVersionID": parent["VersionID"] if parent else None,
+                     "VersionNumber": number, "IsSnapshot": is_snapshot, "OutputData": data})
+    return rows
+
+
+def test_fenced_model_output_is_stored_as_a_delta():
+    parent = '```json\n{"Vendor": "acme", "Total": "10",}\n```'
+    is_snapshot, data = encode_version('Here you go: {"Vendor": "Acme", "Total": "10"}', parent, 1)
+    assert not is_snapshot
+    assert json.loads(data) == {"set": {"Vendor": "Acme"}, "removed": []}
+
+
+def test_output_without_json_is_stored_in_full():
+    assert encode_version("Sorry, no fields found", '{"Vendor": "Acme"}', 1) == (True, "Sorry, no fields found")
+
+
+def test_every_nth_version_is_a_snapshot(monkeypatch):
+    monkeypatch.setattr(version_lineage, "VERSION_SNAPSHOT_INTERVAL", 3)
+    outputs = [json.dumps({"Vendor": "Acme", "Total": str(total)}) for total in range(7)]
+    # Version 1 has no parent; versions 4 and 7 follow the 3rd and 6th
+    assert [row["IsSnapshot"] for row in _lineage(outputs)] == [True, False, False, True, False, False, True]
+
+
+def test_every_version_rebuilds_to_its_output(monkeypatch):
+    monkeypatch.setattr(version_lineage, "VERSION_SNAPSHOT_INTERVAL", 3)
+    outputs = [
+        json.dumps({"Vendor": "acme", "Total": "10"}),
+        json.dumps({"Vendor": "Acme", "Total": "10"}),
+        json.dumps({"Vendor": "Acme", "Total": "10", "Currency": "EUR"}),
+        json.dumps({"Vendor": "Acme", "Currency": "EUR"}),
+        json.dumps({"Vendor": "Acme Ltd", "Currency": "EUR", "Lines": [{"Item": "Bolts"}]}),
+    ]
+    lineage = _lineage(outputs)
+
+    rebuilt = rebuild_lineage(lineage)
+    assert [json.loads(rebuilt[number]) for number in range(1, 6)] == [json.loads(o) for o in outputs]
+    for number, output in enumerate(outputs, start=1):
+        assert json.loads(rebuild_version(lineage, number)) == json.loads(output)
+    assert json.loads(rebuild_version(lineage)) == json.loads(outputs[-1])
+    assert rebuild_version(lineage, 6) is None
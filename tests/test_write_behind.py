@@ -0,0 +1,82 @@
+import pytest
+
+from write_behind import WriteBehindBuffer
+
+
+class _Backend:
+    """Records batch writes; fails the next one when fail is set"""
+
+    def __init__(self):
+        self.batches = []
+        self.fail = False
+
+    def batch_update_document_master(self, entries):
+        if self.fail:
+            self.fail = False
+            raise ConnectionError("database unavailable")
+        self.batches.append(entries)
+        return len(entries)
+
+
+@pytest.fixture
+def backend():
+    return _Backend()
+
+
+@pytest.fixture
+def buffer(backend):
+    # The background flush never fires during a test; flushes are explicit
+    buffer = WriteBehindBuffer(backend, max_batch=100, flush_seconds=3600)
+    yield buffer
+    buffer.close()
+
+
+def test_updates_to_one_document_coalesce_into_one_row(buffer, backend):
+    buffer.update_document_master_by_id(1, extraction_status="Processing")
+    buffer.update_document_master_by_id(1, ocr_text="Vendor: Acme")
+    buffer.update_document_master_by_id(2, extraction_status="Processing")
+    assert len(buffer) == 2
+    assert backend.batches == []
+
+    assert buffer.flush() == 2
+    assert backend.batches == [[
+        {"document_id": 1, "extraction_status": "Processing", "ocr_text": "Vendor: Acme", "improved_count": 0},
+        {"document_id": 2, "extraction_status": "Processing", "improved_count": 0},
+    ]]
+
+
+def test_improved_rounds_add_up(buffer, backend):
+    buffer.update_document_master_by_id(1, extraction_status="Improved")
+    buffer.update_document_master_by_id(1, extraction_status="Improved")
+    buffer.update_document_master_by_id(1, extraction_status="Improved", comments="third round")
+    buffer.flush()
+
+    assert backend.batches[0][0]["improved_count"] == 3
+    assert backend.batches[0][0]["comments"] == "third round"
+
+
+def test_a_failed_flush_is_requeued_under_newer_updates(buffer, backend):
+    buffer.update_document_master_by_id(1, extraction_status="Improved", comments="first")
+    backend.fail = True
+    with pytest.raises(ConnectionError):
+        buffer.flush()
+    assert len(buffer) == 1
+
+    buffer.update_document_master_by_id(1, extraction_status="Improved", comments="second")
+    assert buffer.flush() == 1
+    assert backend.batches == [[
+        {"document_id": 1, "extraction_status": "Improved", "comments": "second", "improved_count": 2},
+    ]]
+
+
+def test_a_sync_status_writes_through_with_the_buffered_state(buffer, backend):
+    buffer.update_document_master_by_id(1, extraction_status="Processing", ocr_text="Vendor: Acme")
+    buffer.update_document_master_by_id(2, extraction_status="Processing")
+
+    assert buffer.update_document_master_by_id(1, extraction_status="Completed", extraction_output='{"Vendor": "Acme"}')
+    assert backend.batches == [[
+        {"document_id": 1, "extraction_status": "Completed", "ocr_text": "Vendor: Acme",
+         "extraction_output": '{"Vendor": "Acme"}', "improved_count": 0},
+    ]]
+    # Only the other document is still buffered
+    assert len(buffer) == 1
@@ -0,0 +1,91 @@
+import os
+import json
+from dotenv import load_dotenv
+
+from field_delta import parse_fields, diff_fields, apply_field_delta
+
+load_dotenv()
+
+# Every Nth version is stored in full, so rebuilding any version applies at most N-1 deltas
+VERSION_SNAPSHOT_INTERVAL = int(os.getenv("VERSION_SNAPSHOT_INTERVAL", "10"))
+
+
+def encode_version(output, parent_output=None, parent_version_number=None):
+    """
+    Storage form of a new version: a field-level delta against its parent,
+    or the full output for first versions, non-JSON outputs and every
+    VERSION_SNAPSHOT_INTERVAL-th version.
+
+    Args:
+        output (str): Extraction output of the new version
+        parent_output (str, optional): Extraction output of the parent version
+        parent_version_number (int, optional): VersionNumber of the parent
+
+    Returns:
+        tuple: (is_snapshot, output_data text)
+    """
+    text = output if isinstance(output, str) else json.dumps(output, ensure_ascii=False)
+    if parent_output is None or parent_version_number is None:
+        return True, text
+    if VERSION_SNAPSHOT_INTERVAL and parent_version_number % VERSION_SNAPSHOT_INTERVAL == 0:
+        return True, text
+
+    old_fields = parse_fields(parent_output)
+    new_fields = parse_fields(output)
+    if old_fields is None or new_fields is None:
+        return True, text
+    return False, json.dumps(diff_fields(old_fields, new_fields), ensure_ascii=False)
+
+
+def rebuild_lineage(lineage):
+    """
+    Materialize every version of a lineage in one pass
+
+    Args:
+        lineage (list): Rows from get_document_lineage (VersionID, ParentVersionID,
+                        IsSnapshot, OutputData, ...), in VersionNumber order
+
+    Returns:
+        dict: VersionNumber -> full extraction output (str)
+    """
+    outputs_by_id = {}
+    outputs = {}
+    for row in lineage:
+        data = str(row['OutputData']) if row['OutputData'] is not None else None
+        if row['IsSnapshot']:
+            output = data
+        else:
+            parent = parse_fields(outputs_by_id.get(row['ParentVersionID'])) or {}
+            output = json.dumps(apply_field_delta(parent, json.loads(data or "{}")), ensure_ascii=False)
+        outputs_by_id[row['VersionID']] = output
+        outputs[row['VersionNumber']] = output
+    return outputs
+
+
+def rebuild_version(lineage, version_number=None):
+    """
+    Full extraction output of one version, applying only the deltas between
+    it and its nearest snapshot ancestor
+
+    Args:
+        lineage (list): Rows from get_document_lineage
+        version_number (int, optional): Version to rebuild. Defaults to the latest
+
+    Returns:
+        str: Extraction output, or None if the version is not in the lineage
+    """
+    if not lineage:
+        return None
+    rows_by_id = {row['VersionID']: row for row in lineage}
+    if version_number is None:
+        target = lineage[-1]
+    else:
+        target = next((row for row in lineage if row['VersionNumber'] == version_number), None)
+        if target is None:
+            return None
+
+    # Walk up to the nearest snapshot, then replay the deltas downwards
+    chain = [target]
+    while not chain[-1]['IsSnapshot'] and chain[-1]['ParentVersionID'] in rows_by_id:
+        chain.append(rows_by_id[chain[-1]['ParentVersionID']])
+    return rebuild_lineage(chain[::-1])[target['VersionNumber']]
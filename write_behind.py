@@ -0,0 +1,185 @@
+import os
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+from metrics import metrics
+
+load_dotenv()
+
+# Buffer document status updates and write them in batches (off by default)
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "false").lower() == "true"
+# Pending documents that trigger an immediate flush
+WRITE_BEHIND_MAX_BATCH = int(os.getenv("WRITE_BEHIND_MAX_BATCH", "100"))
+# Longest time an update waits in the buffer
+WRITE_BEHIND_FLUSH_SECONDS = float(os.getenv("WRITE_BEHIND_FLUSH_SECONDS", "2"))
+# Statuses written through immediately (with anything still buffered for the document)
+WRITE_BEHIND_SYNC_STATUSES = [
+    status.strip() for status in os.getenv("WRITE_BEHIND_SYNC_STATUSES", "Completed,Error,DeadLetter,TimedOut").split(",")
+    if status.strip()
+]
+
+_UPDATE_FIELDS = (
+    'extraction_status', 'extraction_output', 'prompt_id', 'retry_count',
+    'error_message', 'comments', 'ocr_text', 'worker_id',
+)
+
+
+def _merge(older, newer):
+    """Later non-None values win; 'Improved' rounds add up"""
+    merged = dict(older)
+    for key, value in newer.items():
+        merged[key] = merged.get(key, 0) + value if key == 'improved_count' else value
+    return merged
+
+
+class WriteBehindBuffer:
+    """
+    Coalesces update_document_master_by_id calls per DocumentID and writes
+    them in batches.
+
+    A document typically gets several small updates (status, output, errors);
+    buffered, they collapse into one row and every flush writes all pending
+    documents with a single batch_update_document_master call (one
+    usp_BatchUpdateDocumentMaster round trip on SQL Server). A background
+    thread flushes every flush_seconds, or as soon as max_batch documents are
+    pending; close() and interpreter exit flush whatever is left.
+
+    Updates to a status in sync_statuses (terminal states by default), or
+    made with sync=True or a worker_id (whose caller needs to know whether it
+    still held the claim), are written before the call returns, together with
+    anything still buffered for that document. Buffered updates are not
+    visible to reads until flushed; call flush() first where that matters.
+
+    Every other attribute is the wrapped backend's, so the buffer can stand in
+    for it (for example under AsyncDatabaseManager).
+
+    Usage:
+        db = WriteBehindBuffer(get_storage_backend())
+        db.update_document_master_by_id(document_id, extraction_status='Processing')   # buffered
+        db.update_document_master_by_id(document_id, extraction_status='Completed',
+                                        extraction_output=output)                      # written now
+    """
+
+    def __init__(self, backend, max_batch=None, flush_seconds=None, sync_statuses=None):
+        self.backend = backend
+        self.max_batch = max_batch or WRITE_BEHIND_MAX_BATCH
+        self.flush_seconds = flush_seconds or WRITE_BEHIND_FLUSH_SECONDS
+        self.sync_statuses = set(WRITE_BEHIND_SYNC_STATUSES if sync_statuses is None else sync_statuses)
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+        # Held while writing, so a synchronous write never overtakes an in-flight batch for its document
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="write-behind-flush", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def __getattr__(self, name):
+        backend = self.__dict__.get("backend")
+        if backend is None:
+            raise AttributeError(name)
+        return getattr(backend, name)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+    def update_document_master_by_id(self, document_id, extraction_status=None, extraction_output=None,
+                                     prompt_id=None, retry_count=None, error_message=None, comments=None,
+                                     ocr_text=None, worker_id=None, sync=None):
+        """
+        Buffer (or, for sync statuses, write) a document update; same arguments as the backend's
+
+        Args:
+            sync (bool, optional): Write now. Defaults to True for statuses in sync_statuses
+                and for updates guarded by worker_id
+
+        Returns:
+            bool: True, or for a write-through, whether the row was updated
+        """
+        values = locals()
+        update = {field: values[field] for field in _UPDATE_FIELDS if values[field] is not None}
+        update['improved_count'] = int(extraction_status == 'Improved')
+        if sync is None:
+            sync = extraction_status in self.sync_statuses or worker_id is not None
+
+        if sync:
+            with self._flush_lock:
+                with self._lock:
+                    buffered = self._pending.pop(document_id, None)
+                entry = _merge(buffered, update) if buffered else update
+                metrics.increment("write_behind_sync_writes")
+                return self.backend.batch_update_document_master([{'document_id': document_id, **entry}]) > 0
+
+        with self._lock:
+            buffered = self._pending.get(document_id)
+            if buffered:
+                metrics.increment("write_behind_coalesced")
+            self._pending[document_id] = _merge(buffered, update) if buffered else update
+            full = len(self._pending) >= self.max_batch
+        if full:
+            self._wake.set()
+        return True
+
+    def flush(self):
+        """
+        Write every buffered update now; failed batches are put back for the next flush
+
+        Returns:
+            int: Documents written
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, OrderedDict()
+            if not batch:
+                return 0
+            try:
+                self.backend.batch_update_document_master(
+                    [{'document_id': document_id, **entry} for document_id, entry in batch.items()]
+                )
+            except Exception:
+                with self._lock:
+                    # Newer updates buffered meanwhile stay on top of the failed ones
+                    for document_id, entry in batch.items():
+                        newer = self._pending.get(document_id)
+                        self._pending[document_id] = _merge(entry, newer) if newer else entry
+                metrics.increment("write_behind_flush_errors")
+                raise
+            metrics.increment("write_behind_flushes")
+            metrics.observe("write_behind_batch_size", len(batch))
+            return len(batch)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Write-behind flush failed, retrying in {self.flush_seconds}s: {str(e)}")
+
+    def close(self):
+        """Stop the flusher and write what is left (safe to call more than once)"""
+        if not self._stop.is_set():
+            self._stop.set()
+            self._wake.set()
+            self._thread.join()
+            atexit.unregister(self.close)
+        try:
+            self.flush()
+        except Exception as e:
+            logging.error(f"Final write-behind flush failed, {len(self)} document updates lost: {str(e)}")
+
+    def close_connections(self):
+        """Flush, then close the backend's connections (shutdown hook of AsyncDatabaseManager)"""
+        self.close()
+        self.backend.close_connections()
+
+
+def with_write_behind(backend):
+    """Wrap a backend in a WriteBehindBuffer when WRITE_BEHIND_ENABLED is set"""
+    return WriteBehindBuffer(backend) if WRITE_BEHIND_ENABLED and backend is not None else backend